@@ -0,0 +1,78 @@
+"""
+Measures calling a coroutine decorated with the SDK's
+:code:`capture_async`, compared to :code:`Incendiary.capture_async`,
+within a sampled and an unsampled segment.
+
+Usage::
+
+    python benchmarks/capture_async.py [iterations]
+"""
+
+import sys
+import timeit
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core import xray_recorder
+
+from incendiary.xray import Incendiary
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.entities import UnsampledSegment
+
+
+async def function():
+    pass
+
+
+def run(coro):
+    # the decorated coroutines never suspend, so drive them without
+    # an event loop
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def main(iterations: int = 20000) -> None:
+    global_sdk_config.set_sdk_enabled(True)
+    xray_recorder.configure(
+        sampling=False, context=IncendiaryAsyncContext(), service="benchmark"
+    )
+    # like an initialized application, so nothing is logged
+    Incendiary.app = object()
+
+    decorated = (
+        ("SDK", xray_recorder.capture_async("function")(function)),
+        ("Incendiary", Incendiary.capture_async("function")(function)),
+    )
+
+    for sampled in (True, False):
+        if sampled:
+            segment = xray_recorder.begin_segment("benchmark")
+        else:
+            xray_recorder.context.put_segment(UnsampledSegment())
+
+        print("sampled" if sampled else "unsampled")
+        baseline = None
+        for name, func in decorated:
+
+            def call():
+                run(func())
+                if sampled:
+                    segment.subsegments.clear()
+
+            elapsed = min(timeit.repeat(call, number=iterations, repeat=5))
+            per_call = elapsed / iterations * 1e9
+            if baseline is None:
+                baseline = per_call
+            print(
+                f"  {name:<18}{per_call:>10.0f} ns/call"
+                f"{baseline / per_call:>8.2f}x"
+            )
+
+        xray_recorder.context.clear_trace_entities()
+
+    Incendiary.app = None
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
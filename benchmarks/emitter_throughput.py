@@ -0,0 +1,81 @@
+"""
+Measures how many segments reach the X-Ray daemon when the emitter
+sends them as fast as they are ended, using the fake daemon.
+
+Usage::
+
+    python benchmarks/emitter_throughput.py [segments] [subsegments]
+"""
+
+import asyncio
+import multiprocessing
+import sys
+import time
+
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.daemon import FakeDaemon
+from incendiary.xray.emitters import IncendiaryEmitter
+
+
+def finished_segment(subsegments: int) -> Segment:
+    segment = Segment("benchmark")
+    segment.put_http_meta("url", "http://localhost:8000/api/v1/bench")
+    segment.put_metadata("args", '{"a": ["1"]}', "request")
+    for i in range(subsegments):
+        subsegment = Subsegment(f"service-{i}", "remote", segment)
+        segment.add_subsegment(subsegment)
+        subsegment.put_annotation("response", '{"id": 1}')
+        subsegment.close()
+    segment.close()
+    return segment
+
+
+async def run(address: str, segments: int, subsegments: int) -> float:
+    emitter = IncendiaryEmitter(address, queue_size=segments)
+    await emitter.start(asyncio.get_running_loop())
+
+    started = time.perf_counter()
+    for _ in range(segments):
+        emitter.send_entity(finished_segment(subsegments))
+    await emitter.close()
+    return time.perf_counter() - started
+
+
+def serve(addresses: multiprocessing.Queue, stop, stats) -> None:
+    # in its own process, like the daemon, so it doesn't share the GIL
+    with FakeDaemon(keep=False) as daemon:
+        addresses.put(daemon.address)
+        stop.wait()
+        time.sleep(0.5)
+        stats.put(daemon.stats())
+
+
+def main(segments: int = 10000, subsegments: int = 5) -> None:
+    addresses, stats = multiprocessing.Queue(), multiprocessing.Queue()
+    stop = multiprocessing.Event()
+    process = multiprocessing.Process(
+        target=serve, args=(addresses, stop, stats)
+    )
+    process.start()
+    address = addresses.get()
+
+    loop = asyncio.new_event_loop()
+    elapsed = loop.run_until_complete(run(address, segments, subsegments))
+    loop.close()
+
+    stop.set()
+    stats = stats.get()
+    process.join()
+
+    lost = segments - stats["received"]
+    print(f"sent          {segments / elapsed:>10.0f} segments/s")
+    print(f"received      {stats['documents_per_second']:>10.0f} segments/s")
+    print(f"lost          {lost:>10d} ({lost / segments:.1%})")
+    print(f"malformed     {stats['malformed']:>10d}")
+    print(f"oversized     {stats['oversized']:>10d}")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:3]])
@@ -0,0 +1,72 @@
+"""
+Measures beginning the subsegment of an interservice request, like the
+hooks did through the SDK, compared to a service's subsegment template.
+
+Usage::
+
+    python benchmarks/interservice_subsegments.py [iterations]
+"""
+
+import sys
+import timeit
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core import AsyncAWSXRayRecorder
+from aws_xray_sdk.core.models import http
+from aws_xray_sdk.ext.util import inject_trace_header
+from httpx import Request
+
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.hooks import REMOTE_NAMESPACE, SubsegmentTemplate
+
+
+def sdk_begin_subsegment(request, recorder, name):
+    subsegment = recorder.begin_subsegment(name, REMOTE_NAMESPACE)
+    subsegment.put_http_meta(http.METHOD, request.method)
+    subsegment.put_http_meta(http.URL, str(request.url))
+    inject_trace_header(request.headers, subsegment)
+    return subsegment
+
+
+def main(iterations: int = 20000) -> None:
+    global_sdk_config.set_sdk_enabled(True)
+    recorder = AsyncAWSXRayRecorder()
+    recorder.configure(
+        sampling=False, context=IncendiaryAsyncContext(), service="benchmark"
+    )
+    segment = recorder.begin_segment("benchmark")
+    request = Request("GET", "http://userservice:8000/api/v1/users/1?a=1")
+    template = SubsegmentTemplate("userservice")
+
+    def call(begin):
+        def run():
+            begin()
+            recorder.context.end_subsegment()
+            segment.subsegments.clear()
+
+        return run
+
+    baseline = None
+    for name, func in (
+        (
+            "SDK",
+            call(
+                lambda: sdk_begin_subsegment(request, recorder, "userservice")
+            ),
+        ),
+        ("SubsegmentTemplate", call(lambda: template.begin(request, recorder))),
+    ):
+        elapsed = min(timeit.repeat(func, number=iterations, repeat=5))
+        per_call = elapsed / iterations * 1e9
+        if baseline is None:
+            baseline = per_call
+        print(
+            f"{name:<20}{per_call:>10.0f} ns/call"
+            f"{baseline / per_call:>8.2f}x"
+        )
+
+    recorder.context.clear_trace_entities()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,74 @@
+"""
+Measures serializing a finished segment to the document sent to the
+daemon, with the SDK's :code:`Entity.serialize` compared to Incendiary's
+serializer.
+
+Usage::
+
+    python benchmarks/serializers.py [iterations]
+"""
+
+import sys
+import timeit
+
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.serializers import serialize_entity
+
+
+def traced_segment(subsegments: int) -> Segment:
+    """
+    A segment with what the middlewares and hooks record for a request
+    that calls other services.
+    """
+    segment = Segment("benchmark")
+    segment.put_annotation("insanic_version", "0.9.2")
+    segment.put_annotation("user__level", 100)
+    segment.put_http_meta("url", "http://localhost:8000/api/v1/bench?a=1")
+    segment.put_http_meta("method", "GET")
+    segment.put_http_meta("user_agent", "python-httpx/0.15.4")
+    segment.put_http_meta("client_ip", "127.0.0.1")
+    segment.put_metadata("args", '{"a": ["1"]}', "request")
+    segment.put_metadata("path", '"/api/v1/bench"', "request")
+    segment.put_metadata("headers", '{"host": "localhost:8000"}', "request")
+    segment.set_user("1")
+
+    for i in range(subsegments):
+        subsegment = Subsegment(f"service-{i}", "remote", segment)
+        segment.add_subsegment(subsegment)
+        subsegment.put_http_meta("method", "GET")
+        subsegment.put_http_meta("url", f"http://service-{i}:8000/api/v1/")
+        subsegment.put_http_meta("status", 200)
+        subsegment.put_annotation("response", '{"id": 1, "name": "bench"}')
+        subsegment.close()
+
+    segment.put_http_meta("status", 200)
+    segment.put_http_meta("content_length", 20)
+    segment.close()
+    return segment
+
+
+def main(iterations: int = 20000) -> None:
+    for subsegments in (0, 5, 25):
+        segment = traced_segment(subsegments)
+        assert serialize_entity(segment) == segment.serialize()
+
+        baseline = None
+        for name, func in (
+            ("Entity.serialize", segment.serialize),
+            ("serialize_entity", lambda: serialize_entity(segment)),
+        ):
+            elapsed = min(timeit.repeat(func, number=iterations, repeat=5))
+            per_segment = elapsed / iterations * 1e9
+            if baseline is None:
+                baseline = per_segment
+            print(
+                f"{subsegments:>3} subsegments {name:<20}"
+                f"{per_segment:>10.0f} ns/segment"
+                f"{baseline / per_segment:>8.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,83 @@
+"""
+Measures creating and awaiting a task while a request is traced, with
+the entities stored on the task and copied by a task factory, compared
+to storing them in a context variable.
+
+Usage::
+
+    python benchmarks/task_creation.py [iterations]
+"""
+
+import asyncio
+import sys
+import time
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core import AsyncAWSXRayRecorder
+
+from incendiary.xray.contexts import (
+    IncendiaryAsyncContext,
+    IncendiaryTaskContext,
+)
+
+
+async def nothing():
+    pass
+
+
+async def traced(recorder):
+    recorder.begin_subsegment("child")
+    recorder.end_subsegment()
+
+
+async def measure(recorder, func, iterations: int) -> float:
+    loop = asyncio.get_running_loop()
+    recorder.begin_segment("benchmark", sampling=1)
+    recorder.begin_subsegment("handler")
+
+    best = float("inf")
+    for _ in range(5):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await loop.create_task(func())
+        best = min(best, time.perf_counter() - started)
+
+    recorder.end_subsegment()
+    recorder.end_segment()
+    return best / iterations * 1e9
+
+
+def main(iterations: int = 20000) -> None:
+    global_sdk_config.set_sdk_enabled(True)
+
+    cases = (
+        ("task factory", IncendiaryTaskContext),
+        ("context variable", IncendiaryAsyncContext),
+    )
+    for name, context_class in cases:
+        # the default asyncio loop, in case uvloop is the policy
+        loop = asyncio.SelectorEventLoop()
+        asyncio.set_event_loop(loop)
+
+        recorder = AsyncAWSXRayRecorder()
+        recorder.configure(
+            service="benchmark", context=context_class(loop=loop)
+        )
+        recorder.emitter.send_entity = lambda entity: None
+
+        untraced = loop.run_until_complete(
+            measure(recorder, nothing, iterations)
+        )
+        with_subsegment = loop.run_until_complete(
+            measure(recorder, lambda: traced(recorder), iterations)
+        )
+        loop.close()
+
+        print(
+            f"{name:<18}{untraced:>10.0f} ns/task"
+            f"{with_subsegment:>10.0f} ns/traced task"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,102 @@
+"""
+Measures the per request overhead of the tracing middlewares for
+requests that are not sampled, compared to tracing being disabled.
+
+Usage::
+
+    python benchmarks/unsampled_requests.py [iterations]
+"""
+
+import logging
+import sys
+import timeit
+
+from insanic.conf import settings
+
+settings.configure(SERVICE_NAME="benchmark", ENVIRONMENT="benchmark")
+
+from aws_xray_sdk import global_sdk_config  # noqa: E402
+from aws_xray_sdk.core import AsyncAWSXRayRecorder  # noqa: E402
+from aws_xray_sdk.core.context import Context  # noqa: E402
+from insanic import Insanic  # noqa: E402
+from insanic.request import Request  # noqa: E402
+from multidict import CIMultiDict  # noqa: E402
+from sanic.response import json  # noqa: E402
+
+from incendiary import Incendiary  # noqa: E402
+from incendiary.xray.middlewares import (  # noqa: E402
+    before_request,
+    after_request,
+)
+from incendiary.xray.sampling import IncendiaryDefaultSampler  # noqa: E402
+
+
+class Transport:
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+def run(coro):
+    # the middlewares never suspend, so drive them without an event loop
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+
+
+def setup_app() -> Insanic:
+    app = Insanic("benchmark", version="0.0.0")
+    Incendiary.load_config(app.config)
+    app.config.INCENDIARY_XRAY_SAMPLING_RULES = {
+        "version": 1,
+        "rules": [],
+        "default": {"fixed_target": 0, "rate": 0},
+    }
+
+    sampler = IncendiaryDefaultSampler(app)
+    # only local rules, don't start polling the daemon for centralized rules
+    sampler._started = True
+
+    recorder = AsyncAWSXRayRecorder()
+    recorder.configure(service="benchmark", context=Context(), sampler=sampler)
+    app.xray_recorder = recorder
+    return app
+
+
+def main(iterations: int = 100000) -> None:
+    logging.getLogger("aws_xray_sdk").setLevel(logging.ERROR)
+    global_sdk_config.set_sdk_enabled(True)
+    response = json({})
+    headers = CIMultiDict({"host": "localhost"})
+
+    app = setup_app()
+
+    def disabled():
+        Request(b"/bench", headers, "1.1", "GET", Transport(), app)
+
+    def traced():
+        r = Request(b"/bench", headers, "1.1", "GET", Transport(), app)
+        run(before_request(r))
+        run(after_request(r, response))
+
+    cases = (
+        ("disabled", disabled, True),
+        ("unsampled (fast path)", traced, True),
+        ("unsampled (segment)", traced, False),
+    )
+
+    baseline = None
+    for name, func, fast_path in cases:
+        app.config.INCENDIARY_XRAY_UNSAMPLED_FAST_PATH = fast_path
+        elapsed = min(timeit.repeat(func, number=iterations, repeat=5))
+        per_request = elapsed / iterations * 1e9
+        if baseline is None:
+            baseline = per_request
+        print(
+            f"{name:<24}{per_request:>10.0f} ns/request"
+            f"{per_request - baseline:>+10.0f} ns overhead"
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
@@ -0,0 +1,130 @@
+import asyncio
+import random
+from time import perf_counter
+from typing import Optional
+
+from sanic.config import Config
+
+from incendiary.loggers import logger
+
+#: How much the scale recovers every interval without pressure.
+SCALE_INCREASE = 0.05
+
+
+class LoadController:
+    """
+    Scales the sampling rate down when the service is under pressure,
+    and back up as the pressure drops.
+
+    Every :code:`interval` seconds, the lag of the event loop, and the
+    share of that time spent in Incendiary's own middlewares and
+    hooks, are measured. If either goes over its limit, the scale is
+    halved, down to :code:`min_scale`. Otherwise, it recovers by
+    :code:`SCALE_INCREASE` every interval.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float,
+        max_lag: float,
+        max_overhead: float,
+        min_scale: float,
+    ) -> None:
+        self.interval = interval
+        self.max_lag = max_lag
+        self.max_overhead = max_overhead
+        self.min_scale = min_scale
+
+        #: The factor the sampling rate is currently multiplied by.
+        self.scale = 1.0
+        #: The event loop lag measured in the last interval, in seconds.
+        self.lag = 0.0
+        #: The share of the last interval spent tracing.
+        self.overhead = 0.0
+
+        self._spent = 0.0
+        self._last = None
+        self._loop = None
+        self._handle = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> "LoadController":
+        return cls(
+            interval=config.INCENDIARY_XRAY_ADAPTIVE_INTERVAL,
+            max_lag=config.INCENDIARY_XRAY_ADAPTIVE_MAX_LOOP_LAG,
+            max_overhead=config.INCENDIARY_XRAY_ADAPTIVE_MAX_OVERHEAD,
+            min_scale=config.INCENDIARY_XRAY_ADAPTIVE_MIN_SCALE,
+        )
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        """
+        Starts measuring the lag of the event loop.
+        """
+        self.stop()
+        self._loop = loop or asyncio.get_event_loop()
+        self._last = self._loop.time()
+        self._spent = 0.0
+        self._handle = self._loop.call_at(
+            self._last + self.interval, self._tick
+        )
+
+    def stop(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    def record(self, seconds: float) -> None:
+        """
+        Records time spent tracing.
+        """
+        self._spent += seconds
+
+    def admit(self) -> bool:
+        """
+        Returns :code:`False` if a request should not be sampled
+        because of the current load.
+        """
+        return self.scale >= 1.0 or random.random() < self.scale
+
+    def _tick(self) -> None:
+        now = self._loop.time()
+        elapsed = now - self._last
+
+        self.lag = max(0.0, elapsed - self.interval)
+        self.overhead = self._spent / elapsed if elapsed > 0 else 0.0
+        self._spent = 0.0
+        self._last = now
+        self.adjust()
+
+        self._handle = self._loop.call_at(now + self.interval, self._tick)
+
+    def adjust(self) -> None:
+        """
+        Adjusts the scale from the last measured lag and overhead.
+        """
+        pressure = max(
+            self.lag / self.max_lag, self.overhead / self.max_overhead
+        )
+
+        if pressure > 1:
+            scale = max(self.min_scale, self.scale / 2)
+        else:
+            scale = min(1.0, self.scale + SCALE_INCREASE)
+
+        if scale != self.scale:
+            logger.info(
+                f"[XRAY] Sampling scaled to {scale:.2f} (loop lag "
+                f"{self.lag:.3f}s, tracing overhead {self.overhead:.1%})"
+            )
+            self.scale = scale
+
+
+def record_overhead(recorder, started: float) -> None:
+    """
+    Records the time since :code:`started` as tracing overhead, if the
+    recorder's sampler adapts to load.
+    """
+    controller = getattr(recorder.sampler, "load_controller", None)
+    if controller is not None:
+        controller.record(perf_counter() - started)
@@ -0,0 +1,115 @@
+import weakref
+from bisect import bisect_left
+from typing import Optional, Tuple
+
+from aws_xray_sdk.core.models import http
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.hooks import REMOTE_NAMESPACE
+from incendiary.xray.tail_sampling import TailSegment
+
+#: The metadata namespace of the statistics of a summary subsegment.
+SUMMARY_NAMESPACE = "summary"
+
+#: The upper bounds, in milliseconds, of the buckets of the latency
+#: histogram. The last bucket counts the slower calls.
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class CallSummary:
+    """
+    A subsegment that stands in for repeated interservice requests
+    with the same service, method and route, with the number of calls,
+    their summed, shortest and longest duration in seconds, a latency
+    histogram and the number of calls that failed.
+
+    The subsegment stays in progress until :code:`close`, so it is not
+    streamed before the last call is recorded.
+    """
+
+    def __init__(self, segment, service: str, method: str, route: str) -> None:
+        self.subsegment = Subsegment(service, REMOTE_NAMESPACE, segment)
+        self.subsegment.put_http_meta(http.METHOD, method)
+        self.subsegment.put_http_meta(http.URL, route)
+        segment.add_subsegment(self.subsegment)
+
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.errors = 0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.end_time = self.subsegment.start_time
+
+    def record(self, start_time: float, end_time: float, error: bool) -> None:
+        duration = end_time - start_time
+
+        self.count += 1
+        self.total += duration
+        self.min = duration if self.min is None else min(self.min, duration)
+        self.max = max(self.max, duration)
+        self.errors += error
+        self.histogram[bisect_left(LATENCY_BUCKETS, duration * 1000)] += 1
+        self.end_time = max(self.end_time, end_time)
+
+    def close(self) -> None:
+        subsegment = self.subsegment
+        for key in ("count", "total", "min", "max", "errors", "histogram"):
+            subsegment.put_metadata(key, getattr(self, key), SUMMARY_NAMESPACE)
+        subsegment.put_metadata("buckets", LATENCY_BUCKETS, SUMMARY_NAMESPACE)
+        if self.errors:
+            subsegment.add_error_flag()
+        subsegment.close(self.end_time)
+
+
+class CallAggregator:
+    """
+    Collapses repeated interservice requests of a segment. The first
+    :code:`threshold` requests with the same service, method and route
+    are recorded as subsegments of their own, and the requests after
+    them are only counted in a :code:`CallSummary`.
+
+    :param threshold: The requests recorded before they are collapsed.
+    """
+
+    def __init__(self, threshold: int) -> None:
+        self.threshold = threshold
+        self._calls = weakref.WeakKeyDictionary()
+
+    def summary(
+        self, segment, key: Tuple[str, str, str]
+    ) -> Optional[CallSummary]:
+        """
+        The summary to record a request in, or :code:`None` if the
+        request should be recorded in a subsegment of its own.
+
+        :param key: The service, method and route of the request.
+        """
+        calls = self._calls.get(segment)
+        if calls is None:
+            calls = self._calls[segment] = {}
+
+        seen = calls.get(key, 0)
+        if seen is None or isinstance(seen, CallSummary):
+            return seen
+        if seen < self.threshold:
+            calls[key] = seen + 1
+            return None
+
+        if isinstance(segment, TailSegment) and not segment.admit():
+            # the requests after this one are dropped like any span
+            calls[key] = None
+            return None
+
+        summary = calls[key] = CallSummary(segment, *key)
+        return summary
+
+    def close(self, segment) -> None:
+        """
+        Closes the summaries of the segment, before it ends.
+        """
+        calls = self._calls.pop(segment, None)
+        if calls:
+            for summary in calls.values():
+                if isinstance(summary, CallSummary):
+                    summary.close()
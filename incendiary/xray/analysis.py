@@ -0,0 +1,129 @@
+from bisect import bisect_right
+from typing import List, Optional
+
+from incendiary.xray.hooks import REMOTE_NAMESPACE
+
+#: The metadata namespace of the analysis of interservice requests.
+INTERSERVICE_NAMESPACE = "interservice"
+
+
+def interservice_subsegments(entity) -> List:
+    """
+    The closed subsegments of interservice requests under the entity,
+    also under captured subsegments. The attempts of a retried request
+    are not counted separately.
+    """
+    found = []
+    stack = list(entity.subsegments)
+    while stack:
+        subsegment = stack.pop()
+        if getattr(subsegment, "namespace", None) == REMOTE_NAMESPACE:
+            if not subsegment.in_progress:
+                found.append(subsegment)
+        else:
+            stack.extend(subsegment.subsegments)
+    return found
+
+
+def peak_concurrency(subsegments: List) -> int:
+    """
+    The most subsegments that were in progress at the same time.
+    """
+    events = sorted(
+        [(s.start_time, 1) for s in subsegments]
+        + [(s.end_time, -1) for s in subsegments]
+    )
+    peak = current = 0
+    # at the same time, ends sort before starts
+    for _, change in events:
+        current += change
+        peak = max(peak, current)
+    return peak
+
+
+def busy_time(subsegments: List) -> float:
+    """
+    The time at least one of the subsegments was in progress.
+    """
+    busy = 0.0
+    start = end = None
+    for subsegment in sorted(subsegments, key=lambda s: s.start_time):
+        if end is None or subsegment.start_time > end:
+            if end is not None:
+                busy += end - start
+            start, end = subsegment.start_time, subsegment.end_time
+        else:
+            end = max(end, subsegment.end_time)
+    if end is not None:
+        busy += end - start
+    return busy
+
+
+def critical_path(subsegments: List) -> List:
+    """
+    The chain of subsegments, each starting after the previous one
+    ended, that took the longest in total. That is the chain of calls
+    that the request had to wait for one after the other.
+    """
+    ordered = sorted(subsegments, key=lambda s: s.end_time)
+    ends = [s.end_time for s in ordered]
+
+    # the longest chain ending with each subsegment, and the longest
+    # chain ending with any of the first i + 1 subsegments
+    longest = []
+    previous = []
+    best = []
+    for i, subsegment in enumerate(ordered):
+        before = bisect_right(ends, subsegment.start_time, 0, i) - 1
+        chained = best[before] if before >= 0 else None
+        duration = subsegment.end_time - subsegment.start_time
+        longest.append(
+            duration + (longest[chained] if chained is not None else 0.0)
+        )
+        previous.append(chained)
+
+        if i and longest[best[i - 1]] >= longest[i]:
+            best.append(best[i - 1])
+        else:
+            best.append(i)
+
+    path = []
+    index = best[-1] if best else None
+    while index is not None:
+        path.append(ordered[index])
+        index = previous[index]
+    path.reverse()
+    return path
+
+
+def analyze_interservice(segment) -> Optional[dict]:
+    """
+    How the interservice requests of a segment overlapped, if it made
+    more than one:
+
+    -   :code:`calls`: the number of requests.
+    -   :code:`peak`: the most requests in flight at the same time.
+    -   :code:`busy`: the seconds at least one request was in flight.
+    -   :code:`parallelism`: the summed duration of the requests over
+        :code:`busy`. :code:`1` if they were all sent one after the
+        other.
+    -   :code:`critical_path`: the names of the chain of requests that
+        were waited for one after the other the longest, and
+        :code:`critical_time`, their summed duration.
+    """
+    subsegments = interservice_subsegments(segment)
+    if len(subsegments) < 2:
+        return None
+
+    busy = busy_time(subsegments)
+    total = sum(s.end_time - s.start_time for s in subsegments)
+    path = critical_path(subsegments)
+
+    return {
+        "calls": len(subsegments),
+        "peak": peak_concurrency(subsegments),
+        "busy": round(busy, 6),
+        "parallelism": round(total / busy, 2) if busy else 1.0,
+        "critical_path": [s.name for s in path],
+        "critical_time": round(sum(s.end_time - s.start_time for s in path), 6),
+    }
@@ -1,4 +1,6 @@
+import asyncio
 import socket
+from time import perf_counter
 from typing import List
 
 from insanic import Insanic
@@ -7,12 +9,22 @@ from sanic.config import Config
 
 from incendiary.loggers import logger, error_logger
 from incendiary.xray import config
+from incendiary.xray.adaptive import record_overhead
+from incendiary.xray.aggregation import CallAggregator
 from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.emitters import IncendiaryEmitter
+from incendiary.xray.executors import TracingThreadPoolExecutor
 from incendiary.xray.middlewares import before_request, after_request
 from incendiary.xray.mixins import CaptureMixin
+from incendiary.xray.reservoir import SharedReservoirs
 from incendiary.xray.sampling import IncendiaryDefaultSampler
 from incendiary.xray.services import IncendiaryService
-from incendiary.xray.utils import tracing_name
+from incendiary.xray.streaming import IncendiaryStreaming
+from incendiary.xray.utils import (
+    compile_endpoint_matcher,
+    request_route,
+    tracing_name,
+)
 
 from aws_xray_sdk.core import patch, AsyncAWSXRayRecorder, xray_recorder
 from aws_xray_sdk import global_sdk_config
@@ -80,10 +92,11 @@ class Incendiary(CaptureMixin):
         -   This loads all default Incendiary configs.
         -   Validates connection information to X-Ray Daemon.
         -   Configures X-Ray SDK Recorder
-        -   Attaches middlewares to start stop segments
+        -   Creates the sampling reservoirs shared by worker processes.
+        -   Attaches middlewares to start stop segments, except for
+            excluded endpoints.
         -   Replaces :code:`Service` object with :code:`IncendiaryService`
             to trace interservice communications.
-        -   Replaces asyncio task factory.
         -   Patches configured modules.
 
         :param app: Your Insanic application/
@@ -98,6 +111,7 @@ class Incendiary(CaptureMixin):
             global_sdk_config.set_sdk_enabled(True)
             app.xray_recorder = recorder or xray_recorder
 
+            cls.setup_reservoirs(app)
             cls.setup_middlewares(app)
             cls.setup_client(app)
             cls.setup_listeners(app)
@@ -114,21 +128,56 @@ class Incendiary(CaptureMixin):
         """
         -   Attaches before server start listener that configures
             the X-Ray Recorder.
-        -   Attaches a before server start listener that
-            replaces the default asyncio task factory that can
-            hold context.
+        -   Starts and stops measuring the load for adaptive sampling.
+        -   Opens and closes the emitter's connection to the daemon.
+        -   Releases the worker's slot of the shared reservoirs on stop.
+        -   Replaces the loop's default executor if
+            :code:`INCENDIARY_XRAY_TRACE_EXECUTOR` is set, so calls run
+            with :code:`run_in_executor` are traced.
         """
 
         async def before_server_start_start_tracing(app, loop=None, **kwargs):
             app.xray_recorder.configure(**cls.xray_config(app))
 
+            if app.config.INCENDIARY_XRAY_TRACE_EXECUTOR:
+                (loop or asyncio.get_event_loop()).set_default_executor(
+                    TracingThreadPoolExecutor(
+                        recorder=app.xray_recorder,
+                        thread_name_prefix="incendiary",
+                    )
+                )
+
+            controller = getattr(
+                app.xray_recorder.sampler, "load_controller", None
+            )
+            if controller is not None:
+                controller.start(loop)
+
+            if isinstance(app.xray_recorder.emitter, IncendiaryEmitter):
+                await app.xray_recorder.emitter.start(loop)
+
+        async def after_server_stop_stop_tracing(app, loop=None, **kwargs):
+            controller = getattr(
+                app.xray_recorder.sampler, "load_controller", None
+            )
+            if controller is not None:
+                controller.stop()
+
+            if isinstance(app.xray_recorder.emitter, IncendiaryEmitter):
+                await app.xray_recorder.emitter.close()
+
+            reservoirs = getattr(app, "xray_reservoirs", None)
+            if reservoirs is not None:
+                reservoirs.release()
+
         # need to configure xray as the first thing that happens so insert into 0
         if (
             before_server_start_start_tracing
             not in app.listeners["before_server_start"]
         ):
 
-            # need to attach context after insanic's set task factory has been set
+            # need to attach context after insanic's set task factory has been set,
+            # for the task factory of the context on python 3.6
             for i, l in enumerate(app.listeners["before_server_start"]):
                 if l.__name__ == "before_server_start_set_task_factory":
                     insert_index = i + 1
@@ -139,17 +188,50 @@ class Incendiary(CaptureMixin):
             app.listeners["before_server_start"].insert(
                 insert_index, before_server_start_start_tracing
             )
+            app.listeners["after_server_stop"].append(
+                after_server_stop_stop_tracing
+            )
 
     @classmethod
     def setup_client(cls, app: Insanic) -> None:
         """
         Replaces the :code:`Service` class on the service registry
-        with :code:`IncendiaryService`.
+        with :code:`IncendiaryService`, and creates the aggregator of
+        repeated interservice requests if there is a threshold.
         """
         from insanic.services.registry import LazyServiceRegistry
 
         LazyServiceRegistry.service_class = IncendiaryService
         LazyServiceRegistry.service_class.xray_recorder = app.xray_recorder
+        LazyServiceRegistry.service_class.error_response_budget = (
+            app.config.INCENDIARY_XRAY_ERROR_RESPONSE_BUDGET
+        )
+        LazyServiceRegistry.service_class.trace_connection_phases = (
+            app.config.INCENDIARY_XRAY_CONNECTION_PHASES
+        )
+
+        threshold = app.config.INCENDIARY_XRAY_AGGREGATION_THRESHOLD
+        app.xray_call_aggregator = (
+            CallAggregator(threshold) if threshold else None
+        )
+        LazyServiceRegistry.service_class.call_aggregator = (
+            app.xray_call_aggregator
+        )
+
+    @classmethod
+    def setup_reservoirs(cls, app: Insanic) -> None:
+        """
+        Creates the reservoirs of the local sampling rules that are
+        shared by all worker processes. This needs to happen before
+        Sanic forks the workers, so it can't be done when the
+        recorder is configured.
+        """
+        if app.config.INCENDIARY_XRAY_SHARED_RESERVOIR:
+            rules = app.config.INCENDIARY_XRAY_SAMPLING_RULES.get("rules", [])
+            app.xray_reservoirs = SharedReservoirs(
+                rules=len(rules) + 1,
+                slots=app.config.INCENDIARY_XRAY_SHARED_RESERVOIR_SLOTS,
+            )
 
     @classmethod
     def setup_middlewares(cls, app: Insanic) -> None:
@@ -160,21 +242,32 @@ class Incendiary(CaptureMixin):
         """
         logger.debug("[XRAY] Initializing xray middleware")
 
+        is_excluded = compile_endpoint_matcher(
+            tuple(app.config.INCENDIARY_XRAY_EXCLUDED_ENDPOINTS)
+            + tuple(f"*{ep}" for ep in MONITOR_ENDPOINTS)
+        )
+
         @app.middleware("request")
         async def start_trace(request):
-            for ep in MONITOR_ENDPOINTS:
-                if request.path.endswith(ep):
-                    break
-            else:
+            # the decision is kept on the request for the response middleware
+            request.ctx.incendiary_traced = not is_excluded(
+                request_route(request), request.path
+            )
+
+            if request.ctx.incendiary_traced:
+                started = perf_counter()
                 await before_request(request)
+                record_overhead(app.xray_recorder, started)
 
         @app.middleware("response")
         async def end_trace(request, response):
-            for ep in MONITOR_ENDPOINTS:
-                if request.path.endswith(ep):
-                    break
-            else:
+            # start_trace didn't run if sanic couldn't route the request
+            # (404, 405), since it routes before the request middlewares,
+            # or if an earlier request middleware responded or raised
+            if getattr(request.ctx, "incendiary_traced", False):
+                started = perf_counter()
                 await after_request(request, response)
+                record_overhead(app.xray_recorder, started)
 
             return response
 
@@ -187,12 +280,15 @@ class Incendiary(CaptureMixin):
         xray_config = dict(
             service=tracing_name(app.config.SERVICE_NAME),
             context=IncendiaryAsyncContext(),
+            emitter=IncendiaryEmitter.from_config(app.config),
             sampling=True,
             sampler=IncendiaryDefaultSampler(app),
             # sampling_rules=app.sampler.sampling_rules,
             daemon_address=f"{app.config.INCENDIARY_XRAY_DAEMON_HOST}:{app.config.INCENDIARY_XRAY_DAEMON_PORT}",
             context_missing=app.config.INCENDIARY_XRAY_CONTEXT_MISSING_STRATEGY,
-            streaming_threshold=10,
+            streaming=IncendiaryStreaming(
+                app.config.INCENDIARY_XRAY_STREAMING_BUDGET
+            ),
             plugins=("ECSPlugin",),
         )
 
@@ -9,12 +9,134 @@ INCENDIARY_XRAY_DAEMON_HOST: str = "127.0.0.1"
 #: The port of the running X-Ray Daemon
 INCENDIARY_XRAY_DAEMON_PORT: int = 2000
 
+#: The maximum number of segments queued to be sent to the daemon.
+#: Segments ended while the queue is full are dropped.
+INCENDIARY_XRAY_EMITTER_QUEUE_SIZE: int = 1000
+
+#: The maximum number of segments sent in one iteration of the event loop.
+INCENDIARY_XRAY_EMITTER_BATCH_SIZE: int = 100
+
+#: Seconds to wait after a segment is queued before sending the queue.
+INCENDIARY_XRAY_EMITTER_FLUSH_INTERVAL: float = 0.1
+
+#: Closed subsegments are streamed to the daemon once the estimated size
+#: in bytes of the segment's document is over this budget.
+INCENDIARY_XRAY_STREAMING_BUDGET: int = 48 * 1024
+
+#: A directory to spool segments to while the X-Ray daemon is
+#: unavailable. Empty to drop them like the SDK does.
+INCENDIARY_XRAY_SPOOL_DIRECTORY: str = ""
+
+#: The size in bytes of the spool file of each worker process.
+INCENDIARY_XRAY_SPOOL_SIZE: int = 16 * 1024 * 1024
+
+#: The maximum number of spooled segments sent per second once the
+#: daemon is available again.
+INCENDIARY_XRAY_SPOOL_REPLAY_RATE: int = 100
+
+#: Seconds to wait before trying the daemon again after it was unavailable.
+INCENDIARY_XRAY_SPOOL_RETRY_INTERVAL: float = 5.0
+
+#: Replace the event loop's default executor with one that carries the
+#: trace context into its threads and records the calls in subsegments.
+INCENDIARY_XRAY_TRACE_EXECUTOR: bool = False
+
+#: The most bytes of the body of an interservice error response to record
+#: in the subsegment's metadata. :code:`0` to not record them.
+INCENDIARY_XRAY_ERROR_RESPONSE_BUDGET: int = 1024
+
+#: Record how long interservice requests waited for a connection, took to
+#: connect, to the first byte of the response and to read the body.
+INCENDIARY_XRAY_CONNECTION_PHASES: bool = False
+
+#: When a request made more than one interservice request, record how they
+#: overlapped and which of them were waited for one after the other.
+INCENDIARY_XRAY_INTERSERVICE_ANALYSIS: bool = True
+
+#: The number of interservice requests with the same service, method and
+#: route a request records, before the requests after them are collapsed
+#: into one summary subsegment. :code:`0` to never collapse them.
+INCENDIARY_XRAY_AGGREGATION_THRESHOLD: int = 0
+
+#: Calls of functions captured with :code:`Incendiary.capture` or
+#: :code:`Incendiary.capture_async` faster than this many seconds are
+#: not recorded as subsegments, only counted in their parent.
+#: :code:`0` to record every call.
+INCENDIARY_XRAY_CAPTURE_MIN_DURATION: float = 0
+
 #: Behavior when context is missing in X-Ray. Values can be :code:`LOG_ERROR` or :code:`RUNTIME_ERROR`.
 INCENDIARY_XRAY_CONTEXT_MISSING_STRATEGY: str = "LOG_ERROR"  # or "RUNTIME_ERROR"
 
 #: Modules to auto patch on initialization.
 INCENDIARY_XRAY_PATCH_MODULES: Tuple[str] = ("aiobotocore",)
 
+#: Only record request attributes that have already been parsed by the
+#: handler, and only read the user if authentication has already run, so
+#: that tracing does not change how much work a request does.
+INCENDIARY_XRAY_LAZY_CAPTURE: bool = True
+
+#: Request attributes that are recorded as metadata on the segment.
+INCENDIARY_XRAY_REQUEST_ATTRIBUTES: Tuple[str] = (
+    "args",
+    "content_type",
+    "cookies",
+    "data",
+    "host",
+    "ip",
+    "method",
+    "path",
+    "scheme",
+    "url",
+)
+
+#: Requests that are not sampled skip creating a segment, and only carry
+#: the trace header to propagate to other services.
+INCENDIARY_XRAY_UNSAMPLED_FAST_PATH: bool = True
+
+#: Endpoints that are not traced, in addition to Insanic's monitor endpoints.
+#: Can be exact paths (:code:`/metrics/`), prefixes ending with :code:`*`
+#: (:code:`/static/*`) or globs (:code:`*.png`).
+INCENDIARY_XRAY_EXCLUDED_ENDPOINTS: Tuple[str] = ()
+
+#: Requests that are not sampled are buffered until they end, and are
+#: kept if they were slow, responded with an error or raised an exception.
+INCENDIARY_XRAY_TAIL_SAMPLING: bool = False
+
+#: Requests that take longer than this, in seconds, are kept by tail sampling.
+INCENDIARY_XRAY_TAIL_SAMPLING_LATENCY: float = 1.0
+
+#: Responses with a status code of at least this are kept by tail sampling.
+INCENDIARY_XRAY_TAIL_SAMPLING_MIN_STATUS: int = 500
+
+#: The maximum number of spans buffered for a request by tail sampling.
+INCENDIARY_XRAY_TAIL_SAMPLING_MAX_SPANS: int = 100
+
+#: The memory, in bytes, shared by all requests buffered by tail sampling.
+INCENDIARY_XRAY_TAIL_SAMPLING_MEMORY_BUDGET: int = 16 * 1024 * 1024
+
+#: Share the reservoirs of the local sampling rules between the worker
+#: processes, so the fixed target is per host instead of per worker.
+INCENDIARY_XRAY_SHARED_RESERVOIR: bool = True
+
+#: The maximum number of running worker processes that share the reservoirs.
+INCENDIARY_XRAY_SHARED_RESERVOIR_SLOTS: int = 64
+
+#: Scale the sampling rate down when the event loop lags, or when too much
+#: time is spent tracing, and back up when the load drops.
+INCENDIARY_XRAY_ADAPTIVE_SAMPLING: bool = False
+
+#: How often, in seconds, the load is measured for adaptive sampling.
+INCENDIARY_XRAY_ADAPTIVE_INTERVAL: float = 1.0
+
+#: The event loop lag, in seconds, over which sampling is scaled down.
+INCENDIARY_XRAY_ADAPTIVE_MAX_LOOP_LAG: float = 0.1
+
+#: The share of time spent tracing over which sampling is scaled down.
+INCENDIARY_XRAY_ADAPTIVE_MAX_OVERHEAD: float = 0.05
+
+#: The lowest the sampling rate can be scaled to.
+INCENDIARY_XRAY_ADAPTIVE_MIN_SCALE: float = 0.01
+
 #: The default sampling value for fixed target.
 INCENDIARY_XRAY_DEFAULT_SAMPLING_FIXED_TARGET: int = 60 * 10
 
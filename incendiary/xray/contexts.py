@@ -1,12 +1,54 @@
+from contextlib import contextmanager
+
+from aws_xray_sdk import global_sdk_config
 from aws_xray_sdk.core.async_context import AsyncContext as _AsyncContext
+from aws_xray_sdk.core.context import Context as _Context
+from aws_xray_sdk.core.models.dummy_entities import DummySegment
 
+from incendiary.loggers import logger
 from incendiary.xray.factories import (
     tracing_task_factory,
     wrap_tracing_task_factory,
 )
+from incendiary.xray.tail_sampling import TailSegment
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    # python 3.6
+    contextvars = None
+
+
+def admit_subsegment(context: _Context, subsegment) -> bool:
+    """
+    Checks if the subsegment fits in the tail sampling buffer of its
+    segment. If it doesn't, the subsegment is not sampled and not
+    attached to the segment, but can still be put on the context and
+    ended, and nothing under it is recorded.
+    """
+    segment = subsegment.parent_segment
 
+    if (
+        subsegment.sampled
+        and isinstance(segment, TailSegment)
+        and not segment.admit()
+    ):
+        subsegment.parent_id = context.get_trace_entity().id
+        subsegment.sampled = False
+        segment.ref_counter.increment()
+        return False
+    return True
+
+
+class IncendiaryTaskContext(_AsyncContext):
+    """
+    Stores the current entities on the current task, and replaces the
+    loop's task factory so created tasks get a copy of them.
+
+    If the loop already has a task factory, it is wrapped, so tasks
+    are still created by it.
+    """
 
-class IncendiaryAsyncContext(_AsyncContext):
     def __init__(self, *args, loop=None, use_task_factory=True, **kwargs):
 
         super().__init__(*args, loop=loop, use_task_factory=False, **kwargs)
@@ -19,3 +61,113 @@ class IncendiaryAsyncContext(_AsyncContext):
                 )
             else:
                 self._loop.set_task_factory(tracing_task_factory)
+
+    def put_subsegment(self, subsegment) -> None:
+        if not admit_subsegment(self, subsegment):
+            self._local.entities.append(subsegment)
+            return
+
+        super().put_subsegment(subsegment)
+
+
+if contextvars is not None:
+    _entities = contextvars.ContextVar("incendiary_xray_entities", default=())
+
+
+def current_trace_entity():
+    """
+    The current entity of :code:`IncendiaryAsyncContext`, or
+    :code:`None` if there is none. Unlike :code:`get_trace_entity`,
+    a missing context is not handled.
+    """
+    if contextvars is None:  # pragma: no cover
+        return None
+
+    entities = _entities.get()
+    return entities[-1] if entities else None
+
+
+@contextmanager
+def trace_entity_scope(entity):
+    """
+    Makes :code:`entity` the current entity of
+    :code:`IncendiaryAsyncContext` within the block, on top of the
+    current entities, so subsegments begun in it are its children.
+    """
+    token = _entities.set(_entities.get() + (entity,))
+    try:
+        yield entity
+    finally:
+        _entities.reset(token)
+
+
+class IncendiaryAsyncContext(_Context):
+    """
+    Stores the current entities in a context variable, as an
+    immutable stack.
+
+    asyncio copies the context of the current task to the tasks it
+    creates, which only copies a reference to the stack. Child tasks
+    start with the entities of their parent without a custom task
+    factory, and creating tasks costs nothing extra, whether they are
+    traced or not. Subsegments begun in a child task are pushed on its
+    own stack, so concurrent subsegments don't become each other's
+    parents.
+
+    :param loop: Not used, for compatibility with the SDK's
+        :code:`AsyncContext`.
+    :param use_task_factory: Not used, the task factory isn't needed.
+    """
+
+    def __init__(
+        self, context_missing="LOG_ERROR", loop=None, use_task_factory=False
+    ):
+        super().__init__(context_missing=context_missing)
+
+    def put_segment(self, segment) -> None:
+        _entities.set((segment,))
+
+    def set_trace_entity(self, trace_entity) -> None:
+        _entities.set((trace_entity,))
+
+    def put_subsegment(self, subsegment) -> None:
+        entity = self.get_trace_entity()
+        if not entity:
+            logger.warning(
+                f"[XRAY] Active segment or subsegment not found. "
+                f"Discarded {subsegment.name}."
+            )
+            return
+
+        if admit_subsegment(self, subsegment):
+            entity.add_subsegment(subsegment)
+        _entities.set(_entities.get() + (subsegment,))
+
+    def end_subsegment(self, end_time=None) -> bool:
+        entity = self.get_trace_entity()
+        if self._is_subsegment(entity):
+            entity.close(end_time)
+            _entities.set(_entities.get()[:-1])
+            return True
+        elif isinstance(entity, DummySegment):
+            return False
+        else:
+            logger.warning("[XRAY] No subsegment to end.")
+            return False
+
+    def get_trace_entity(self):
+        entities = _entities.get()
+        if not entities:
+            if not global_sdk_config.sdk_enabled():
+                return DummySegment()
+            return self.handle_context_missing()
+
+        return entities[-1]
+
+    def clear_trace_entities(self) -> None:
+        _entities.set(())
+
+
+if contextvars is None:  # pragma: no cover
+    # tasks don't copy context variables before python 3.7
+    IncendiaryAsyncContext = IncendiaryTaskContext  # noqa: F811
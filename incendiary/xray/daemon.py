@@ -0,0 +1,244 @@
+"""
+A stand-in for the X-Ray daemon that receives segments over UDP and
+counts them, for integration tests and load tests.
+
+As a pytest fixture::
+
+    @pytest.fixture()
+    def xray_daemon():
+        with FakeDaemon() as daemon:
+            yield daemon
+
+As a standalone process, printing what it received every few seconds::
+
+    python -m incendiary.xray.daemon --port 2000
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+from typing import List, Optional
+
+from aws_xray_sdk.core.emitters.udp_emitter import (
+    PROTOCOL_DELIMITER,
+    PROTOCOL_HEADER,
+)
+
+from incendiary.xray.serializers import MAX_DATAGRAM_SIZE
+
+#: The keys every segment and subsegment document has.
+REQUIRED_KEYS = frozenset(("name", "id", "trace_id"))
+
+
+class FakeDaemon:
+    """
+    Receives datagrams on :code:`host:port` in a background thread and
+    parses them like the X-Ray daemon does.
+
+    -   :code:`received`: documents with a valid header and document.
+    -   :code:`malformed`: datagrams without a valid header or document.
+    -   :code:`oversized`: datagrams larger than :code:`max_size`.
+
+    :param port: :code:`0` to listen on any free port.
+    :param max_size: The largest datagram expected. Defaults to the
+        largest datagram the emitter sends, which is also the largest
+        UDP payload, so lower it to check that documents are split
+        below a size.
+    :param keep: Keep the received documents in :code:`documents`.
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        *,
+        max_size: int = MAX_DATAGRAM_SIZE,
+        keep: bool = True,
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.keep = keep
+
+        self.documents: List[dict] = []
+        self.received = 0
+        self.segments = 0
+        self.subsegments = 0
+        self.malformed = 0
+        self.oversized = 0
+        self.bytes = 0
+        self.first_received_at: Optional[float] = None
+        self.last_received_at: Optional[float] = None
+
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._socket: Optional[socket.socket] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        """
+        The address to set :code:`INCENDIARY_XRAY_DAEMON_HOST` and
+        :code:`INCENDIARY_XRAY_DAEMON_PORT` to.
+        """
+        return f"{self.host}:{self.port}"
+
+    def start(self) -> "FakeDaemon":
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.bind((self.host, self.port))
+        # stop can interrupt receiving
+        self._socket.settimeout(0.1)
+        self.port = self._socket.getsockname()[1]
+
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._receive, name="fake-xray-daemon", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._socket.close()
+            self._thread = None
+            self._socket = None
+
+    def __enter__(self) -> "FakeDaemon":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _receive(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                # a datagram larger than the buffer is truncated to it,
+                # so one byte over the limit is enough to detect it
+                data = self._socket.recv(self.max_size + 1)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self.datagram_received(data)
+
+    def datagram_received(self, data: bytes) -> None:
+        document = None
+        if len(data) > self.max_size:
+            kind = "oversized"
+        else:
+            document = self.parse(data)
+            kind = "malformed" if document is None else "received"
+
+        with self._condition:
+            now = time.monotonic()
+            if self.first_received_at is None:
+                self.first_received_at = now
+            self.last_received_at = now
+            self.bytes += len(data)
+
+            if kind == "oversized":
+                self.oversized += 1
+            elif kind == "malformed":
+                self.malformed += 1
+            else:
+                self.received += 1
+                if document.get("type") == "subsegment":
+                    self.subsegments += 1
+                else:
+                    self.segments += 1
+                if self.keep:
+                    self.documents.append(document)
+
+            self._condition.notify_all()
+
+    @staticmethod
+    def parse(data: bytes) -> Optional[dict]:
+        """
+        The document in a datagram, or :code:`None` if the datagram
+        is not a header and a json document.
+        """
+        try:
+            header, document = data.decode("utf-8").split(PROTOCOL_DELIMITER, 1)
+            if json.loads(header) != json.loads(PROTOCOL_HEADER):
+                return None
+            document = json.loads(document)
+        except ValueError:
+            return None
+
+        if not isinstance(document, dict) or not REQUIRED_KEYS <= set(document):
+            return None
+        return document
+
+    def wait_for(self, count: int, timeout: float = 1.0) -> bool:
+        """
+        Waits until at least :code:`count` datagrams have been
+        received, of any kind. Returns :code:`False` on timeout.
+        """
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: self.received + self.malformed + self.oversized
+                >= count,
+                timeout,
+            )
+
+    def reset(self) -> None:
+        with self._condition:
+            self.documents = []
+            self.received = self.segments = self.subsegments = 0
+            self.malformed = self.oversized = self.bytes = 0
+            self.first_received_at = self.last_received_at = None
+
+    def stats(self) -> dict:
+        """
+        The counts, and the documents and bytes received per second
+        between the first and the last datagram.
+        """
+        with self._condition:
+            elapsed = 0.0
+            if self.first_received_at is not None:
+                elapsed = self.last_received_at - self.first_received_at
+
+            return {
+                "received": self.received,
+                "segments": self.segments,
+                "subsegments": self.subsegments,
+                "malformed": self.malformed,
+                "oversized": self.oversized,
+                "bytes": self.bytes,
+                "documents_per_second": (
+                    self.received / elapsed if elapsed else 0.0
+                ),
+                "bytes_per_second": self.bytes / elapsed if elapsed else 0.0,
+            }
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2000)
+    parser.add_argument(
+        "--interval",
+        type=float,
+        default=5.0,
+        help="Seconds between printing the counts.",
+    )
+    args = parser.parse_args(argv)
+
+    daemon = FakeDaemon(args.host, args.port, keep=False).start()
+    print(f"Listening on {daemon.address}", flush=True)
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(json.dumps(daemon.stats()), flush=True)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+
+
+if __name__ == "__main__":
+    main()
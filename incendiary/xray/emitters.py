@@ -0,0 +1,273 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+from aws_xray_sdk.core.emitters.udp_emitter import (
+    DEFAULT_DAEMON_ADDRESS,
+    PROTOCOL_DELIMITER,
+    PROTOCOL_HEADER,
+    UDPEmitter,
+)
+from sanic.config import Config
+
+from incendiary.loggers import logger, error_logger
+from incendiary.xray.serializers import serialize_split, to_document
+from incendiary.xray.spool import RingSpool
+
+#: Seconds between replaying batches of spooled entities.
+REPLAY_INTERVAL = 0.1
+
+
+class EmitterProtocol(asyncio.DatagramProtocol):
+    def __init__(self, emitter: "IncendiaryEmitter") -> None:
+        self.emitter = emitter
+
+    def error_received(self, exc: Exception) -> None:
+        # usually the daemon isn't listening. segments are best effort,
+        # so this is not worth more than a debug message.
+        logger.debug(f"[XRAY] Error sending to the X-Ray daemon: {exc}")
+        self.emitter.daemon_unavailable()
+
+
+class IncendiaryEmitter(UDPEmitter):
+    """
+    An emitter that queues finished entities and sends them to the
+    X-Ray daemon in batches from the event loop, so sending them is
+    not on the request's critical path.
+
+    At most :code:`queue_size` entities are queued. Entities emitted
+    while the queue is full are dropped. The queue is flushed
+    :code:`flush_interval` seconds after the first entity is queued,
+    :code:`batch_size` entities per loop iteration. Entities are
+    serialized when they are queued, so what is sent can't be changed
+    by a handler that keeps a reference to a segment after it ended.
+
+    If a :code:`spool` is given, entities are written to it instead of
+    being sent while the daemon refuses them. The daemon is tried again
+    :code:`retry_interval` seconds later, and once it accepts entities,
+    the spooled entities are replayed at :code:`replay_rate` entities
+    per second. Entities sent before the daemon's refusal was noticed
+    are lost, like with the SDK's emitter.
+
+    Until :code:`start` is called with a running loop, entities are
+    sent synchronously like the SDK's emitter.
+    """
+
+    def __init__(
+        self,
+        daemon_address: str = DEFAULT_DAEMON_ADDRESS,
+        *,
+        queue_size: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 0.1,
+        spool: Optional[RingSpool] = None,
+        replay_rate: int = 100,
+        retry_interval: float = 5.0,
+    ) -> None:
+        super().__init__(daemon_address)
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.retry_interval = retry_interval
+
+        #: The number of entities dropped because the queue was full.
+        self.dropped = 0
+        #: :code:`False` while entities are spooled because the daemon
+        #: refused them.
+        self.available = True
+
+        self._queue = deque()
+        self._dropped_since_flush = 0
+        self._loop = None
+        self._loop_thread = None
+        self._transport = None
+        self._flush_handle = None
+        self._replay_handle = None
+        self._unavailable_since = 0.0
+
+    @classmethod
+    def from_config(cls, config: Config) -> "IncendiaryEmitter":
+        return cls(
+            f"{config.INCENDIARY_XRAY_DAEMON_HOST}:"
+            f"{config.INCENDIARY_XRAY_DAEMON_PORT}",
+            queue_size=config.INCENDIARY_XRAY_EMITTER_QUEUE_SIZE,
+            batch_size=config.INCENDIARY_XRAY_EMITTER_BATCH_SIZE,
+            flush_interval=config.INCENDIARY_XRAY_EMITTER_FLUSH_INTERVAL,
+            spool=RingSpool.from_config(config),
+            replay_rate=config.INCENDIARY_XRAY_SPOOL_REPLAY_RATE,
+            retry_interval=config.INCENDIARY_XRAY_SPOOL_RETRY_INTERVAL,
+        )
+
+    async def start(
+        self, loop: Optional[asyncio.AbstractEventLoop] = None
+    ) -> None:
+        """
+        Opens the datagram transport to the daemon on the loop, and
+        starts replaying the spool.
+        """
+        self._loop = loop or asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        self._transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: EmitterProtocol(self), remote_addr=(self._ip, self._port)
+        )
+        if self.spool is not None:
+            self.spool.open()
+            self._replay_handle = self._loop.call_later(
+                REPLAY_INTERVAL, self.replay
+            )
+
+    async def close(self) -> None:
+        """
+        Sends what is left in the queue and closes the transport.
+        """
+        if self._transport is None:
+            return
+
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        if self._replay_handle is not None:
+            self._replay_handle.cancel()
+        while self._queue:
+            self._send_batch()
+
+        self._transport.close()
+        self._transport = None
+        self._flush_handle = None
+        self._replay_handle = None
+
+        if self.spool is not None:
+            # what is left is replayed by the next process to open it
+            self.spool.close()
+
+    def send_entity(self, entity) -> None:
+        """
+        Serializes the entity and queues its documents to be sent
+        to the daemon.
+        """
+        if self._transport is None:
+            super().send_entity(entity)
+            return
+
+        if len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            self._dropped_since_flush += 1
+            return
+
+        try:
+            documents = [
+                document.encode("utf-8")
+                for document in serialize_split(to_document(entity))
+            ]
+        except Exception:
+            error_logger.exception("[XRAY] Failed to serialize entity.")
+            return
+
+        self._queue.append(documents)
+
+        if self._flush_handle is None:
+            if threading.get_ident() == self._loop_thread:
+                self._schedule_flush()
+            else:
+                # entities can be ended in other threads
+                self._loop.call_soon_threadsafe(self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        if self._flush_handle is None and self._transport is not None:
+            self._flush_handle = self._loop.call_later(
+                self.flush_interval, self.flush
+            )
+
+    def flush(self) -> None:
+        """
+        Sends a batch of queued entities. If more are queued, the next
+        batch is sent in the next iteration of the loop.
+        """
+        self._flush_handle = None
+
+        if self._dropped_since_flush:
+            logger.warning(
+                f"[XRAY] Dropped {self._dropped_since_flush} entities "
+                f"because the emitter queue was full."
+            )
+            self._dropped_since_flush = 0
+
+        if self._transport is None:
+            return
+
+        self._send_batch()
+
+        if self._queue:
+            self._flush_handle = self._loop.call_soon(self.flush)
+
+    def daemon_unavailable(self) -> None:
+        """
+        Called when the daemon refused an entity. Entities are spooled
+        until the daemon is tried again.
+        """
+        if self.spool is None or self._loop is None:
+            return
+
+        self._unavailable_since = self._loop.time()
+        if self.available:
+            self.available = False
+            logger.warning(
+                f"[XRAY] The X-Ray daemon is unavailable. Spooling "
+                f"entities to {self.spool.path}."
+            )
+
+    def replay(self) -> None:
+        """
+        Tries the daemon again once :code:`retry_interval` has passed
+        since it refused an entity, and sends a batch of spooled
+        entities while it is available.
+        """
+        self._replay_handle = self._loop.call_later(
+            REPLAY_INTERVAL, self.replay
+        )
+
+        if not self.available:
+            if self._loop.time() - self._unavailable_since >= (
+                self.retry_interval
+            ):
+                # new entities find out if the daemon is back before
+                # spooled entities are replayed
+                self.available = True
+            return
+
+        if self.spool.evicted:
+            logger.warning(
+                f"[XRAY] Evicted {self.spool.evicted} entities because "
+                f"the spool was full."
+            )
+            self.spool.evicted = 0
+
+        prefix = f"{PROTOCOL_HEADER}{PROTOCOL_DELIMITER}".encode("utf-8")
+        for _ in range(max(int(self.replay_rate * REPLAY_INTERVAL), 1)):
+            document = self.spool.read()
+            if document is None:
+                break
+            self._transport.sendto(prefix + document)
+
+    def _spool_batch(self, batch: list) -> None:
+        for documents in batch:
+            for document in documents:
+                if not self.spool.write(document):
+                    self.dropped += 1
+
+    def _send_batch(self) -> None:
+        queue = self._queue
+        batch = [
+            queue.popleft() for _ in range(min(self.batch_size, len(queue)))
+        ]
+
+        if not self.available:
+            self._spool_batch(batch)
+            return
+
+        prefix = f"{PROTOCOL_HEADER}{PROTOCOL_DELIMITER}".encode("utf-8")
+        for documents in batch:
+            for document in documents:
+                self._transport.sendto(prefix + document)
@@ -0,0 +1,123 @@
+from typing import Optional
+
+from aws_xray_sdk.core.models.noop_traceid import NoOpTraceId
+from aws_xray_sdk.core.models.trace_header import TraceHeader
+
+NOOP_TRACE_ID = NoOpTraceId().to_id()
+NOOP_ENTITY_ID = "0000000000000000"
+
+
+class UnsampledSegment:
+    """
+    A stand in for a segment of a request that is not sampled.
+
+    Unlike the SDK's :code:`DummySegment`, this does not generate
+    ids, start times or reference counters. It only carries the
+    state needed to propagate the trace header to downstream
+    services. Anything recorded on it is discarded.
+    """
+
+    __slots__ = ("trace_id", "_origin_trace_header")
+
+    name = "unsampled"
+    id = NOOP_ENTITY_ID
+    parent_id = None
+    sampled = False
+    in_progress = True
+    subsegments = ()
+
+    def __init__(
+        self,
+        trace_id: Optional[str] = None,
+        trace_header: Optional[TraceHeader] = None,
+    ) -> None:
+        self.trace_id = trace_id or NOOP_TRACE_ID
+        self._origin_trace_header = trace_header
+
+    def save_origin_trace_header(self, trace_header: TraceHeader) -> None:
+        # the origin header is only set on init because
+        # the instance may be shared between requests.
+        pass
+
+    def get_origin_trace_header(self) -> Optional[TraceHeader]:
+        return self._origin_trace_header
+
+    def add_subsegment(self, subsegment) -> None:
+        # children of an unsampled segment are never sent,
+        # so no reference is kept.
+        subsegment.parent_id = self.id
+
+    def remove_subsegment(self, subsegment) -> None:
+        pass
+
+    def increment(self) -> None:
+        pass
+
+    def decrement_ref_counter(self) -> None:
+        pass
+
+    def decrement_subsegments_size(self) -> None:
+        pass
+
+    def get_total_subsegments_size(self) -> int:
+        return 0
+
+    def ready_to_send(self) -> bool:
+        return False
+
+    def close(self, end_time: Optional[float] = None) -> None:
+        pass
+
+    def put_http_meta(self, key, value) -> None:
+        pass
+
+    def put_annotation(self, key, value) -> None:
+        pass
+
+    def put_metadata(self, key, value, namespace="default") -> None:
+        pass
+
+    def set_user(self, user) -> None:
+        pass
+
+    def set_aws(self, aws_meta) -> None:
+        pass
+
+    def set_service(self, service_info) -> None:
+        pass
+
+    def set_rule_name(self, rule_name) -> None:
+        pass
+
+    def apply_status_code(self, status_code) -> None:
+        pass
+
+    def add_exception(self, exception, stack, remote=False) -> None:
+        pass
+
+    def add_fault_flag(self) -> None:
+        pass
+
+    def add_error_flag(self) -> None:
+        pass
+
+    def add_throttle_flag(self) -> None:
+        pass
+
+    def serialize(self) -> None:
+        pass
+
+
+#: Shared unsampled segment for requests without an upstream trace id.
+UNSAMPLED_SEGMENT = UnsampledSegment()
+
+
+def unsampled_segment(trace_header: TraceHeader) -> UnsampledSegment:
+    """
+    Returns an unsampled segment that propagates the upstream trace id.
+    If there is no upstream trace id, the shared instance is returned
+    so nothing is allocated for the request.
+    """
+    if trace_header.root is None:
+        return UNSAMPLED_SEGMENT
+    return UnsampledSegment(trace_header.root, trace_header)
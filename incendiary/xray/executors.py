@@ -0,0 +1,99 @@
+import functools
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable
+
+from aws_xray_sdk.core import xray_recorder
+from aws_xray_sdk.core.async_recorder import AsyncAWSXRayRecorder
+
+from incendiary.xray.contexts import current_trace_entity
+
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    # python 3.6
+    contextvars = None
+
+#: The metadata namespace of the executor timings.
+EXECUTOR_NAMESPACE = "executor"
+
+
+def callable_name(fn: Callable) -> str:
+    """
+    The name of the subsegment of a call. Partials, which are often
+    passed to :code:`run_in_executor`, are named after what they wrap.
+    """
+    while isinstance(fn, functools.partial):
+        fn = fn.func
+    return getattr(fn, "__name__", None) or type(fn).__name__
+
+
+def run_traced(
+    recorder: AsyncAWSXRayRecorder,
+    submitted: float,
+    fn: Callable,
+    args: tuple,
+    kwargs: dict,
+):
+    """
+    Runs :code:`fn` in a subsegment that starts when it was submitted,
+    and records how long it waited for a worker and how long it ran.
+    """
+    name = callable_name(fn)
+
+    with recorder.in_subsegment(name, namespace="local") as subsegment:
+        started = time.time()
+        subsegment.start_time = submitted
+        subsegment.put_metadata(
+            "queue_time", started - submitted, EXECUTOR_NAMESPACE
+        )
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            subsegment.put_metadata(
+                "run_time", time.time() - started, EXECUTOR_NAMESPACE
+            )
+
+
+class TracingThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    A thread pool that runs submitted callables in a copy of the
+    context they were submitted from, like :code:`asyncio.to_thread`
+    does, so captures in the worker threads find the current entity.
+
+    If the current entity is sampled, the call is recorded in a
+    subsegment, with the time it waited for a worker thread and the
+    time it ran in the :code:`executor` metadata. Otherwise only the
+    context is copied, which is cheap.
+
+    The entities are carried in the context variable of
+    :code:`IncendiaryAsyncContext`, so this needs python 3.7.
+
+    :param recorder: The recorder to record the subsegments with.
+    """
+
+    def __init__(
+        self, *args, recorder: AsyncAWSXRayRecorder = None, **kwargs
+    ) -> None:
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder or xray_recorder
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        if contextvars is None:  # pragma: no cover
+            return super().submit(fn, *args, **kwargs)
+
+        context = contextvars.copy_context()
+        entity = current_trace_entity()
+
+        if entity is None or not entity.sampled:
+            return super().submit(context.run, fn, *args, **kwargs)
+
+        return super().submit(
+            context.run,
+            run_traced,
+            self.recorder,
+            time.time(),
+            fn,
+            args,
+            kwargs,
+        )
@@ -10,36 +10,60 @@ else:
     current_task_method = asyncio.Task.current_task
 
 
+def inherited_context(loop):
+    """
+    A copy of the context of the current task for a task it creates,
+    or :code:`None` if the current task has no context.
+    """
+    current_task = current_task_method(loop=loop)
+
+    if current_task is not None and hasattr(current_task, "context"):
+        context = copy.copy(current_task.context)
+        if XRAY_CONTEXT_STORAGE in context:
+            context[XRAY_CONTEXT_STORAGE] = context[XRAY_CONTEXT_STORAGE].copy()
+        return context
+    return None
+
+
 def wrap_tracing_task_factory(task_factory):
+    """
+    Wraps a task factory, so the tasks it creates get a copy of the
+    context of the task that creates them.
+
+    Keyword arguments some loops pass, like uvloop's :code:`context`,
+    are passed on to the wrapped factory, unless they are
+    :code:`None`, so factories that don't accept them still work.
+    """
+
     # @wraps(task_factory)
-    def wrapped(loop, coro):
-        task = task_factory(loop, coro)
-        current_task = current_task_method(loop=loop)
-
-        if current_task is not None and hasattr(current_task, "context"):
-            context = copy.copy(current_task.context)
-            if XRAY_CONTEXT_STORAGE in context:
-                context[XRAY_CONTEXT_STORAGE] = context[
-                    XRAY_CONTEXT_STORAGE
-                ].copy()
+    def wrapped(loop, coro, **kwargs):
+        kwargs = {k: v for k, v in kwargs.items() if v is not None}
+        task = task_factory(loop, coro, **kwargs)
+        context = inherited_context(loop)
+
+        if context is not None:
             task.context = context
         return task
 
     return wrapped
 
 
-@wrap_tracing_task_factory
-def tracing_task_factory(loop, coro):
+def native_task_factory(loop, coro, **kwargs):
     """
-    Task factory function
-
-    Function closely mirrors the logic inside of
-    asyncio.BaseEventLoop.create_task. Then if there is a current
-    task and the current task has a context then share that context
-    with the new task
+    Creates a task like the loop's :code:`create_task` does when no
+    task factory is set, with the C implementation of tasks if there
+    is one.
     """
-    task = asyncio.tasks.Task(coro, loop=loop)
+    task = asyncio.Task(coro, loop=loop, **kwargs)
     if task._source_traceback:  # flake8: noqa
         del task._source_traceback[-1]  # flake8: noqa
 
     return task
+
+
+#: Task factory function
+#:
+#: Creates tasks like the loop does natively. Then if there is a current
+#: task and the current task has a context then share that context
+#: with the new task
+tracing_task_factory = wrap_tracing_task_factory(native_task_factory)
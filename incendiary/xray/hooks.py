@@ -1,7 +1,7 @@
-from json import JSONDecodeError
-
+import time
 import traceback
-from typing import Optional
+from functools import wraps
+from typing import Callable, Optional
 
 import ujson as json
 from aws_xray_sdk.core import AsyncAWSXRayRecorder
@@ -9,16 +9,23 @@ from aws_xray_sdk.core import AsyncAWSXRayRecorder
 from aws_xray_sdk.core.exceptions import exceptions
 from aws_xray_sdk.core.models import http
 from aws_xray_sdk.core.models.subsegment import Subsegment
-from aws_xray_sdk.ext.util import inject_trace_header, strip_url
-from httpx import Request, TransportError
+from aws_xray_sdk.core.models.entity import _common_invalid_name_characters
+from aws_xray_sdk.ext.util import strip_url
+from httpx import Request, Response, ResponseNotRead, TransportError
 
 from insanic import status
 
-
 # All aiohttp calls will entail outgoing HTTP requests, only in some ad-hoc
 # exceptions the namespace will be flip back to local.
+from incendiary.xray.tail_sampling import TailSegment
 from incendiary.xray.utils import get_safe_dict
 
+try:
+    import contextvars
+except ImportError:  # pragma: no cover
+    # python 3.6
+    contextvars = None
+
 REMOTE_NAMESPACE = "remote"
 LOCAL_NAMESPACE = "local"
 LOCAL_EXCEPTIONS = (
@@ -27,6 +34,106 @@ LOCAL_EXCEPTIONS = (
     TransportError,
 )
 
+#: The most bytes of an error response body that are recorded.
+ERROR_RESPONSE_BUDGET = 1024
+
+#: How many levels of nested objects of an error response body are
+#: cleansed. Deeper objects are substituted.
+ERROR_RESPONSE_DEPTH = 8
+
+#: The metadata namespace of the connection phases.
+CONNECTION_NAMESPACE = "connection"
+
+if contextvars is not None:
+    #: Where the connection pool records the phases of the current
+    #: request, if they are being collected.
+    connection_phases = contextvars.ContextVar(
+        "incendiary_connection_phases", default=None
+    )
+    #: The attempts of the interservice request being sent, while they
+    #: are being collected.
+    sent_attempts = contextvars.ContextVar(
+        "incendiary_sent_attempts", default=None
+    )
+else:  # pragma: no cover
+    connection_phases = None
+    sent_attempts = None
+
+
+def trace_header(subsegment: Subsegment) -> str:
+    """
+    The trace header to propagate for the subsegment of an interservice
+    request, formatted in one go instead of through the SDK's
+    :code:`TraceHeader`.
+    """
+    segment = subsegment.parent_segment
+    if isinstance(segment, TailSegment) and segment.pending:
+        return segment.deferred_trace_header(subsegment)
+
+    header = (
+        f"Root={subsegment.trace_id};Parent={subsegment.id};"
+        f"Sampled={1 if subsegment.sampled else 0}"
+    )
+    origin = segment.get_origin_trace_header()
+    if origin is not None and origin.data:
+        header += "".join(f";{k}={v}" for k, v in origin.data.items())
+    return header
+
+
+class SubsegmentTemplate:
+    """
+    What the subsegments of interservice requests to a service have
+    in common, prepared once per service, so beginning a subsegment
+    only fills in what changes with every request.
+
+    :param name: The name of the subsegments.
+    :param namespace: The namespace of the subsegments.
+    """
+
+    __slots__ = ("name", "namespace")
+
+    def __init__(self, name: str, namespace: str = REMOTE_NAMESPACE) -> None:
+        # the name the SDK would keep
+        self.name = "".join(
+            c for c in name if c not in _common_invalid_name_characters
+        )
+        self.namespace = namespace
+
+    def begin(
+        self,
+        request: Request,
+        recorder: AsyncAWSXRayRecorder,
+        url: Optional[str] = None,
+    ) -> Optional[Subsegment]:
+        """
+        Begins a subsegment before sending an interservice request.
+
+        :param url: :code:`str(request.url)`, if it is already known.
+        """
+        try:
+            subsegment = recorder.begin_subsegment(self.name, self.namespace)
+        except (
+            exceptions.SegmentNotFoundException,
+            exceptions.AlreadyEndedException,
+        ):
+            subsegment = None
+
+        # No-op if subsegment is `None` due to `LOG_ERROR`.
+        if not subsegment:
+            request.give_up = True
+            return subsegment
+
+        request.give_up = False
+        if subsegment.sampled:
+            subsegment.http = {
+                "request": {
+                    http.METHOD: request.method,
+                    http.URL: url or str(request.url),
+                }
+            }
+        request.headers[http.XRAY_HEADER] = trace_header(subsegment)
+        return subsegment
+
 
 def begin_subsegment(
     request: Request, recorder: AsyncAWSXRayRecorder, name: str = None
@@ -39,30 +146,59 @@ def begin_subsegment(
     :param recorder: The AWS X-Ray recorder for this application.
     :return: The started subsegment.
     """
-    name = name or strip_url(str(request.url))
+    url = str(request.url)
+    return SubsegmentTemplate(name or strip_url(url)).begin(
+        request, recorder, url
+    )
+
+
+def capture_response_body(response: Response, budget: int) -> Optional[dict]:
+    """
+    What is recorded of the body of an error response. At most
+    :code:`budget` bytes of the body are decoded. Json bodies are
+    only parsed if they fit in the budget, and then their keys are
+    cleansed, :code:`ERROR_RESPONSE_DEPTH` levels deep. Other bodies
+    are cut at the budget.
 
+    :return: The :code:`size` of the body, if it was :code:`truncated`,
+        and the :code:`body`, or :code:`None` if the body was streamed
+        and not read.
+    """
     try:
-        subsegment = recorder.begin_subsegment(name, REMOTE_NAMESPACE)
-    except (
-        exceptions.SegmentNotFoundException,
-        exceptions.AlreadyEndedException,
-    ):
-        subsegment = None
-
-    # No-op if subsegment is `None` due to `LOG_ERROR`.
-    if not subsegment:
-        request.give_up = True
-    else:
-        request.give_up = False
-        subsegment.put_http_meta(http.METHOD, request.method)
-        subsegment.put_http_meta(http.URL, str(request.url))
-        inject_trace_header(request.headers, subsegment)
+        content = response.content
+    except ResponseNotRead:
+        # reading it would take it from the caller
+        return None
 
-    return subsegment
+    captured = {"size": len(content)}
+    if len(content) > budget:
+        captured["truncated"] = True
+
+    if "json" in response.headers.get("content-type", ""):
+        # a json body that is cut can't be parsed, or cleansed
+        if len(content) <= budget:
+            try:
+                body = json.loads(content)
+            except ValueError:
+                body = content.decode("utf-8", errors="replace")
+            else:
+                if isinstance(body, dict):
+                    body = get_safe_dict(body, max_depth=ERROR_RESPONSE_DEPTH)
+            captured["body"] = body
+    elif content:
+        captured["body"] = content[:budget].decode(
+            response.charset_encoding or "utf-8", errors="replace"
+        )
+    return captured
 
 
 def end_subsegment(
-    *, request, response, recorder, subsegment: Optional[Subsegment] = None
+    *,
+    request,
+    response,
+    recorder,
+    subsegment: Optional[Subsegment] = None,
+    budget: int = ERROR_RESPONSE_BUDGET,
 ) -> Optional[Subsegment]:
     """
     The function that ends the subsegment after a response gets
@@ -72,6 +208,8 @@ def end_subsegment(
     :param response: Response object of the request.
     :param subsegment: Subsegment of this request.
     :param recorder: The aws xray recorder.
+    :param budget: The most bytes of an error response body to record
+        in the :code:`response` metadata. :code:`0` to not record it.
     """
 
     if getattr(request, "give_up", None):
@@ -81,21 +219,95 @@ def end_subsegment(
     if subsegment.sampled:
         subsegment.put_http_meta(http.STATUS, response.status_code)
 
-        if response.status_code >= status.HTTP_400_BAD_REQUEST:
-            try:
-                resp = response.json()
-            except JSONDecodeError:
-                resp = response.text
-            else:
-                resp = get_safe_dict(resp)
-                resp = json.dumps(resp)
-            subsegment.put_annotation("response", resp)
+        if response.status_code >= status.HTTP_400_BAD_REQUEST and budget:
+            captured = capture_response_body(response, budget)
+            if captured is not None:
+                for key, value in captured.items():
+                    subsegment.put_metadata(key, value, "response")
 
     # recorder.end_subsegment()
     subsegment.close()
     return subsegment
 
 
+def record_sent_attempts(send: Callable) -> Callable:
+    """
+    Wraps the :code:`send` of a client, so while :code:`sent_attempts`
+    is set, every request it sends is appended to it, as when it was
+    sent, when it ended, and its response or the exception it failed
+    with.
+    """
+
+    @wraps(send)
+    async def wrapped(request: Request, **kwargs) -> Response:
+        attempts = sent_attempts.get()
+        if attempts is None:
+            return await send(request, **kwargs)
+
+        started = time.time()
+        try:
+            response = await send(request, **kwargs)
+        except Exception as e:
+            attempts.append((started, time.time(), None, e))
+            raise
+
+        attempts.append((started, time.time(), response, None))
+        return response
+
+    return wrapped
+
+
+def record_attempt(
+    subsegment: Optional[Subsegment],
+    attempt: int,
+    start_time: float,
+    end_time: float,
+    *,
+    response: Optional[Response] = None,
+    exception: Optional[Exception] = None,
+) -> Optional[Subsegment]:
+    """
+    Records an attempt of an interservice request that was retried,
+    as a closed child of the request's subsegment, with the status of
+    its response or the exception it failed with.
+
+    :param attempt: The number of the attempt, from 1.
+    """
+    if subsegment is None or not subsegment.sampled:
+        return None
+
+    segment = subsegment.parent_segment
+    if isinstance(segment, TailSegment) and not segment.admit():
+        return None
+
+    child = Subsegment(f"attempt {attempt}", subsegment.namespace, segment)
+    child.start_time = start_time
+    subsegment.add_subsegment(child)
+
+    if exception is not None:
+        response = getattr(exception, "response", response)
+        child.add_exception(exception, [], remote=response is not None)
+    if response is not None:
+        child.put_http_meta(http.STATUS, response.status_code)
+
+    child.close(end_time)
+    return child
+
+
+def record_connection_phases(
+    subsegment: Optional[Subsegment], phases: Optional[dict]
+) -> None:
+    """
+    Records the collected phases in the :code:`connection` metadata
+    of the subsegment.
+    """
+    if subsegment is None or not phases:
+        return
+
+    for phase, seconds in phases.items():
+        subsegment.put_metadata(phase, seconds, CONNECTION_NAMESPACE)
+
+
 def end_subsegment_with_exception(
     *,
     request: Request,
@@ -0,0 +1,165 @@
+import asyncio
+import time
+import weakref
+from typing import AsyncIterable, AsyncIterator, Optional
+
+from aws_xray_sdk.core.async_recorder import AsyncAWSXRayRecorder
+from aws_xray_sdk.core.models.subsegment import Subsegment
+from aws_xray_sdk.core.utils import stacktrace
+
+from incendiary.xray.contexts import current_trace_entity, trace_entity_scope
+from incendiary.xray.tail_sampling import TailSegment
+
+#: The metadata namespace of the timings of a captured iterator.
+ITERATOR_NAMESPACE = "iterator"
+
+# the subsegments of the iterators of a segment that are still in
+# progress, with the function that ends them
+_in_progress = weakref.WeakKeyDictionary()
+
+
+def begin_iterator_subsegment(name: str, parent=None) -> Optional[Subsegment]:
+    """
+    Begins a subsegment of :code:`parent`, without putting it on the
+    context, or :code:`None` if the parent is not sampled. The
+    subsegment of an iterator outlives the steps it is made in, so it
+    can't be the current entity of the consumer between them.
+
+    :param parent: The entity that was current when the iterator was
+        created. If :code:`None`, or if it has already ended, the
+        subsegment is begun in the current entity.
+    """
+    if parent is None or not parent.in_progress:
+        parent = current_trace_entity()
+    if parent is None or not parent.sampled:
+        return None
+
+    segment = getattr(parent, "parent_segment", parent)
+    if isinstance(segment, TailSegment) and not segment.admit():
+        return None
+
+    subsegment = Subsegment(name, "local", segment)
+    parent.add_subsegment(subsegment)
+    return subsegment
+
+
+def end_iterator_subsegments(segment) -> None:
+    """
+    Ends the subsegments of the iterators of the segment that are
+    still in progress, before the segment ends. A consumer that
+    breaks out of :code:`async for` leaves the generator to be closed
+    by its finalizer, which may only run after the segment was sent.
+    """
+    in_progress = _in_progress.pop(segment, None)
+    if in_progress:
+        end_time = time.time()
+        for end in list(in_progress.values()):
+            end("unfinished", end_time)
+
+
+async def aclose_iterator(iterator: AsyncIterator) -> None:
+    """
+    Closes an async generator, so one that is closed early can clean
+    up. Other iterators are left alone.
+    """
+    aclose = getattr(iterator, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+async def trace_async_iterator(
+    aiterable: AsyncIterable,
+    name: str,
+    recorder: AsyncAWSXRayRecorder,
+    parent=None,
+) -> AsyncIterator:
+    """
+    Iterates over :code:`aiterable` in a subsegment that begins with
+    the first step and ends when the iteration ends, fails, is closed
+    early with :code:`aclose` or is cancelled. Each step runs with the
+    subsegment as the current entity, so the spans of the producer are
+    its children.
+
+    The :code:`iterator` metadata records the number of :code:`items`,
+    the seconds until the first item (:code:`time_to_first_item`), the
+    seconds spent producing items (:code:`active`) and suspended while
+    the consumer handled them (:code:`suspended`), and how the
+    iteration ended (:code:`outcome`): :code:`exhausted`,
+    :code:`closed`, :code:`cancelled`, :code:`failed`, or
+    :code:`unfinished` if the segment ended first.
+
+    The subsegment is a child of :code:`parent`, the entity that was
+    current when the iterator was created, since the first step can
+    run elsewhere, like in the caller of a function that returned it.
+
+    Values sent with :code:`asend` are not passed on.
+    """
+    iterator = aiterable.__aiter__()
+    subsegment = begin_iterator_subsegment(name, parent)
+
+    if subsegment is None:
+        try:
+            async for item in iterator:
+                yield item
+        finally:
+            await aclose_iterator(iterator)
+        return
+
+    items = 0
+    active = 0.0
+    time_to_first_item = None
+    outcome = "exhausted"
+
+    def end(outcome: str, end_time: float) -> None:
+        in_progress.pop(subsegment, None)
+        for key, value in (
+            ("items", items),
+            ("time_to_first_item", time_to_first_item),
+            ("active", active),
+            ("suspended", end_time - subsegment.start_time - active),
+            ("outcome", outcome),
+        ):
+            subsegment.put_metadata(key, value, ITERATOR_NAMESPACE)
+        subsegment.close(end_time)
+
+    segment = subsegment.parent_segment
+    in_progress = _in_progress.get(segment)
+    if in_progress is None:
+        in_progress = _in_progress[segment] = {}
+    in_progress[subsegment] = end
+
+    try:
+        while True:
+            resumed = time.time()
+            with trace_entity_scope(subsegment):
+                try:
+                    item = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    active += time.time() - resumed
+
+            items += 1
+            if time_to_first_item is None:
+                time_to_first_item = time.time() - subsegment.start_time
+            yield item
+    except GeneratorExit:
+        outcome = "closed"
+        raise
+    except asyncio.CancelledError:
+        outcome = "cancelled"
+        raise
+    except Exception as e:
+        outcome = "failed"
+        subsegment.add_exception(
+            e, stacktrace.get_stacktrace(limit=recorder.max_trace_back)
+        )
+        raise
+    finally:
+        end_time = time.time()
+        try:
+            await aclose_iterator(iterator)
+        finally:
+            # unless it already ended with its segment
+            if subsegment.in_progress:
+                end(outcome, end_time)
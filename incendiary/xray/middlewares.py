@@ -6,12 +6,45 @@ from insanic.conf import settings
 from insanic.request import Request
 from sanic.response import BaseHTTPResponse
 
-from incendiary.xray.utils import abbreviate_for_xray, get_safe_dict
+from incendiary.xray.analysis import (
+    INTERSERVICE_NAMESPACE,
+    analyze_interservice,
+)
+from incendiary.xray.entities import UnsampledSegment, unsampled_segment
+from incendiary.xray.iterators import end_iterator_subsegments
+from incendiary.xray.tail_sampling import TailSegment
+from incendiary.xray.utils import (
+    abbreviate_for_xray,
+    get_safe_dict,
+    is_materialized,
+    request_route,
+)
 
 from aws_xray_sdk.core.models import http
 from aws_xray_sdk.ext.util import calculate_segment_name, construct_xray_header
 
 
+def put_request_metadata(segment, request: Request, lazy: bool) -> None:
+    """
+    Records the configured request attributes as metadata on
+    the segment. If :code:`lazy` is set, attributes that need
+    to be parsed (body, cookies, query arguments) are only recorded
+    if the handler has already parsed them.
+    """
+    for attr in request.app.config.INCENDIARY_XRAY_REQUEST_ATTRIBUTES:
+        if lazy and not is_materialized(request, attr):
+            continue
+
+        if hasattr(request, attr):
+            payload = getattr(request, attr)
+
+            if isinstance(payload, dict):
+                payload = abbreviate_for_xray(get_safe_dict(payload))
+            payload = json.dumps(payload)
+
+            segment.put_metadata(f"{attr}", payload, "request")
+
+
 async def before_request(request: Request) -> None:
     """
     The request middleware that runs when Sanic receives a
@@ -23,8 +56,6 @@ async def before_request(request: Request) -> None:
     headers = request.headers
     xray_header = construct_xray_header(headers)
 
-    name = calculate_segment_name(request.host, xray_recorder)
-
     # custom decision to skip if INCENDIARY_XRAY_ENABLED is false
     sampling_decision = xray_recorder.sampler.calculate_sampling_decision(
         trace_header=xray_header,
@@ -32,14 +63,42 @@ async def before_request(request: Request) -> None:
         service_name=request.host,
         method=request.method,
         path=request.path,
+        route=request_route(request),
     )
 
-    segment = xray_recorder.begin_segment(
-        name=name,
-        traceid=xray_header.root,
-        parent_id=xray_header.parent,
-        sampling=sampling_decision,
-    )
+    segment = None
+
+    if not sampling_decision:
+        tail_sampler = getattr(xray_recorder.sampler, "tail_sampler", None)
+
+        if (
+            tail_sampler is not None
+            and request.app.config.INCENDIARY_XRAY_ENABLED
+        ):
+            # the decision is deferred until the request ends
+            segment = tail_sampler.begin_segment(
+                xray_recorder,
+                calculate_segment_name(request.host, xray_recorder),
+                xray_header,
+            )
+
+        if (
+            segment is None
+            and request.app.config.INCENDIARY_XRAY_UNSAMPLED_FAST_PATH
+        ):
+            # only keep what is needed to propagate the trace header
+            xray_recorder.context.put_segment(unsampled_segment(xray_header))
+            return
+
+    if segment is None:
+        name = calculate_segment_name(request.host, xray_recorder)
+
+        segment = xray_recorder.begin_segment(
+            name=name,
+            traceid=xray_header.root,
+            parent_id=xray_header.parent,
+            sampling=sampling_decision,
+        )
 
     if segment.sampled:
         segment.save_origin_trace_header(xray_header)
@@ -60,27 +119,10 @@ async def before_request(request: Request) -> None:
         else:
             segment.put_http_meta(http.CLIENT_IP, request.remote_addr)
 
-        attributes = [
-            "args",
-            "content_type",
-            "cookies",
-            "data",
-            "host",
-            "ip",
-            "method",
-            "path",
-            "scheme",
-            "url",
-        ]
-        for attr in attributes:
-            if hasattr(request, attr):
-                payload = getattr(request, attr)
-
-                if isinstance(payload, dict):
-                    payload = abbreviate_for_xray(get_safe_dict(payload))
-                payload = json.dumps(payload)
-
-                segment.put_metadata(f"{attr}", payload, "request")
+        # with lazy capture, request attributes are recorded in
+        # after_request, once the handler has parsed what it needs
+        if not request.app.config.INCENDIARY_XRAY_LAZY_CAPTURE:
+            put_request_metadata(segment, request, lazy=False)
 
 
 async def after_request(request: Request, response: BaseHTTPResponse) -> None:
@@ -90,15 +132,48 @@ async def after_request(request: Request, response: BaseHTTPResponse) -> None:
     xray_recorder = request.app.xray_recorder
     segment = xray_recorder.current_segment()
 
+    if isinstance(segment, UnsampledSegment):
+        # nothing was recorded, so there is nothing to end or emit,
+        # but code that runs after the response shouldn't find it.
+        xray_recorder.context.clear_trace_entities()
+        return response
+
+    end_iterator_subsegments(segment)
+
+    # summaries are closed first, so their errors and timings are seen
+    # by the analysis and the tail sampling decision
+    aggregator = getattr(request.app, "xray_call_aggregator", None)
+    if aggregator is not None:
+        aggregator.close(segment)
+
+    if (
+        segment.sampled
+        and request.app.config.INCENDIARY_XRAY_INTERSERVICE_ANALYSIS
+    ):
+        analysis = analyze_interservice(segment)
+        if analysis is not None:
+            for key, value in analysis.items():
+                segment.put_metadata(key, value, INTERSERVICE_NAMESPACE)
+
+    if isinstance(segment, TailSegment) and segment.pending:
+        # dropped segments are no longer sampled, so they are not sent
+        segment.decide(response)
+
     if segment.sampled:
         # setting user was moved from _before_request,
         # because calling request.user authenticates, and if
         # authenticators are not set for request, will end not being
         # able to authenticate correctly
+        lazy = request.app.config.INCENDIARY_XRAY_LAZY_CAPTURE
 
-        user = request.user
+        if lazy:
+            put_request_metadata(segment, request, lazy=True)
+            # only read the user if authentication has already run
+            user = getattr(request, "_user", None)
+        else:
+            user = request.user
 
-        if user.id:
+        if user is not None and user.id:
             segment.set_user(user.id)
             segment.put_annotation("user__level", user.level)
 
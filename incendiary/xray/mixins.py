@@ -1,4 +1,7 @@
-from typing import Optional
+import inspect
+import time
+from functools import partial, wraps
+from typing import AsyncIterable, Optional
 
 from aws_xray_sdk import global_sdk_config
 from aws_xray_sdk.core import xray_recorder
@@ -6,96 +9,317 @@ from aws_xray_sdk.core.async_recorder import AsyncSubsegmentContextManager
 from aws_xray_sdk.core.models.dummy_entities import DummySegment
 from aws_xray_sdk.core.models.subsegment import (
     SubsegmentContextManager,
-    subsegment_decorator,
     is_already_recording,
+    set_as_recording,
 )
 from aws_xray_sdk.core.exceptions.exceptions import SegmentNotFoundException
 from aws_xray_sdk.core.exceptions import exceptions
 
 from incendiary.loggers import error_logger
+from incendiary.xray.contexts import current_trace_entity
+from incendiary.xray.iterators import trace_async_iterator
 
 CAPTURE_WARNING = (
     "[INCENDIARY] Incendiary has NOT been initialized for capture. "
     "Refer to README for more information: {name}"
 )
 
+#: The metadata namespace and key on a parent, of the captured
+#: subsegments that were dropped for being faster than the minimum
+#: duration, with their count and summed duration in seconds by name.
+ROLLED_UP_NAMESPACE = "incendiary"
+ROLLED_UP_KEY = "fast_subsegments"
+
+
+def roll_up_subsegment(parent, subsegment, duration: float) -> None:
+    """
+    Removes the subsegment from its parent, and adds it to the counts
+    of the parent, with what was rolled up into the subsegment.
+    """
+    parent.remove_subsegment(subsegment)
+
+    rolled_up = parent.metadata.setdefault(ROLLED_UP_NAMESPACE, {}).setdefault(
+        ROLLED_UP_KEY, {}
+    )
+    children = subsegment.metadata.get(ROLLED_UP_NAMESPACE, {}).get(
+        ROLLED_UP_KEY, {}
+    )
+
+    for name, count, total in (
+        (subsegment.name, 1, duration),
+        *((n, c["count"], c["total"]) for n, c in children.items()),
+    ):
+        counts = rolled_up.get(name)
+        if counts is None:
+            rolled_up[name] = {"count": count, "total": total}
+        else:
+            counts["count"] += count
+            counts["total"] += total
+
+
+def drop_fast_subsegment(
+    *, parent, min_duration: float, subsegment, exception, stack, **kwargs
+) -> None:
+    """
+    The meta processor of captured calls with a minimum duration.
+    Records the exception like the recorder does, and rolls the
+    subsegment up into its parent if it was faster than
+    :code:`min_duration`. Subsegments that failed or still have
+    children are kept.
+    """
+    if exception:
+        subsegment.add_exception(exception, stack)
+        return
+
+    duration = time.time() - subsegment.start_time
+    if (
+        duration < min_duration
+        and subsegment.sampled
+        and not subsegment.subsegments
+        and subsegment.parent_id == parent.id
+    ):
+        roll_up_subsegment(parent, subsegment, duration)
+
+
+def capture_min_duration(instance, min_duration: Optional[float]) -> float:
+    """
+    The minimum duration of a captured call, :code:`min_duration` if
+    the decorator set one, or else
+    :code:`INCENDIARY_XRAY_CAPTURE_MIN_DURATION` of the application
+    the instance was initialized with.
+    """
+    if min_duration is not None:
+        return min_duration
+
+    config = getattr(instance.app, "config", None)
+    return getattr(config, "INCENDIARY_XRAY_CAPTURE_MIN_DURATION", 0)
+
+
+def meta_processor(recorder, min_duration: float):
+    """
+    The meta processor of a captured call within the current entity of
+    the recorder, or :code:`None` if there is no minimum duration, or
+    no entity to roll up into.
+    """
+    if not min_duration:
+        return None
+
+    entity = recorder.get_trace_entity()
+    if entity is None:
+        return None
+    return partial(
+        drop_fast_subsegment, parent=entity, min_duration=min_duration
+    )
+
 
 class IncendiaryAsyncSubsegmentContextManager(AsyncSubsegmentContextManager):
     """
     A context manager that starts and ends a segment.
+
+    As a decorator, the name of the subsegment is resolved once when
+    the function is decorated. Each call then checks the current entity
+    first: if it is not sampled, the function is awaited directly,
+    without beginning a subsegment.
+
+    Async generator functions are recorded from the first step until
+    the iteration ends, with :code:`trace_async_iterator`.
+
+    :param min_duration: Calls faster than this many seconds are rolled
+        up into their parent. If :code:`None`,
+        :code:`INCENDIARY_XRAY_CAPTURE_MIN_DURATION` is used.
     """
 
-    def __init__(self, instance, *args, **kwargs):
+    def __init__(self, instance, *args, min_duration=None, **kwargs):
 
         self.instance = instance
+        self.min_duration = min_duration
         super(IncendiaryAsyncSubsegmentContextManager, self).__init__(
             *args, **kwargs
         )
 
-    @subsegment_decorator
-    async def __call__(self, wrapped, instance, args, kwargs):
+    def __call__(self, wrapped):
 
         if is_already_recording(wrapped):
             # The wrapped function is already decorated, the subsegment will be created later,
             # just return the result
-            return await wrapped(*args, **kwargs)
+            return wrapped
+
+        func_name = self.name or wrapped.__name__
 
-        func_name = self.name
-        if not func_name:
-            func_name = wrapped.__name__
+        if inspect.isasyncgenfunction(wrapped):
+            return self.capture_generator(wrapped, func_name)
+
+        @wraps(wrapped)
+        async def traced(*args, **kwargs):
+            entity = current_trace_entity()
+            if entity is not None and not entity.sampled:
+                return await wrapped(*args, **kwargs)
+
+            if not global_sdk_config.sdk_enabled() or self.instance.app is None:
+                self.check_initialized(func_name)
+
+            min_duration = capture_min_duration(
+                self.instance, self.min_duration
+            )
 
-        if not global_sdk_config.sdk_enabled() or self.instance.app is None:
             try:
-                segment = self.recorder.current_segment()
-            except SegmentNotFoundException:
-                segment = DummySegment(func_name)
-                self.recorder.context.put_segment(segment)
-            finally:
-                if segment is None:
-                    error_logger.warning(CAPTURE_WARNING.format(name=func_name))
-                elif (
-                    hasattr(self.instance.app, "initialized_plugins")
-                    and "incendiary"
-                    not in self.instance.app.initialized_plugins
-                ):
-                    error_logger.warning(CAPTURE_WARNING.format(name=func_name))
+                return await self.recorder.record_subsegment_async(
+                    wrapped,
+                    None,
+                    args,
+                    kwargs,
+                    name=func_name,
+                    namespace="local",
+                    meta_processor=meta_processor(self.recorder, min_duration),
+                )
+            except exceptions.AlreadyEndedException:
+                return await wrapped(*args, **kwargs)
+
+        set_as_recording(traced, wrapped)
+        return traced
+
+    def capture_generator(self, wrapped, func_name: str):
+        """
+        Decorates an async generator function, so the generators it
+        returns are iterated in a subsegment, if the current entity is
+        sampled.
+        """
 
+        @wraps(wrapped)
+        def traced(*args, **kwargs):
+            generator = wrapped(*args, **kwargs)
+
+            entity = current_trace_entity()
+            if entity is None or not entity.sampled:
+                return generator
+            return trace_async_iterator(
+                generator, func_name, self.recorder, parent=entity
+            )
+
+        set_as_recording(traced, wrapped)
+        return traced
+
+    def check_initialized(self, func_name: str) -> None:
+        """
+        Warns if Incendiary was not initialized, and puts a dummy
+        segment on the context if there is no segment.
+        """
         try:
-            return await self.recorder.record_subsegment_async(
+            segment = self.recorder.current_segment()
+        except SegmentNotFoundException:
+            segment = DummySegment(func_name)
+            self.recorder.context.put_segment(segment)
+        finally:
+            if segment is None:
+                error_logger.warning(CAPTURE_WARNING.format(name=func_name))
+            elif (
+                hasattr(self.instance.app, "initialized_plugins")
+                and "incendiary" not in self.instance.app.initialized_plugins
+            ):
+                error_logger.warning(CAPTURE_WARNING.format(name=func_name))
+
+
+class IncendiarySubsegmentContextManager(SubsegmentContextManager):
+    """
+    The SDK's context manager that starts and ends a subsegment, that
+    as a decorator rolls up calls faster than :code:`min_duration`
+    into their parent.
+
+    :param min_duration: Calls faster than this many seconds are rolled
+        up into their parent. If :code:`None`,
+        :code:`INCENDIARY_XRAY_CAPTURE_MIN_DURATION` is used.
+    """
+
+    def __init__(self, instance, *args, min_duration=None, **kwargs):
+
+        self.instance = instance
+        self.min_duration = min_duration
+        super().__init__(*args, **kwargs)
+
+    def __call__(self, wrapped):
+
+        if is_already_recording(wrapped):
+            return wrapped
+
+        func_name = self.name or wrapped.__name__
+
+        @wraps(wrapped)
+        def traced(*args, **kwargs):
+            min_duration = capture_min_duration(
+                self.instance, self.min_duration
+            )
+
+            return self.recorder.record_subsegment(
                 wrapped,
-                instance,
+                None,
                 args,
                 kwargs,
                 name=func_name,
                 namespace="local",
-                meta_processor=None,
+                meta_processor=meta_processor(self.recorder, min_duration),
             )
-        except exceptions.AlreadyEndedException:
-            return await wrapped(*args, **kwargs)
+
+        set_as_recording(traced, wrapped)
+        return traced
 
 
 class CaptureMixin:
     @classmethod
     def capture_async(
-        cls, name: Optional[str] = None
+        cls, name: Optional[str] = None, min_duration: Optional[float] = None
     ) -> IncendiaryAsyncSubsegmentContextManager:
         """
         A decorator that records enclosed function or method
         in a subsegment. It only works with asynchronous function
 
         :param name: The name of the subsegment. If not specified, the function name will be used.
+        :param min_duration: Calls faster than this many seconds are only counted in their parent. If not specified, :code:`INCENDIARY_XRAY_CAPTURE_MIN_DURATION` is used.
         """
         return IncendiaryAsyncSubsegmentContextManager(
-            cls, xray_recorder, name=name
+            cls, xray_recorder, name=name, min_duration=min_duration
+        )
+
+    @classmethod
+    def capture_async_iterator(
+        cls, aiterable: AsyncIterable, name: Optional[str] = None
+    ) -> AsyncIterable:
+        """
+        Records iterating over an async iterator, like the pages of a
+        paginated fetcher, in a subsegment. Use it in place of the
+        iterator:
+
+        .. code-block:: python
+
+            async for page in Incendiary.capture_async_iterator(pages()):
+                ...
+
+        :param name: The name of the subsegment. If not specified, the name of the generator or the type of the iterator is used.
+        """
+        entity = current_trace_entity()
+        if entity is None or not entity.sampled:
+            return aiterable
+
+        name = (
+            name
+            or getattr(aiterable, "__name__", None)
+            or type(aiterable).__name__
+        )
+        return trace_async_iterator(
+            aiterable, name, xray_recorder, parent=entity
         )
 
     @classmethod
-    def capture(cls, name: Optional[str] = None) -> SubsegmentContextManager:
+    def capture(
+        cls, name: Optional[str] = None, min_duration: Optional[float] = None
+    ) -> IncendiarySubsegmentContextManager:
         """
         A decorator that records decorated callable in a subsegment.
 
         :param name: The name of the subsegment. If not specified the function name will be used.
+        :param min_duration: Calls faster than this many seconds are only counted in their parent. If not specified, :code:`INCENDIARY_XRAY_CAPTURE_MIN_DURATION` is used.
         """
-        return SubsegmentContextManager(xray_recorder, name=name)
+        return IncendiarySubsegmentContextManager(
+            cls, xray_recorder, name=name, min_duration=min_duration
+        )
 
     #
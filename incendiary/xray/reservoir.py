@@ -0,0 +1,165 @@
+import mmap
+import multiprocessing
+import os
+import time
+from typing import Optional
+
+from aws_xray_sdk.core.sampling.local.reservoir import Reservoir
+
+from incendiary.loggers import logger
+
+#: The size in bytes of a counter in the shared memory.
+COUNTER_SIZE = 8
+
+
+class SharedReservoirs:
+    """
+    The reservoirs of the local sampling rules, shared by all worker
+    processes of a host, so the fixed target of a rule is enforced
+    per host instead of per worker.
+
+    The counters live in an anonymous shared mmap, so this must be
+    created before the workers are forked. Every worker claims a slot
+    the first time it samples, and only ever writes to its own
+    counters, so taking from a reservoir does not need a lock. The
+    trade off is that workers sampling at the same instant may
+    together go over the fixed target by at most one trace each.
+
+    Workers release their slot when they stop, and the slots of
+    workers that exited without releasing them are claimed again,
+    so restarted workers don't run out of slots.
+
+    The layout of the counters is a header with the number of slots
+    that were ever claimed, the pid owning each slot, followed by a
+    :code:`(second, used)` pair for each rule, for each slot.
+    """
+
+    def __init__(self, rules: int, slots: int) -> None:
+        self.rules = rules
+        self.slots = slots
+
+        size = (1 + slots + rules * slots * 2) * COUNTER_SIZE
+        self._mmap = mmap.mmap(-1, size)
+        self.counters = memoryview(self._mmap).cast("q")
+        self._claim_lock = multiprocessing.Lock()
+        self._pid = None
+        self._slot = None
+
+    def _counters_start(self, rule: int) -> int:
+        return 1 + self.slots + rule * self.slots * 2
+
+    def _is_free(self, slot: int) -> bool:
+        owner = self.counters[1 + slot]
+        if owner == 0:
+            return True
+
+        try:
+            os.kill(owner, 0)
+        except ProcessLookupError:
+            # the worker exited without releasing its slot
+            return True
+        except PermissionError:  # pragma: no cover
+            pass
+        return False
+
+    def _claim(self, pid: int) -> Optional[int]:
+        with self._claim_lock:
+            claimed = self.counters[0]
+            for slot in range(claimed):
+                if self._is_free(slot):
+                    break
+            else:
+                if claimed >= self.slots:
+                    return None
+                slot = claimed
+                self.counters[0] = claimed + 1
+
+            # the counts of the previous owner are kept, they are
+            # reset by the first take in a new second
+            self.counters[1 + slot] = pid
+            return slot
+
+    def slot(self) -> Optional[int]:
+        """
+        The slot of the current process. A slot is claimed the first
+        time this is called in a process. Returns :code:`None` if
+        all slots are claimed.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            self._slot = self._claim(pid)
+            if self._slot is None:
+                logger.warning(
+                    f"[XRAY] All {self.slots} shared reservoir slots "
+                    f"are claimed. Process {pid} samples on its own."
+                )
+            self._pid = pid
+        return self._slot
+
+    def release(self) -> None:
+        """
+        Releases the slot of the current process, if it claimed one,
+        so a worker started after it can claim it.
+        """
+        if self._pid != os.getpid() or self._slot is None:
+            return
+
+        with self._claim_lock:
+            if self.counters[1 + self._slot] == self._pid:
+                self.counters[1 + self._slot] = 0
+        self._pid = None
+        self._slot = None
+
+    def reservoir(self, rule: int, traces_per_sec: int) -> "SharedReservoir":
+        return SharedReservoir(self, rule, traces_per_sec)
+
+
+class SharedReservoir:
+    """
+    A drop in replacement for the SDK's :code:`Reservoir` that counts
+    the sampled segments of all worker processes within a second.
+    """
+
+    def __init__(
+        self, reservoirs: SharedReservoirs, rule: int, traces_per_sec: int
+    ) -> None:
+        self.reservoirs = reservoirs
+        self.traces_per_sec = traces_per_sec
+        self._start = reservoirs._counters_start(rule)
+        self._local = None
+
+    def take(self) -> bool:
+        """
+        Returns True if there are segments left within the
+        current second, for all worker processes.
+        """
+        slot = self.reservoirs.slot()
+        if slot is None:
+            return self._take_local()
+
+        counters = self.reservoirs.counters
+        now = int(time.time())
+        own = self._start + slot * 2
+
+        if counters[own] != now:
+            # reset the count before the second, so other workers
+            # never count the previous second's count as this one's
+            counters[own + 1] = 0
+            counters[own] = now
+
+        end = self._start + counters[0] * 2
+        used = 0
+        for i in range(self._start, end, 2):
+            if counters[i] == now:
+                used += counters[i + 1]
+
+        if used >= self.traces_per_sec:
+            return False
+
+        counters[own + 1] += 1
+        return True
+
+    def _take_local(self) -> bool:
+        if self._local is None:
+            self._local = Reservoir(self.traces_per_sec)
+        return self._local.take()
@@ -1,10 +1,212 @@
-import copy
+import re
+from typing import Iterator, Optional, Pattern, Union
 
 from aws_xray_sdk.core.sampling.sampler import DefaultSampler
 from aws_xray_sdk.core.sampling.local.sampler import LocalSampler
+from aws_xray_sdk.core.sampling.local.sampling_rule import SamplingRule
 from insanic import Insanic
 
 from incendiary.loggers import logger
+from incendiary.xray.adaptive import LoadController
+from incendiary.xray.reservoir import SharedReservoirs
+from incendiary.xray.tail_sampling import TailSampler
+from incendiary.xray.utils import ROUTE_PARAMETER, match_route
+
+ANY_METHOD = "*"
+WILDCARD_CHARACTERS = re.compile(r"[*?]")
+
+#: Memoized for a route when the rule that applies depends on the path.
+MATCH_PATH = object()
+
+
+def compile_wildcard(pattern: str) -> Pattern:
+    """
+    Compiles an X-Ray wildcard pattern, where :code:`*` matches any
+    characters and :code:`?` matches a single character, into a
+    case insensitive regex.
+    """
+    translated = "".join(
+        ".*" if c == "*" else "." if c == "?" else re.escape(c) for c in pattern
+    )
+    return re.compile(translated + r"\Z", re.IGNORECASE | re.DOTALL)
+
+
+class CompiledSamplingRule:
+    """
+    A local sampling rule with its patterns compiled.
+    """
+
+    __slots__ = ("order", "rule", "host", "method", "path")
+
+    def __init__(self, order: int, rule: SamplingRule) -> None:
+        self.order = order
+        self.rule = rule
+        self.host = compile_wildcard(rule.host)
+        self.method = compile_wildcard(rule.method)
+        self.path = compile_wildcard(rule.path)
+
+    def applies(self, host, method, path) -> bool:
+        """
+        Same as :code:`SamplingRule.applies` where any :code:`None`
+        parameters are considered an implicit match.
+        """
+        return (
+            (not host or self.host.match(host) is not None)
+            and (not method or self.method.match(method) is not None)
+            and (not path or self.path.match(path) is not None)
+        )
+
+
+class IncendiaryLocalSampler(LocalSampler):
+    """
+    A local sampler that compiles the local sampling rules once into
+    an index keyed by http method and the literal prefix of the
+    url path. Only the rules that could apply to a request are
+    matched against it. The matched rule is memoized by the
+    request's route, and the path is only matched if a rule could
+    match part of the route's parameters.
+
+    If :code:`reservoirs` is given, the rules take from reservoirs
+    shared with the other worker processes.
+    """
+
+    def __init__(
+        self, rules: dict, reservoirs: Optional[SharedReservoirs] = None
+    ) -> None:
+        self.reservoirs = reservoirs
+        super().__init__(rules)
+
+    def load_local_rules(self, rules: dict) -> None:
+        super().load_local_rules(rules)
+
+        if self.reservoirs is not None:
+            for index, rule in enumerate(self._rules + [self._default_rule]):
+                if index < self.reservoirs.rules:
+                    rule._reservoir = self.reservoirs.reservoir(
+                        index, rule.fixed_target
+                    )
+
+        self._index = {}
+        prefix_lengths = set()
+
+        for order, rule in enumerate(self._rules):
+            compiled = CompiledSamplingRule(order, rule)
+
+            method = rule.method.upper()
+            if WILDCARD_CHARACTERS.search(method):
+                method = ANY_METHOD
+
+            prefix = WILDCARD_CHARACTERS.split(rule.path, 1)[0].lower()
+            prefix_lengths.add(len(prefix))
+
+            self._index.setdefault(method, {}).setdefault(prefix, []).append(
+                compiled
+            )
+
+        self._prefix_lengths = sorted(prefix_lengths)
+        self._route_rules = {}
+
+    def _candidates(
+        self, method: Optional[str], path: Optional[str]
+    ) -> Iterator[CompiledSamplingRule]:
+        if method is None:
+            buckets = self._index.values()
+        else:
+            buckets = (
+                self._index.get(method.upper()),
+                self._index.get(ANY_METHOD),
+            )
+
+        for bucket in buckets:
+            if not bucket:
+                continue
+
+            if path is None:
+                for compiled_rules in bucket.values():
+                    yield from compiled_rules
+                continue
+
+            lowered = path.lower()
+            for length in self._prefix_lengths:
+                if length > len(lowered):
+                    break
+                yield from bucket.get(lowered[:length], ())
+
+    def match_rule(
+        self, host: Optional[str], method: Optional[str], path: Optional[str]
+    ) -> Optional[SamplingRule]:
+        """
+        Returns the first custom rule, in the order they are defined,
+        that applies to the request.
+        """
+        candidates = sorted(
+            self._candidates(method, path), key=lambda c: c.order
+        )
+        for compiled in candidates:
+            if compiled.applies(host, method, path):
+                return compiled.rule
+        return None
+
+    def _match_route(
+        self, host: Optional[str], method: Optional[str], route: str
+    ) -> Union[SamplingRule, None, object]:
+        route_parts = ROUTE_PARAMETER.split(route)
+        if len(route_parts) == 1:
+            return self.match_rule(host, method, route)
+
+        route_parts = [part.lower() for part in route_parts]
+        candidates = sorted(
+            self._candidates(method, None), key=lambda c: c.order
+        )
+
+        for compiled in candidates:
+            if not compiled.applies(host, method, None):
+                continue
+
+            matched = match_route(compiled.rule.path.lower(), "*?", route_parts)
+            if matched is True:
+                return compiled.rule
+            if matched is None:
+                return MATCH_PATH
+        return None
+
+    def match_route_rule(
+        self,
+        host: Optional[str],
+        method: Optional[str],
+        path: Optional[str],
+        route: str,
+    ) -> Optional[SamplingRule]:
+        """
+        Same as :code:`match_rule`, but memoized by the template of the
+        request's route, instead of its path.
+        """
+        key = (host, method, route)
+        try:
+            rule = self._route_rules[key]
+        except KeyError:
+            rule = self._route_rules[key] = self._match_route(
+                host, method, route
+            )
+
+        if rule is MATCH_PATH:
+            return self.match_rule(host, method, path)
+        return rule
+
+    def should_trace(self, sampling_req: Optional[dict] = None) -> bool:
+        if sampling_req is None:
+            return self._should_trace(self._default_rule)
+
+        host = sampling_req.get("host", None)
+        method = sampling_req.get("method", None)
+        path = sampling_req.get("path", None)
+        route = sampling_req.get("route", None)
+
+        if route is None:
+            rule = self.match_rule(host, method, path)
+        else:
+            rule = self.match_route_rule(host, method, path, route)
+        return self._should_trace(rule or self._default_rule)
 
 
 class IncendiaryDefaultSampler(DefaultSampler):
@@ -24,18 +226,43 @@ class IncendiaryDefaultSampler(DefaultSampler):
         """
         self.app = app
         super().__init__()
-        self._local_sampler = LocalSampler(self.local_rules)
+        self._local_sampler = IncendiaryLocalSampler(
+            self.local_rules, getattr(app, "xray_reservoirs", None)
+        )
+        self.tail_sampler = (
+            TailSampler.from_config(app.config)
+            if app.config.INCENDIARY_XRAY_TAIL_SAMPLING
+            else None
+        )
+        self.load_controller = (
+            LoadController.from_config(app.config)
+            if app.config.INCENDIARY_XRAY_ADAPTIVE_SAMPLING
+            else None
+        )
 
     @property
     def local_rules(self) -> dict:
-        rules = copy.deepcopy(self.app.config.INCENDIARY_XRAY_SAMPLING_RULES)
+        # rules are compiled by the local sampler and never mutated,
+        # so only the top level needs to be copied
+        rules = dict(self.app.config.INCENDIARY_XRAY_SAMPLING_RULES)
         if not self.app.config.INCENDIARY_XRAY_ENABLED:
             rules.update({"rules": []})
             rules.update({"default": {"fixed_target": 0, "rate": 0}})
         return rules
 
+    @property
+    def effective_rate(self) -> float:
+        """
+        The sampling rate of the default rule, after it has been
+        scaled down because of load.
+        """
+        rate = self._local_sampler._default_rule.rate
+        if self.load_controller is not None:
+            rate *= self.load_controller.scale
+        return rate
+
     def calculate_sampling_decision(
-        self, trace_header, recorder, service_name, method, path
+        self, trace_header, recorder, service_name, method, path, route=None
     ):
         """
         Return 1 if should sample and 0 if should not.
@@ -43,7 +270,8 @@ class IncendiaryDefaultSampler(DefaultSampler):
         the highest precedence. If the ``trace_header`` doesn't contain
         sampling decision then it checks if sampling is enabled or not
         in the recorder. If not enabled it returns 1. Otherwise it uses
-        sampling rule to decide.
+        sampling rule to decide, which is memoized by ``route`` if it
+        is given.
         """
         if trace_header.sampled is not None and trace_header.sampled != "?":
             logger.debug(
@@ -56,7 +284,18 @@ class IncendiaryDefaultSampler(DefaultSampler):
         elif not recorder.sampling:
             logger.debug("Sample decision: True (from recorder sampling)")
             return 1
-        elif self.should_trace(sampling_req={"method": method, "path": path}):
+        elif (
+            self.load_controller is not None
+            and not self.load_controller.admit()
+        ):
+            logger.debug(
+                f"Sample decision: False (scaled to "
+                f"{self.load_controller.scale} by load)"
+            )
+            return 0
+        elif self.should_trace(
+            sampling_req={"method": method, "path": path, "route": route}
+        ):
             logger.debug("Sample decision: True (from sampler rules)")
             return 1
         else:
@@ -0,0 +1,173 @@
+import json
+import re
+from typing import Any, List
+
+import ujson
+from aws_xray_sdk.core.emitters.udp_emitter import (
+    PROTOCOL_DELIMITER,
+    PROTOCOL_HEADER,
+)
+from aws_xray_sdk.core.utils.conversion import metadata_to_dict
+
+from incendiary.loggers import error_logger
+
+JSON_TYPES = (str, int, float, bool, type(None))
+
+#: Attributes of segments and subsegments that are not in the document.
+#: Private attributes are never in the document either.
+EXCLUDED_KEYS = frozenset(("sampled", "ref_counter", "parent_segment"))
+
+#: ujson formats floats with a single digit negative exponent differently
+#: than json, for example :code:`1e-7` instead of :code:`1e-07`. Documents
+#: with a number like that are encoded with json. Strings that look like
+#: one only cost a fallback. The pattern starts with a literal so
+#: searching for it is fast, the digit before it is checked separately.
+SHORT_NEGATIVE_EXPONENT = re.compile(r"e-\d(?!\d)")
+
+UJSON_OPTIONS = dict(
+    ensure_ascii=True,
+    escape_forward_slashes=False,
+    separators=(", ", ": "),
+    default=str,
+)
+
+#: The largest datagram that can be sent over UDP, which is also
+#: within the 64KB the X-Ray daemon receives.
+MAX_DATAGRAM_SIZE = 65507
+
+#: The largest document that fits in a datagram after the protocol header.
+MAX_DOCUMENT_SIZE = (
+    MAX_DATAGRAM_SIZE - len(PROTOCOL_HEADER) - len(PROTOCOL_DELIMITER)
+)
+
+#: The metadata of a document that was too large with its metadata.
+TRUNCATED = {"incendiary": {"truncated": True}}
+
+try:
+    ujson.dumps({}, **UJSON_OPTIONS)
+except TypeError:  # pragma: no cover
+    # older versions of ujson can't match json's output
+    FAST_ENCODER = False
+else:
+    FAST_ENCODER = True
+
+
+def _metadata(namespace: Any) -> Any:
+    if type(namespace) is not dict:
+        return metadata_to_dict(namespace)
+
+    # request metadata is already dumped to strings, so most
+    # values don't need to be converted
+    return {
+        key: value if type(value) in JSON_TYPES else metadata_to_dict(value)
+        for key, value in namespace.items()
+    }
+
+
+def to_document(entity, subsegments: bool = True) -> dict:
+    """
+    The same trace document as :code:`Entity.to_dict` for the segments
+    and subsegments Incendiary produces, without walking metadata
+    that is already json types.
+
+    :param subsegments: If :code:`False`, the document of the entity
+        without its subsegments.
+    """
+    document = {}
+
+    for key, value in vars(entity).items():
+        # most attributes are empty, so check that first
+        if not value and value is not False:
+            continue
+        if key[0] == "_" or key in EXCLUDED_KEYS:
+            continue
+
+        if key == "subsegments":
+            if subsegments:
+                document[key] = [to_document(s) for s in value]
+        elif key == "metadata":
+            document[key] = {
+                namespace: _metadata(values)
+                for namespace, values in value.items()
+            }
+        elif key == "cause" and isinstance(value, dict):
+            document[key] = {
+                "working_directory": value["working_directory"],
+                "exceptions": [t.to_dict() for t in value["exceptions"]],
+            }
+        else:
+            document[key] = value
+
+    return document
+
+
+def _short_negative_exponent(encoded: str) -> bool:
+    return any(
+        encoded[match.start() - 1].isdigit()
+        for match in SHORT_NEGATIVE_EXPONENT.finditer(encoded)
+    )
+
+
+def serialize(document: dict) -> str:
+    """
+    Serializes a trace document to the same json as
+    :code:`Entity.serialize`, with ujson when it can.
+    """
+    if FAST_ENCODER:
+        try:
+            encoded = ujson.dumps(document, **UJSON_OPTIONS)
+        except Exception:
+            pass
+        else:
+            if not _short_negative_exponent(encoded):
+                return encoded
+
+    return json.dumps(document, default=str)
+
+
+def serialize_entity(entity) -> str:
+    """
+    A faster :code:`Entity.serialize` for segments and subsegments.
+    """
+    return serialize(to_document(entity))
+
+
+def serialize_split(
+    document: dict, limit: int = MAX_DOCUMENT_SIZE
+) -> List[str]:
+    """
+    Serializes a trace document into documents of at most
+    :code:`limit` bytes, so none is too large for the daemon.
+
+    A document that is too large is sent without its subsegments, and
+    each subsegment is sent as a document of its own, like streamed
+    subsegments. If a document is too large even without subsegments,
+    its metadata is left out.
+    """
+    encoded = serialize(document)
+    # documents are ascii, so the length is the size in bytes
+    if len(encoded) <= limit:
+        return [encoded]
+
+    subsegments = document.get("subsegments")
+    if subsegments:
+        documents = serialize_split(
+            {k: v for k, v in document.items() if k != "subsegments"}, limit
+        )
+        for subsegment in subsegments:
+            documents.extend(serialize_split(subsegment, limit))
+        return documents
+
+    if document.get("metadata", TRUNCATED) is not TRUNCATED:
+        error_logger.warning(
+            f"[XRAY] Left out the metadata of {document.get('name')} "
+            f"because it is larger than {limit} bytes."
+        )
+        document = dict(document, metadata=TRUNCATED)
+        return serialize_split(document, limit)
+
+    error_logger.warning(
+        f"[XRAY] Dropped {document.get('name')} because it is larger "
+        f"than {limit} bytes."
+    )
+    return []
@@ -1,16 +1,106 @@
-from httpx import Request
+import time
+from time import perf_counter
+from typing import Optional
+
+from aws_xray_sdk.core.models import http
+
+from httpx import AsyncClient, HTTPStatusError, Request, Response, codes
+from insanic import status
 from insanic.services import Service
 
+from incendiary.loggers import error_logger
+from incendiary.xray.adaptive import record_overhead
+from incendiary.xray.aggregation import CallSummary
+from incendiary.xray.contexts import current_trace_entity
 from incendiary.xray.hooks import (
-    begin_subsegment,
+    ERROR_RESPONSE_BUDGET,
+    SubsegmentTemplate,
+    connection_phases,
     end_subsegment,
     end_subsegment_with_exception,
+    record_attempt,
+    record_connection_phases,
+    record_sent_attempts,
+    sent_attempts,
+    trace_header,
 )
+from incendiary.xray.utils import route_template
+
+
+def record_attempts(subsegment, attempts: list) -> None:
+    """
+    Records the attempts the client collected for a request as children
+    of its subsegment.
+    """
+    for i, (started, ended, response, exception) in enumerate(attempts, 1):
+        if exception is None and codes.is_server_error(response.status_code):
+            # insanic retries server errors by raising for their status
+            try:
+                response.raise_for_status()
+            except HTTPStatusError as e:
+                exception = e
+
+        record_attempt(
+            subsegment,
+            i,
+            started,
+            ended,
+            response=response,
+            exception=exception,
+        )
 
 
 class IncendiaryService(Service):
 
     xray_recorder = None
+    error_response_budget = ERROR_RESPONSE_BUDGET
+    trace_connection_phases = False
+    call_aggregator = None
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.subsegment_template = SubsegmentTemplate(self.service_name)
+
+        #: The number of interservice requests sent to the service.
+        self.requests = 0
+        #: The number of attempts that were retried.
+        self.retries = 0
+
+    @property
+    def retry_rate(self) -> float:
+        """
+        The retries per request sent to the service. Over :code:`1`,
+        the service is sent more requests than it was asked for.
+        """
+        return self.retries / self.requests if self.requests else 0.0
+
+    @property
+    def client(self) -> AsyncClient:
+        """
+        The client of the service, with a connection pool that records
+        the phases of each request if
+        :code:`INCENDIARY_XRAY_CONNECTION_PHASES` is set.
+        """
+        if self._client is None:
+            client = super().client
+            if sent_attempts is not None:
+                client.send = record_sent_attempts(client.send)
+
+            if self.trace_connection_phases and connection_phases is not None:
+                # only imported when enabled, it builds on httpcore's
+                # internals
+                from incendiary.xray.transports import TracingConnectionPool
+
+                pool = TracingConnectionPool.from_pool(client._transport)
+                if pool is None:
+                    error_logger.warning(
+                        f"[XRAY] Connection phases of {self.service_name} "
+                        f"are not recorded, its client's transport is "
+                        f"not a connection pool of httpcore 0.11."
+                    )
+                else:
+                    client._transport = pool
+        return self._client
 
     async def _dispatch_send(
         self,
@@ -19,27 +109,148 @@ class IncendiaryService(Service):
         timeout: float = None,
         retry_count: int = None,
     ):
-        subsegment = begin_subsegment(
-            request=request, name=self.service_name, recorder=self.xray_recorder
-        )
+        if self.call_aggregator is not None:
+            started = perf_counter()
+            summary = self._call_summary(request)
+            record_overhead(self.xray_recorder, started)
+
+            if summary is not None:
+                return await self._send_summarized(
+                    request,
+                    summary,
+                    timeout=timeout,
+                    retry_count=retry_count,
+                )
+
+        started = perf_counter()
+        subsegment = self.subsegment_template.begin(request, self.xray_recorder)
+        record_overhead(self.xray_recorder, started)
+
+        phases = token = None
+        if (
+            self.trace_connection_phases
+            and subsegment is not None
+            and subsegment.sampled
+            and connection_phases is not None
+        ):
+            phases = {}
+            token = connection_phases.set(phases)
+
         try:
-            response = await super()._dispatch_send(
-                request=request, timeout=timeout, retry_count=retry_count,
+            response = await self._send_attempts(
+                request,
+                timeout=timeout,
+                retry_count=retry_count,
+                subsegment=subsegment,
             )
         except Exception as e:
+            started = perf_counter()
+            record_connection_phases(subsegment, phases)
             end_subsegment_with_exception(
                 request=request,
                 exception=e,
                 subsegment=subsegment,
                 recorder=self.xray_recorder,
             )
+            record_overhead(self.xray_recorder, started)
             raise
         else:
+            started = perf_counter()
+            record_connection_phases(subsegment, phases)
             end_subsegment(
                 request=request,
                 response=response,
                 recorder=self.xray_recorder,
                 subsegment=subsegment,
+                budget=self.error_response_budget,
             )
+            record_overhead(self.xray_recorder, started)
 
             return response
+        finally:
+            if token is not None:
+                connection_phases.reset(token)
+
+    def _call_summary(self, request: Request) -> Optional[CallSummary]:
+        """
+        The summary to record the request in, if the current segment
+        already made enough requests like it.
+        """
+        entity = current_trace_entity()
+        if entity is None or not entity.sampled:
+            return None
+
+        segment = getattr(entity, "parent_segment", entity)
+        return self.call_aggregator.summary(
+            segment,
+            (
+                self.subsegment_template.name,
+                request.method,
+                route_template(request.url.path),
+            ),
+        )
+
+    async def _send_summarized(
+        self,
+        request: Request,
+        summary: CallSummary,
+        *,
+        timeout: float = None,
+        retry_count: int = None,
+    ) -> Response:
+        """
+        Sends the request without a subsegment of its own, and records
+        it in the summary.
+        """
+        request.headers[http.XRAY_HEADER] = trace_header(summary.subsegment)
+
+        started = time.time()
+        try:
+            response = await self._send_attempts(
+                request, timeout=timeout, retry_count=retry_count
+            )
+        except Exception:
+            summary.record(started, time.time(), error=True)
+            raise
+
+        summary.record(
+            started,
+            time.time(),
+            error=response.status_code >= status.HTTP_400_BAD_REQUEST,
+        )
+        return response
+
+    async def _send_attempts(
+        self,
+        request: Request,
+        *,
+        timeout: float = None,
+        retry_count: int = None,
+        subsegment=None,
+    ) -> Response:
+        """
+        Sends the request with Insanic's :code:`Service._dispatch_send`,
+        that retries it. The client records each attempt it sends, and
+        if the request was retried, each attempt is recorded as a child
+        of the request's subsegment.
+        """
+        self.requests += 1
+
+        if sent_attempts is None:  # pragma: no cover
+            return await super()._dispatch_send(
+                request, timeout=timeout, retry_count=retry_count
+            )
+
+        attempts = []
+        token = sent_attempts.set(attempts)
+        try:
+            return await super()._dispatch_send(
+                request, timeout=timeout, retry_count=retry_count
+            )
+        finally:
+            sent_attempts.reset(token)
+            self.retries += max(len(attempts) - 1, 0)
+
+            # a request that isn't retried is only its subsegment
+            if len(attempts) > 1:
+                record_attempts(subsegment, attempts)
@@ -0,0 +1,188 @@
+import fcntl
+import mmap
+import os
+import struct
+from typing import Optional
+
+from sanic.config import Config
+
+from incendiary.loggers import logger
+
+#: The header of the spool file: the offsets to write and read the
+#: next record at, and the number of records.
+HEADER = struct.Struct("<QQQ")
+
+#: The length that prefixes every record.
+LENGTH = struct.Struct("<I")
+
+#: A length that marks the rest of the file as unused, and the next
+#: record is at the start of the ring.
+WRAP = 0xFFFFFFFF
+
+
+class RingSpool:
+    """
+    A fixed size ring buffer of serialized entities in a memory mapped
+    file, that holds the segments that could not be sent while the
+    X-Ray daemon is unavailable.
+
+    Every process opens its own spool file in :code:`directory`, the
+    first one that isn't locked by another process. A restarted worker
+    picks up the spool of the worker it replaces, so spooled segments
+    are replayed even across restarts.
+
+    When the spool is full, the oldest records are evicted to make
+    room for new ones, so the spool never grows past :code:`size`.
+    Writes only copy into the mapped memory and are never synced to
+    disk explicitly, that is left to the kernel.
+    """
+
+    def __init__(self, directory: str, size: int) -> None:
+        if size <= HEADER.size + LENGTH.size:
+            raise ValueError(
+                f"Spool size must be over {HEADER.size + LENGTH.size} bytes."
+            )
+
+        self.directory = directory
+        self.size = size
+        self.capacity = size - HEADER.size
+        self.path: Optional[str] = None
+
+        #: The number of records evicted because the spool was full.
+        self.evicted = 0
+
+        self._fd: Optional[int] = None
+        self._mmap: Optional[mmap.mmap] = None
+
+    @classmethod
+    def from_config(cls, config: Config) -> Optional["RingSpool"]:
+        if not config.INCENDIARY_XRAY_SPOOL_DIRECTORY:
+            return None
+
+        return cls(
+            config.INCENDIARY_XRAY_SPOOL_DIRECTORY,
+            config.INCENDIARY_XRAY_SPOOL_SIZE,
+        )
+
+    def open(self) -> None:
+        """
+        Locks and maps the first spool file in the directory that is
+        not used by another process, creating it if needed.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        index = 0
+        while True:
+            path = os.path.join(self.directory, f"xray-{index}.spool")
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                index += 1
+                continue
+            break
+
+        reset = os.fstat(fd).st_size != self.size
+        if reset:
+            os.ftruncate(fd, self.size)
+
+        self.path = path
+        self._fd = fd
+        self._mmap = mmap.mmap(fd, self.size)
+
+        head, tail, count = HEADER.unpack_from(self._mmap)
+        if reset or head > self.capacity or tail > self.capacity:
+            self._write_header(0, 0, 0)
+        elif count:
+            logger.info(
+                f"[XRAY] Found {count} spooled entities in {self.path}."
+            )
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+            os.close(self._fd)
+            self._mmap = None
+            self._fd = None
+
+    def __len__(self) -> int:
+        return HEADER.unpack_from(self._mmap)[2]
+
+    def _write_header(self, head: int, tail: int, count: int) -> None:
+        if count == 0:
+            head = tail = 0
+        HEADER.pack_into(self._mmap, 0, head, tail, count)
+
+    def _record_at(self, offset: int) -> int:
+        """
+        The offset of the record at or wrapped from :code:`offset`.
+        """
+        if self.capacity - offset < LENGTH.size:
+            return 0
+        (length,) = LENGTH.unpack_from(self._mmap, HEADER.size + offset)
+        return 0 if length == WRAP else offset
+
+    def _pop(self, head: int, tail: int, count: int) -> tuple:
+        """
+        Removes the oldest record. Returns the record and the new
+        header.
+        """
+        tail = self._record_at(tail)
+        start = HEADER.size + tail + LENGTH.size
+        (length,) = LENGTH.unpack_from(self._mmap, start - LENGTH.size)
+        record = self._mmap[start : start + length]
+        return record, head, tail + LENGTH.size + length, count - 1
+
+    def write(self, record: bytes) -> bool:
+        """
+        Appends a record, evicting the oldest records if there is not
+        enough space. Returns :code:`False` if the record is larger
+        than the spool.
+        """
+        needed = LENGTH.size + len(record)
+        if needed > self.capacity:
+            return False
+
+        head, tail, count = HEADER.unpack_from(self._mmap)
+        if count:
+            tail = self._record_at(tail)
+
+        while True:
+            if count == 0:
+                head = tail = 0
+
+            wrapped = head < tail or (head == tail and count)
+            if wrapped:
+                if head + needed <= tail:
+                    break
+            elif head + needed <= self.capacity:
+                break
+            elif needed <= tail:
+                # not enough space at the end, continue at the start
+                if self.capacity - head >= LENGTH.size:
+                    LENGTH.pack_into(self._mmap, HEADER.size + head, WRAP)
+                head = 0
+                continue
+
+            _, head, tail, count = self._pop(head, tail, count)
+            self.evicted += 1
+
+        offset = HEADER.size + head
+        LENGTH.pack_into(self._mmap, offset, len(record))
+        self._mmap[offset + LENGTH.size : offset + needed] = record
+        self._write_header(head + needed, tail, count + 1)
+        return True
+
+    def read(self) -> Optional[bytes]:
+        """
+        Removes and returns the oldest record, or :code:`None` if the
+        spool is empty.
+        """
+        head, tail, count = HEADER.unpack_from(self._mmap)
+        if count == 0:
+            return None
+
+        record, head, tail, count = self._pop(head, tail, count)
+        self._write_header(head, tail, count)
+        return record
@@ -0,0 +1,161 @@
+import weakref
+
+from typing import List, Optional, Tuple
+
+from aws_xray_sdk.core.streaming.default_streaming import DefaultStreaming
+
+from incendiary.xray.serializers import (
+    MAX_DOCUMENT_SIZE,
+    serialize,
+    to_document,
+)
+
+# the key, and a separator after every subsegment but the last, and
+# after the list
+SUBSEGMENTS_OVERHEAD = len('"subsegments": []')
+
+
+class IncendiaryStreaming(DefaultStreaming):
+    """
+    Streams the closed subsegments of a segment once the estimated
+    size of its document goes over :code:`budget` bytes, instead of
+    once it has more subsegments than the SDK's :code:`streaming_threshold`.
+    Segments with many small subsegments are sent as one document, and
+    segments with large metadata or annotations are streamed before
+    they are too large for the daemon.
+
+    Segments still waiting for a tail sampling decision are never
+    streamed.
+    """
+
+    def __init__(self, budget: int = MAX_DOCUMENT_SIZE) -> None:
+        super().__init__()
+        self.budget = budget
+        # closed entities don't change, so their size is only estimated once
+        self._sizes = weakref.WeakKeyDictionary()
+        self._running = weakref.WeakKeyDictionary()
+
+    def is_eligible(self, segment) -> bool:
+        if not segment or not segment.sampled:
+            return False
+        if getattr(segment, "pending", False):
+            return False
+        return self.estimate_size(segment) > self.budget
+
+    def estimate_size(self, entity) -> int:
+        """
+        The size in bytes of the document of the entity and its
+        subsegments.
+
+        The size of an entity still in progress is kept running: the
+        subsegments closed since the last estimate are added to it,
+        and its own fields are only measured again if they changed.
+        """
+        size = self._sizes.get(entity)
+        if size is not None:
+            return size
+
+        if entity.in_progress:
+            return self._running_size(entity)
+
+        size = measure_fields(entity)
+        if entity.subsegments:
+            size += SUBSEGMENTS_OVERHEAD + sum(
+                self.estimate_size(s) + 2 for s in entity.subsegments
+            )
+        self._sizes[entity] = size
+        self._running.pop(entity, None)
+        return size
+
+    def _running_size(self, entity) -> int:
+        running = self._running.get(entity)
+        if running is None:
+            running = self._running[entity] = RunningSize()
+
+        signature = fields_signature(entity)
+        if signature != running.signature:
+            running.fields = measure_fields(entity)
+            running.signature = signature
+
+        subsegments = entity.subsegments
+        seen = running.seen
+        if seen and (
+            len(subsegments) < seen or subsegments[seen - 1] is not running.last
+        ):
+            # subsegments were removed (streamed or rolled up), so
+            # the ones left are counted again
+            running.closed = 0
+            running.open = []
+            seen = 0
+
+        for subsegment in subsegments[seen:]:
+            if subsegment.in_progress:
+                running.open.append(subsegment)
+            else:
+                running.closed += self.estimate_size(subsegment) + 2
+        running.seen = len(subsegments)
+        running.last = subsegments[-1] if subsegments else None
+
+        size = running.fields
+        still_open = []
+        for subsegment in running.open:
+            if subsegment.in_progress:
+                still_open.append(subsegment)
+                size += self.estimate_size(subsegment) + 2
+            else:
+                running.closed += self.estimate_size(subsegment) + 2
+        running.open = still_open
+
+        if subsegments:
+            size += SUBSEGMENTS_OVERHEAD + running.closed
+        return size
+
+
+class RunningSize:
+    """
+    The size of an entity in progress, as of its last estimate.
+    """
+
+    __slots__ = ("fields", "signature", "closed", "seen", "last", "open")
+
+    def __init__(self) -> None:
+        #: the size of the entity's document without its subsegments
+        self.fields = 0
+        self.signature: Optional[Tuple] = None
+        #: the size of the closed subsegments counted so far
+        self.closed = 0
+        #: how many subsegments were counted, and the last of them
+        self.seen = 0
+        self.last = None
+        #: the subsegments that were in progress when counted
+        self.open: List = []
+
+
+def measure_fields(entity) -> int:
+    return len(serialize(to_document(entity, subsegments=False)))
+
+
+def fields_signature(entity) -> Tuple:
+    """
+    Changes whenever a field is added to the entity, so its fields
+    are only measured again when they could have grown. Values
+    replaced in place under an existing key aren't noticed, which is
+    fine for an estimate.
+    """
+    return (
+        len(entity.annotations),
+        len(entity.metadata),
+        sum(len(v) for v in entity.metadata.values()),
+        len(entity.http),
+        sum(len(v) for v in entity.http.values()),
+        len(entity.aws),
+        (
+            len(entity.cause.get("exceptions", ()))
+            if isinstance(entity.cause, dict)
+            else entity.cause
+        ),
+        getattr(entity, "error", False),
+        getattr(entity, "fault", False),
+        getattr(entity, "throttle", False),
+        getattr(entity, "user", None),
+    )
@@ -0,0 +1,232 @@
+import threading
+import time
+import weakref
+from typing import Optional
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.trace_header import TraceHeader
+from sanic.config import Config
+from sanic.response import BaseHTTPResponse
+
+#: The estimated size in bytes of a buffered span, used to account
+#: buffered spans against the memory budget.
+SPAN_SIZE = 1024
+
+
+class Reservation:
+    """
+    The bytes of the memory budget held by a buffered segment.
+    """
+
+    __slots__ = ("size",)
+
+    def __init__(self, size: int = 0) -> None:
+        self.size = size
+
+
+class TailSampler:
+    """
+    Decides, once a request has ended, if a request that was not
+    sampled by the sampling rules should be kept. A request is kept
+    if it was slow, if it responded with an error status, or if
+    an exception was recorded.
+
+    Until the decision is made, the spans of a request are buffered
+    in memory. Each request buffers at most :code:`max_spans` spans,
+    and all requests share :code:`memory_budget` bytes. The drop policy
+    is to drop the newest: spans that don't fit are not recorded, and
+    if the budget is exhausted, new requests are not buffered and only
+    head sampling applies to them.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float,
+        min_status: int,
+        max_spans: int,
+        memory_budget: int,
+    ) -> None:
+        self.latency = latency
+        self.min_status = min_status
+        self.max_spans = max_spans
+        self.memory_budget = memory_budget
+
+        self.used = 0
+        self.kept = 0
+        self.dropped = 0
+        self.refused = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: Config) -> "TailSampler":
+        return cls(
+            latency=config.INCENDIARY_XRAY_TAIL_SAMPLING_LATENCY,
+            min_status=config.INCENDIARY_XRAY_TAIL_SAMPLING_MIN_STATUS,
+            max_spans=config.INCENDIARY_XRAY_TAIL_SAMPLING_MAX_SPANS,
+            memory_budget=config.INCENDIARY_XRAY_TAIL_SAMPLING_MEMORY_BUDGET,
+        )
+
+    def reserve(self, reservation: Reservation, size: int = SPAN_SIZE) -> bool:
+        """
+        Reserves :code:`size` bytes of the memory budget. Returns
+        :code:`False` if the budget is exhausted.
+        """
+        with self._lock:
+            if self.used + size > self.memory_budget:
+                return False
+            self.used += size
+        reservation.size += size
+        return True
+
+    def release(self, reservation: Reservation) -> None:
+        """
+        Returns the reserved bytes to the memory budget.
+        """
+        with self._lock:
+            self.used -= reservation.size
+        reservation.size = 0
+
+    def begin_segment(
+        self, recorder, name: str, trace_header: TraceHeader
+    ) -> Optional["TailSegment"]:
+        """
+        Begins a segment that buffers its spans until the sampling
+        decision is made when the request ends. Returns :code:`None`
+        if an upstream service has already made the decision,
+        or if the memory budget is exhausted.
+        """
+        if trace_header.sampled is not None and trace_header.sampled != "?":
+            return None
+
+        if not global_sdk_config.sdk_enabled():
+            return None
+
+        reservation = Reservation()
+        if not self.reserve(reservation):
+            self.refused += 1
+            return None
+
+        segment = TailSegment(
+            name,
+            self,
+            reservation,
+            traceid=trace_header.root,
+            parent_id=trace_header.parent,
+        )
+        recorder._populate_runtime_context(segment, 1)
+        recorder.context.put_segment(segment)
+        return segment
+
+    def should_keep(
+        self, segment: "TailSegment", response: BaseHTTPResponse
+    ) -> bool:
+        if hasattr(response, "exception") or response.status >= self.min_status:
+            return True
+
+        if time.time() - segment.start_time >= self.latency:
+            return True
+
+        return any(
+            getattr(s, "fault", False) or getattr(s, "error", False)
+            for s in segment.subsegments
+        )
+
+
+class TailSegment(Segment):
+    """
+    A segment of a request whose sampling decision is made by
+    :code:`TailSampler` when the request ends. Until then, it is not
+    sent or streamed, and downstream services are left to make their
+    own decision.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        tail_sampler: TailSampler,
+        reservation: Reservation,
+        traceid: Optional[str] = None,
+        parent_id: Optional[str] = None,
+    ) -> None:
+        super().__init__(name, traceid=traceid, parent_id=parent_id)
+        self._tail_sampler = tail_sampler
+        self._reservation = reservation
+        self._buffered_spans = 0
+        self._dropped_spans = 0
+        self._pending = True
+
+        # return the budget even if the request never ends,
+        # for example when the client disconnects
+        weakref.finalize(self, tail_sampler.release, reservation)
+
+    @property
+    def pending(self) -> bool:
+        return self._pending
+
+    def admit(self) -> bool:
+        """
+        Reserves room for another span while the decision is pending.
+        Returns :code:`False` if the span should not be recorded.
+        """
+        if not self._pending:
+            return True
+
+        if self._buffered_spans < self._tail_sampler.max_spans and (
+            self._tail_sampler.reserve(self._reservation)
+        ):
+            self._buffered_spans += 1
+            return True
+
+        self._dropped_spans += 1
+        return False
+
+    def decide(self, response: BaseHTTPResponse) -> bool:
+        """
+        Makes the sampling decision for the request and frees the
+        buffer. Dropped segments are not sampled anymore, so they
+        are never serialized or sent.
+        """
+        keep = self._tail_sampler.should_keep(self, response)
+
+        self._pending = False
+        self._tail_sampler.release(self._reservation)
+
+        if keep:
+            self._tail_sampler.kept += 1
+            if self._dropped_spans:
+                self.put_metadata(
+                    "dropped_spans", self._dropped_spans, "incendiary"
+                )
+        else:
+            self._tail_sampler.dropped += 1
+            self.sampled = False
+            self.subsegments = []
+
+        return keep
+
+    def deferred_trace_header(self, entity) -> str:
+        """
+        The trace header to propagate while the decision is pending.
+        """
+        return TraceHeader(
+            root=self.trace_id, parent=entity.id, sampled="?"
+        ).to_header_str()
+
+    def ready_to_send(self) -> bool:
+        return not self._pending and super().ready_to_send()
+
+    def to_dict(self) -> dict:
+        segment_dict = super().to_dict()
+
+        for key in (
+            "_tail_sampler",
+            "_reservation",
+            "_buffered_spans",
+            "_dropped_spans",
+            "_pending",
+        ):
+            segment_dict.pop(key, None)
+
+        return segment_dict
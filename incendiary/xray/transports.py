@@ -0,0 +1,134 @@
+"""
+Connection pools that record the phases of interservice requests.
+
+These build on the internals of httpcore 0.11, that httpx 0.15 uses,
+so they are only imported when :code:`INCENDIARY_XRAY_CONNECTION_PHASES`
+is set.
+"""
+from time import perf_counter
+from typing import AsyncIterator, Optional
+
+import httpcore
+from httpcore._async.connection import AsyncHTTPConnection
+
+from incendiary.xray.hooks import connection_phases
+
+
+class TimedByteStream(httpcore.AsyncByteStream):
+    """
+    A response stream that records how long reading the body took.
+    """
+
+    def __init__(self, stream: httpcore.AsyncByteStream, phases: dict) -> None:
+        self.stream = stream
+        self.phases = phases
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        started = perf_counter()
+        try:
+            async for chunk in self.stream:
+                yield chunk
+        finally:
+            self.phases["body"] = perf_counter() - started
+
+    async def aclose(self) -> None:
+        await self.stream.aclose()
+
+
+class TracingHTTPConnection(AsyncHTTPConnection):
+    """
+    A connection that records the time it took to connect and the
+    time to the first byte of the response.
+    """
+
+    async def _open_socket(self, timeout: dict = None):
+        started = perf_counter()
+        try:
+            return await super()._open_socket(timeout)
+        finally:
+            phases = connection_phases.get()
+            if phases is not None:
+                phases["connect"] = perf_counter() - started
+
+    async def arequest(self, *args, **kwargs):
+        phases = connection_phases.get()
+        if phases is None:
+            return await super().arequest(*args, **kwargs)
+
+        started = perf_counter()
+        phases["pool"] = started - phases.pop("started", started)
+
+        response = await super().arequest(*args, **kwargs)
+
+        phases["first_byte"] = (
+            perf_counter() - started - phases.get("connect", 0.0)
+        )
+        return response
+
+
+class TracingConnectionPool(httpcore.AsyncConnectionPool):
+    """
+    A connection pool that, while :code:`connection_phases` is set,
+    records how long a request waited for a connection (:code:`pool`),
+    connecting if a new connection was opened (:code:`connect`), the
+    time to the first byte of the response (:code:`first_byte`) and
+    reading the body (:code:`body`), in seconds.
+
+    Resolving the host, the TCP connection and the TLS handshake are
+    one :code:`connect` phase, since httpcore opens them together.
+    """
+
+    @classmethod
+    def from_pool(cls, pool) -> Optional["TracingConnectionPool"]:
+        """
+        A tracing pool with the same configuration as :code:`pool`,
+        like the one httpx creates for a client, or :code:`None` if
+        :code:`pool` isn't a pool of the httpcore this was made for.
+        """
+        if type(pool) is not httpcore.AsyncConnectionPool:
+            return None
+
+        try:
+            traced = cls(
+                ssl_context=pool._ssl_context,
+                max_connections=pool._max_connections,
+                max_keepalive_connections=pool._max_keepalive_connections,
+                keepalive_expiry=pool._keepalive_expiry,
+                http2=pool._http2,
+                uds=pool._uds,
+                local_address=pool._local_address,
+            )
+            traced._backend = pool._backend
+        except (AttributeError, TypeError):
+            return None
+        return traced
+
+    def _create_connection(self, origin: tuple) -> AsyncHTTPConnection:
+        return TracingHTTPConnection(
+            origin=origin,
+            http2=self._http2,
+            uds=self._uds,
+            ssl_context=self._ssl_context,
+            local_address=self._local_address,
+            backend=self._backend,
+        )
+
+    async def arequest(self, *args, **kwargs):
+        phases = connection_phases.get()
+        if phases is None:
+            return await super().arequest(*args, **kwargs)
+
+        # only the last attempt of a request is recorded
+        phases.clear()
+        phases["started"] = perf_counter()
+
+        try:
+            status_code, headers, stream, ext = await super().arequest(
+                *args, **kwargs
+            )
+        finally:
+            started = phases.pop("started", None)
+            if started is not None:
+                # failed before getting a connection
+                phases["pool"] = perf_counter() - started
+        return status_code, headers, TimedByteStream(stream, phases), ext
@@ -1,9 +1,12 @@
+import fnmatch
 import re
-from typing import Optional, Any
+from typing import Optional, Any, Callable, Iterable, Sequence
 
+from sanic.exceptions import SanicException
 from sanic.request import File
 
 from insanic.conf import settings
+from insanic.functional import empty
 
 
 HIDDEN_KEY_WORDS = [
@@ -25,6 +28,26 @@ HIDDEN_SETTINGS = re.compile(
 
 CLEANSED_SUBSTITUTE: str = "*********"
 
+#: Path segments that are most likely ids: numbers, uuids and hex ids.
+ID_PATH_SEGMENT = re.compile(
+    r"(?<=/)(?:\d+|[0-9a-fA-F]{8}-?(?:[0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}"
+    r"|[0-9a-fA-F]{24,})(?=/|$)"
+)
+
+#: The parameters in the template of a Sanic route, like :code:`<id:int>`.
+ROUTE_PARAMETER = re.compile(r"<[^>]*>")
+
+#: Request attributes that are parsed on access, mapped to the
+#: attribute the parsed value is cached in.
+LAZY_REQUEST_ATTRIBUTES = {
+    "args": "parsed_args",
+    "cookies": "_cookies",
+    "data": "_data",
+    "files": "parsed_files",
+    "form": "parsed_form",
+    "json": "parsed_json",
+}
+
 
 def tracing_name(name: Optional[str] = None) -> str:
     """
@@ -36,6 +59,131 @@ def tracing_name(name: Optional[str] = None) -> str:
     return f"{name}.{settings.ENVIRONMENT.lower()}"
 
 
+def request_route(request) -> Optional[str]:
+    """
+    The template of the route the request was routed to, or :code:`None`
+    if it wasn't routed, or is routed by host. Sanic only sets
+    :code:`uri_template` after the request middlewares have run, so
+    until then the route is looked up from the router, which has
+    cached the lookup Sanic made for the request.
+    """
+    route = request.uri_template
+    if route is None:
+        try:
+            route = request.app.router.get(request)[3]
+        except SanicException:
+            return None
+
+    # routes of virtual hosts are prefixed with the host
+    return route if route.startswith("/") else None
+
+
+def match_route(
+    pattern: str, wildcards: str, route_parts: Sequence[str]
+) -> Optional[bool]:
+    """
+    Matches a glob against every path of a route with parameters, given
+    the literal parts of its template. Only the literal prefix and suffix
+    of the glob are compared with the route's, so if it can't be decided
+    without the path, :code:`None` is returned.
+
+    :param pattern: The glob to match.
+    :param wildcards: The characters that are not literal in the glob.
+    :param route_parts: The literal parts of the route's template, split
+        by its parameters.
+    :return: :code:`True` if all the paths match, :code:`False` if none
+        do, or :code:`None` if it depends on the path.
+    """
+    parts = re.split(f"[{re.escape(wildcards)}]", pattern)
+    prefix, suffix = parts[0], parts[-1]
+    first, last = route_parts[0], route_parts[-1]
+
+    if not (first.startswith(prefix) or prefix.startswith(first)) or not (
+        last.endswith(suffix) or suffix.endswith(last)
+    ):
+        return False
+
+    if (
+        pattern == f"{prefix}*{suffix}"
+        and first.startswith(prefix)
+        and last.endswith(suffix)
+    ):
+        return True
+    return None
+
+
+def compile_endpoint_matcher(
+    endpoints: Iterable[str],
+) -> Callable[[Optional[str], str], bool]:
+    """
+    Compiles the endpoints excluded from tracing into a single
+    matcher that returns :code:`True` if the request should not be
+    traced, given the template of its route and its path.
+
+    An endpoint can be an exact path (:code:`/metrics/`), a prefix
+    ending with :code:`*` (:code:`/static/*`) or a glob (:code:`*.png`).
+    Decisions are cached by route. The path is only matched for routes
+    whose parameters could decide if an endpoint matches, or if the
+    request's route is not known.
+    """
+    endpoints = tuple(endpoints)
+    exact = set()
+    prefixes = []
+    globs = []
+
+    for endpoint in endpoints:
+        if not any(c in endpoint for c in "*?["):
+            exact.add(endpoint)
+        elif endpoint.endswith("*") and not any(
+            c in endpoint[:-1] for c in "*?["
+        ):
+            prefixes.append(endpoint[:-1])
+        else:
+            globs.append(fnmatch.translate(endpoint))
+
+    exact = frozenset(exact)
+    prefixes = tuple(prefixes)
+    pattern = re.compile("|".join(globs)) if globs else None
+
+    def matches(path: str) -> bool:
+        return (
+            path in exact
+            or path.startswith(prefixes)
+            or (pattern is not None and pattern.match(path) is not None)
+        )
+
+    def decide(route: Optional[str]) -> Optional[bool]:
+        if route is None:
+            return None
+
+        route_parts = ROUTE_PARAMETER.split(route)
+        if len(route_parts) == 1:
+            return matches(route)
+
+        matched = {
+            match_route(endpoint, "*?[]", route_parts) for endpoint in endpoints
+        }
+        if True in matched:
+            return True
+        if None in matched:
+            return None
+        return False
+
+    decisions = {}
+
+    def is_excluded(route: Optional[str], path: str) -> bool:
+        try:
+            decision = decisions[route]
+        except KeyError:
+            decision = decisions[route] = decide(route)
+
+        if decision is None:
+            return matches(path)
+        return decision
+
+    return is_excluded
+
+
 def abbreviate_for_xray(payload: dict) -> dict:
     """
     If the payload includes a file, the file is translated
@@ -50,22 +198,44 @@ def abbreviate_for_xray(payload: dict) -> dict:
     return payload
 
 
-def cleanse_value(key: str, value: Any):
+def is_materialized(request, attr: str) -> bool:
+    """
+    Checks if accessing the request attribute would be free. Attributes
+    that need parsing are only considered materialized if they have
+    already been parsed and cached on the request.
+    """
+    cache_attr = LAZY_REQUEST_ATTRIBUTES.get(attr)
+    if cache_attr is None:
+        return True
+
+    cached = getattr(request, cache_attr, None)
+    return cached is not None and cached is not empty and bool(cached)
+
+
+def cleanse_value(key: str, value: Any, depth: Optional[int] = None):
     """
     Cleanse an individual setting key/value of sensitive content.
     If the value is a dictionary, recursively cleanse the keys in
-    that dictionary.
+    that dictionary, and the items of lists.
+
+    :param depth: How many levels of nested dictionaries and lists are
+        cleansed. Deeper ones are substituted, since their keys were not
+        checked. :code:`None` for no limit.
     """
+    deeper = None if depth is None else depth - 1
     try:
         if HIDDEN_SETTINGS.search(key):
             cleansed = CLEANSED_SUBSTITUTE
+        elif depth == 0 and isinstance(value, (dict, list)):
+            cleansed = CLEANSED_SUBSTITUTE
+        elif isinstance(value, dict):
+            cleansed = dict(
+                (k, cleanse_value(k, v, deeper)) for k, v in value.items()
+            )
+        elif isinstance(value, list):
+            cleansed = [cleanse_value(key, v, deeper) for v in value]
         else:
-            if isinstance(value, dict):
-                cleansed = dict(
-                    (k, cleanse_value(k, v)) for k, v in value.items()
-                )
-            else:
-                cleansed = value
+            cleansed = value
     except TypeError:
         # If the key isn't regex-able, just return as-is.
         cleansed = value
@@ -73,13 +243,17 @@ def cleanse_value(key: str, value: Any):
     return cleansed
 
 
-def get_safe_dict(target: dict) -> dict:
+def get_safe_dict(target: dict, max_depth: Optional[int] = None) -> dict:
     """
     Returns a dictionary with sensitive settings blurred out.
+
+    :param max_depth: How many levels of nested dictionaries and lists
+        are cleansed, to limit the cost of large documents. Deeper ones
+        are substituted. :code:`None` for no limit.
     """
     return_value = {}
     for k in target:
-        return_value[k] = cleanse_value(k, target.get(k))
+        return_value[k] = cleanse_value(k, target.get(k), max_depth)
     return return_value
 
 
@@ -91,3 +265,11 @@ def get_safe_settings() -> dict:
     return get_safe_dict(
         {k: getattr(settings, k) for k in dir(settings) if k.isupper()}
     )
+
+
+def route_template(path: str) -> str:
+    """
+    The path with the segments that look like ids replaced with
+    :code:`{id}`, so requests to the same route can be grouped.
+    """
+    return ID_PATH_SEGMENT.sub("{id}", path)
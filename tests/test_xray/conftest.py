@@ -5,6 +5,7 @@ from insanic import Insanic
 
 
 from incendiary.xray.app import Incendiary
+from incendiary.xray.daemon import FakeDaemon
 
 from .utils import StubbedEmitter
 
@@ -46,3 +47,9 @@ def incendiary_application():
     Incendiary.init_app(app, AsyncAWSXRayRecorder())
 
     return app
+
+
+@pytest.fixture()
+def xray_daemon():
+    with FakeDaemon() as daemon:
+        yield daemon
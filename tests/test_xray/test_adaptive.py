@@ -0,0 +1,122 @@
+import asyncio
+import time
+
+import pytest
+
+from aws_xray_sdk.core.models.trace_header import TraceHeader
+
+from incendiary.xray import adaptive
+from incendiary.xray.adaptive import SCALE_INCREASE, LoadController
+from incendiary.xray.sampling import IncendiaryDefaultSampler
+
+from .utils import get_new_stubbed_recorder
+
+
+class TestLoadController:
+    @pytest.fixture()
+    def controller(self):
+        return LoadController(
+            interval=0.05, max_lag=0.01, max_overhead=0.1, min_scale=0.1
+        )
+
+    @pytest.mark.parametrize(
+        "lag, overhead", ((0.02, 0.0), (0.0, 0.2), (0.02, 0.2))
+    )
+    def test_scales_down_under_pressure(self, controller, lag, overhead):
+        controller.lag = lag
+        controller.overhead = overhead
+
+        controller.adjust()
+        assert controller.scale == 0.5
+
+        for _ in range(5):
+            controller.adjust()
+        assert controller.scale == 0.1
+
+    def test_scales_up_without_pressure(self, controller):
+        controller.scale = 0.1
+
+        controller.adjust()
+        assert controller.scale == pytest.approx(0.1 + SCALE_INCREASE)
+
+        for _ in range(int(1 / SCALE_INCREASE) + 1):
+            controller.adjust()
+        assert controller.scale == 1.0
+
+    def test_admit(self, controller, monkeypatch):
+        assert controller.admit() is True
+
+        controller.scale = 0.5
+        monkeypatch.setattr(adaptive.random, "random", lambda: 0.6)
+        assert controller.admit() is False
+
+        monkeypatch.setattr(adaptive.random, "random", lambda: 0.4)
+        assert controller.admit() is True
+
+    async def test_measures_loop_lag(self, controller):
+        controller.start(asyncio.get_event_loop())
+
+        # block the loop past the interval
+        time.sleep(0.1)
+        await asyncio.sleep(0.01)
+
+        assert controller.lag >= 0.04
+        assert controller.scale == 0.5
+
+        controller.stop()
+        assert controller._handle is None
+
+    async def test_measures_overhead(self, controller):
+        controller.start(asyncio.get_event_loop())
+        controller.record(0.05)
+
+        await asyncio.sleep(0.06)
+        controller.stop()
+
+        assert controller.overhead > 0.1
+        assert controller.scale == 0.5
+
+
+class TestAdaptiveSampling:
+    @pytest.fixture()
+    def sampler(self, insanic_application, monkeypatch):
+        monkeypatch.setattr(
+            insanic_application.config, "INCENDIARY_XRAY_ENABLED", True
+        )
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_ADAPTIVE_SAMPLING",
+            True,
+        )
+        return IncendiaryDefaultSampler(insanic_application)
+
+    def test_disabled_by_default(self, insanic_application):
+        sampler = IncendiaryDefaultSampler(insanic_application)
+
+        assert sampler.load_controller is None
+        assert (
+            sampler.effective_rate == sampler._local_sampler._default_rule.rate
+        )
+
+    def test_effective_rate(self, sampler):
+        rate = sampler._local_sampler._default_rule.rate
+        assert sampler.effective_rate == rate
+
+        sampler.load_controller.scale = 0.5
+        assert sampler.effective_rate == rate * 0.5
+
+    def test_sampling_decision(self, sampler, monkeypatch):
+        recorder = get_new_stubbed_recorder()
+        monkeypatch.setattr(sampler, "should_trace", lambda sampling_req: True)
+        monkeypatch.setattr(sampler.load_controller, "admit", lambda: False)
+
+        decision = sampler.calculate_sampling_decision(
+            TraceHeader(), recorder, "test", "GET", "/"
+        )
+        assert decision == 0
+
+        # upstream decisions are not scaled
+        decision = sampler.calculate_sampling_decision(
+            TraceHeader(sampled=1), recorder, "test", "GET", "/"
+        )
+        assert decision == 1
@@ -0,0 +1,84 @@
+import pytest
+
+from aws_xray_sdk.core.models.segment import Segment
+
+from incendiary.xray.aggregation import (
+    LATENCY_BUCKETS,
+    CallAggregator,
+    CallSummary,
+)
+from incendiary.xray.tail_sampling import (
+    Reservation,
+    TailSampler,
+    TailSegment,
+)
+
+KEY = ("userservice", "GET", "/api/v1/users/{id}")
+
+
+class TestCallAggregator:
+    @pytest.fixture()
+    def segment(self):
+        return Segment("segment")
+
+    def test_threshold(self, segment):
+        aggregator = CallAggregator(2)
+
+        assert aggregator.summary(segment, KEY) is None
+        assert aggregator.summary(segment, KEY) is None
+
+        summary = aggregator.summary(segment, KEY)
+        assert isinstance(summary, CallSummary)
+        assert aggregator.summary(segment, KEY) is summary
+        assert segment.subsegments == [summary.subsegment]
+
+        # other routes and segments are counted separately
+        other = ("userservice", "POST", "/api/v1/users/")
+        assert aggregator.summary(segment, other) is None
+        assert aggregator.summary(Segment("other"), KEY) is None
+
+    def test_close(self, segment):
+        aggregator = CallAggregator(0)
+        summary = aggregator.summary(segment, KEY)
+        start = summary.subsegment.start_time
+
+        summary.record(start, start + 0.003, error=False)
+        summary.record(start + 0.001, start + 0.0015, error=True)
+        summary.record(start + 0.002, start + 5, error=False)
+        assert segment.ref_counter.value == 1
+
+        aggregator.close(segment)
+
+        subsegment = summary.subsegment
+        assert not subsegment.in_progress
+        assert subsegment.end_time == start + 5
+        assert subsegment.error is True
+        assert subsegment.http["request"] == {
+            "method": "GET",
+            "url": "/api/v1/users/{id}",
+        }
+
+        stats = subsegment.metadata["summary"]
+        assert stats["count"] == 3
+        assert stats["total"] == pytest.approx(5.0015, abs=1e-6)
+        assert stats["min"] == pytest.approx(0.0005, abs=1e-6)
+        assert stats["max"] == pytest.approx(4.998, abs=1e-6)
+        assert stats["errors"] == 1
+        assert stats["buckets"] == LATENCY_BUCKETS
+        # 0.5ms, 3ms and 4998ms
+        assert stats["histogram"] == [1, 0, 1, 0, 0, 0, 0, 0, 0, 0, 0, 1]
+
+        assert segment.ref_counter.value == 0
+        # closing again does nothing
+        aggregator.close(segment)
+
+    def test_tail_segment_full(self):
+        tail_sampler = TailSampler(
+            latency=1, min_status=500, max_spans=0, memory_budget=10000
+        )
+        segment = TailSegment("segment", tail_sampler, Reservation())
+        aggregator = CallAggregator(0)
+
+        assert aggregator.summary(segment, KEY) is None
+        assert aggregator.summary(segment, KEY) is None
+        assert segment.subsegments == []
@@ -0,0 +1,81 @@
+import pytest
+
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.analysis import (
+    analyze_interservice,
+    busy_time,
+    critical_path,
+    interservice_subsegments,
+    peak_concurrency,
+)
+
+
+def call(parent, name, start, end, namespace="remote"):
+    segment = getattr(parent, "parent_segment", parent)
+    subsegment = Subsegment(name, namespace, segment)
+    parent.add_subsegment(subsegment)
+    subsegment.start_time = start
+    if end is not None:
+        subsegment.close(end)
+    return subsegment
+
+
+class TestAnalyzeInterservice:
+    @pytest.fixture()
+    def segment(self):
+        segment = Segment("segment")
+        # gathered
+        a = call(segment, "a", 0, None)
+        call(a, "attempt 1", 0, 1)
+        a.close(1)
+        call(segment, "b", 0, 3)
+        # then one after the other
+        call(segment, "c", 3, 4)
+        captured = call(segment, "captured", 4, None, namespace="local")
+        call(captured, "e", 4, 6)
+        # never awaited
+        call(segment, "f", 5, None)
+        return segment
+
+    def test_subsegments(self, segment):
+        found = interservice_subsegments(segment)
+
+        assert sorted(s.name for s in found) == ["a", "b", "c", "e"]
+
+    def test_analysis(self, segment):
+        assert analyze_interservice(segment) == {
+            "calls": 4,
+            "peak": 2,
+            "busy": 6,
+            "parallelism": 1.17,
+            "critical_path": ["b", "c", "e"],
+            "critical_time": 6,
+        }
+
+    def test_single_call(self):
+        segment = Segment("segment")
+        call(segment, "a", 0, 1)
+
+        assert analyze_interservice(segment) is None
+
+    @pytest.mark.parametrize(
+        "intervals, peak, busy, path",
+        [
+            ([(0, 1), (1, 2), (2, 3)], 1, 3, [0, 1, 2]),
+            ([(0, 3), (1, 2), (1, 2)], 3, 3, [0]),
+            ([(0, 1), (0, 2), (2, 5), (1.5, 3)], 2, 5, [1, 2]),
+            ([(0, 1), (5, 6)], 1, 2, [0, 1]),
+        ],
+    )
+    def test_intervals(self, intervals, peak, busy, path):
+        segment = Segment("segment")
+        subsegments = [
+            call(segment, str(i), start, end)
+            for i, (start, end) in enumerate(intervals)
+        ]
+
+        assert peak_concurrency(subsegments) == peak
+        assert busy_time(subsegments) == busy
+        assert critical_path(subsegments) == [subsegments[i] for i in path]
@@ -2,9 +2,12 @@ import asyncio
 import pytest
 
 from aws_xray_sdk.core import xray_recorder
+from aws_xray_sdk.core.context import Context
 
 from incendiary.xray import Incendiary
 from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.entities import UnsampledSegment
+from incendiary.xray.mixins import ROLLED_UP_KEY, ROLLED_UP_NAMESPACE
 
 
 class TestCaptureAsync:
@@ -123,6 +126,41 @@ class TestCaptureAsync:
 
         configured_xray_recorder.end_segment()
 
+    async def test_capture_async_unsampled(
+        self, configured_xray_recorder, monkeypatch
+    ):
+        def record_subsegment_async(*args, **kwargs):  # pragma: no cover
+            raise AssertionError("unsampled calls are not recorded")
+
+        monkeypatch.setattr(
+            configured_xray_recorder,
+            "record_subsegment_async",
+            record_subsegment_async,
+        )
+        configured_xray_recorder.context.put_segment(UnsampledSegment())
+
+        await self.async_main()
+
+        assert self.counter == 1
+        configured_xray_recorder.context.clear_trace_entities()
+
+    async def test_capture_async_unsampled_segment(
+        self, configured_xray_recorder
+    ):
+        segment = configured_xray_recorder.begin_segment(
+            "test_capture_async_unsampled_segment", sampling=False
+        )
+
+        await asyncio.gather(*[self.async_main() for _ in range(10)])
+
+        assert self.counter == 10
+        assert segment.subsegments == []
+        configured_xray_recorder.end_segment()
+
+    def test_capture_async_decorated(self):
+        assert self.async_main.__name__ == "async_main"
+        assert asyncio.iscoroutinefunction(self.async_main)
+
     async def test_capture_async_without_incendiary_initialize(self, caplog):
         from incendiary.loggers import error_logger
         from incendiary.xray.mixins import CAPTURE_WARNING
@@ -147,3 +185,120 @@ class TestCaptureAsync:
             return "capture_sync"
 
         capture_sync()
+
+
+class TestCaptureMinDuration:
+    @Incendiary.capture_async("fast", min_duration=1)
+    async def fast(self):
+        pass
+
+    @Incendiary.capture_async("slow", min_duration=0.01)
+    async def slow(self):
+        await asyncio.sleep(0.02)
+
+    @Incendiary.capture_async("fails", min_duration=1)
+    async def fails(self):
+        raise ValueError("fails")
+
+    @Incendiary.capture_async("outer", min_duration=1)
+    async def outer(self):
+        await self.fast()
+        self.fast_sync()
+
+    @Incendiary.capture("fast_sync", min_duration=1)
+    def fast_sync(self):
+        pass
+
+    @Incendiary.capture_async("default")
+    async def default(self):
+        pass
+
+    @pytest.fixture()
+    def segment(self):
+        xray_recorder.configure(
+            service="test",
+            sampling=False,
+            context=IncendiaryAsyncContext(),
+            daemon_address="localhost:2000",
+        )
+        segment = xray_recorder.begin_segment("test_capture_min_duration")
+        yield segment
+        xray_recorder.end_segment()
+
+    @staticmethod
+    def rolled_up(entity):
+        return entity.metadata[ROLLED_UP_NAMESPACE][ROLLED_UP_KEY]
+
+    async def test_fast(self, segment):
+        for _ in range(3):
+            await self.fast()
+        self.fast_sync()
+
+        assert segment.subsegments == []
+        rolled_up = self.rolled_up(segment)
+        assert rolled_up.keys() == {"fast", "fast_sync"}
+        assert rolled_up["fast"]["count"] == 3
+        assert 0 <= rolled_up["fast"]["total"] < 3
+        assert rolled_up["fast_sync"]["count"] == 1
+        assert segment.ref_counter.value == 0
+        assert segment.get_total_subsegments_size() == 0
+
+    async def test_slow(self, segment):
+        await self.slow()
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.name == "slow"
+        assert ROLLED_UP_NAMESPACE not in segment.metadata
+
+    async def test_exception(self, segment):
+        with pytest.raises(ValueError):
+            await self.fails()
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.fault is True
+        assert subsegment.cause["exceptions"][0].type == "ValueError"
+
+    async def test_nested(self, segment):
+        await self.outer()
+
+        assert segment.subsegments == []
+        rolled_up = self.rolled_up(segment)
+        assert {name: c["count"] for name, c in rolled_up.items()} == {
+            "outer": 1,
+            "fast": 1,
+            "fast_sync": 1,
+        }
+
+    async def test_global(self, segment, insanic_application, monkeypatch):
+        monkeypatch.setattr(Incendiary, "app", insanic_application)
+        await self.default()
+        assert len(segment.subsegments) == 1
+
+        # read when the function is called, not when it is decorated
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_CAPTURE_MIN_DURATION",
+            1,
+        )
+        await self.default()
+
+        assert len(segment.subsegments) == 1
+        assert self.rolled_up(segment)["default"]["count"] == 1
+
+    async def test_other_context(self):
+        # the entities are not in IncendiaryAsyncContext's variable
+        xray_recorder.configure(
+            service="test",
+            sampling=False,
+            context=Context(),
+            daemon_address="localhost:2000",
+        )
+        segment = xray_recorder.begin_segment("test_other_context")
+        try:
+            await self.fast()
+            self.fast_sync()
+        finally:
+            xray_recorder.end_segment()
+
+        assert segment.subsegments == []
+        assert self.rolled_up(segment).keys() == {"fast", "fast_sync"}
@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core.exceptions.exceptions import SegmentNotFoundException
+
+from incendiary.xray.contexts import IncendiaryAsyncContext
+
+from .utils import get_new_stubbed_recorder
+
+
+class TestIncendiaryAsyncContext:
+    @pytest.fixture()
+    def recorder(self):
+        global_sdk_config.set_sdk_enabled(True)
+        recorder = get_new_stubbed_recorder()
+        recorder.configure(context=IncendiaryAsyncContext())
+        return recorder
+
+    async def test_no_task_factory(self):
+        loop = asyncio.get_event_loop()
+        task_factory = loop.get_task_factory()
+
+        IncendiaryAsyncContext()
+
+        assert loop.get_task_factory() is task_factory
+
+    async def test_child_tasks(self, recorder):
+        segment = recorder.begin_segment("segment", sampling=1)
+
+        async def child(name):
+            subsegment = recorder.begin_subsegment(name)
+            await asyncio.sleep(0)
+            assert recorder.current_subsegment() is subsegment
+            recorder.end_subsegment()
+            return subsegment
+
+        subsegments = await asyncio.gather(child("a"), child("b"))
+
+        # concurrent subsegments are both children of the segment
+        assert segment.subsegments == subsegments
+        assert all(s.parent_id == segment.id for s in subsegments)
+        assert recorder.get_trace_entity() is segment
+
+    async def test_child_task_doesnt_change_parent(self, recorder):
+        recorder.begin_segment("segment", sampling=1)
+        outer = recorder.begin_subsegment("outer")
+
+        async def child():
+            recorder.begin_subsegment("inner")
+
+        await asyncio.get_event_loop().create_task(child())
+
+        assert recorder.get_trace_entity() is outer
+        assert outer.subsegments[0].name == "inner"
+
+    async def test_end_subsegment(self, recorder):
+        segment = recorder.begin_segment("segment", sampling=1)
+
+        assert recorder.context.end_subsegment() is False
+
+        recorder.begin_subsegment("outer")
+        inner = recorder.begin_subsegment("inner")
+
+        assert recorder.context.end_subsegment() is True
+        assert inner.in_progress is False
+        recorder.end_subsegment()
+
+        assert recorder.get_trace_entity() is segment
+
+    async def test_clear_trace_entities(self, recorder):
+        recorder.begin_segment("segment", sampling=1)
+
+        recorder.clear_trace_entities()
+
+        assert recorder.context.get_trace_entity() is None
+
+    async def test_context_missing(self, recorder):
+        recorder.context.context_missing = "RUNTIME_ERROR"
+
+        with pytest.raises(SegmentNotFoundException):
+            recorder.context.get_trace_entity()
+
+    async def test_sdk_disabled(self, recorder):
+        global_sdk_config.set_sdk_enabled(False)
+        try:
+            assert recorder.context.get_trace_entity().name == "dummy"
+        finally:
+            global_sdk_config.set_sdk_enabled(True)
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import socket
+
+import pytest
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core.context import Context
+from aws_xray_sdk.core.emitters.udp_emitter import (
+    PROTOCOL_DELIMITER,
+    PROTOCOL_HEADER,
+)
+
+from incendiary.xray.daemon import FakeDaemon, main
+from incendiary.xray.emitters import IncendiaryEmitter
+
+from .utils import get_new_stubbed_recorder
+
+
+def datagram(document) -> bytes:
+    return f"{PROTOCOL_HEADER}{PROTOCOL_DELIMITER}{document}".encode()
+
+
+class TestFakeDaemon:
+    @pytest.fixture()
+    def sock(self, xray_daemon):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((xray_daemon.host, xray_daemon.port))
+        yield sock
+        sock.close()
+
+    def test_counts(self, xray_daemon, sock):
+        segment = {"name": "a", "id": "1", "trace_id": "t"}
+        subsegment = dict(segment, type="subsegment")
+
+        sock.send(datagram(json.dumps(segment)))
+        sock.send(datagram(json.dumps(subsegment)))
+        sock.send(b"not a datagram")
+        sock.send(datagram("{not json"))
+        sock.send(datagram(json.dumps({"name": "no id"})))
+
+        assert xray_daemon.wait_for(5) is True
+
+        stats = xray_daemon.stats()
+        assert stats["received"] == 2
+        assert stats["segments"] == 1
+        assert stats["subsegments"] == 1
+        assert stats["malformed"] == 3
+        assert stats["oversized"] == 0
+        assert xray_daemon.documents == [segment, subsegment]
+
+    def test_oversized(self, sock):
+        with FakeDaemon(max_size=100) as daemon:
+            sock.connect((daemon.host, daemon.port))
+            sock.send(datagram(json.dumps({"name": "x" * 100})))
+            sock.send(datagram(json.dumps({"name": "x"}))[:100])
+
+            assert daemon.wait_for(2) is True
+            assert daemon.oversized == 1
+            assert daemon.malformed == 1
+
+    def test_max_size(self, xray_daemon):
+        # the largest datagram the emitter sends
+        assert xray_daemon.max_size == 65507
+
+    def test_wait_for_timeout(self, xray_daemon):
+        assert xray_daemon.wait_for(1, timeout=0.01) is False
+
+    def test_reset(self, xray_daemon, sock):
+        sock.send(b"malformed")
+        xray_daemon.wait_for(1)
+
+        xray_daemon.reset()
+
+        assert xray_daemon.stats()["malformed"] == 0
+        assert xray_daemon.stats()["documents_per_second"] == 0
+
+    def test_main(self, xray_daemon, monkeypatch, capsys):
+        def interrupt(seconds):
+            raise KeyboardInterrupt
+
+        monkeypatch.setattr("incendiary.xray.daemon.time.sleep", interrupt)
+
+        main(["--port", "0"])
+
+        assert capsys.readouterr().out.startswith("Listening on 127.0.0.1:")
+
+
+class TestEmitterToDaemon:
+    @pytest.fixture()
+    async def emitter(self, xray_daemon):
+        emitter = IncendiaryEmitter(xray_daemon.address, flush_interval=0.01)
+        await emitter.start(asyncio.get_event_loop())
+        yield emitter
+        await emitter.close()
+
+    @pytest.fixture()
+    def recorder(self, emitter):
+        global_sdk_config.set_sdk_enabled(True)
+        recorder = get_new_stubbed_recorder()
+        recorder.configure(context=Context(), emitter=emitter)
+        return recorder
+
+    async def test_segments(self, recorder, xray_daemon):
+        for i in range(20):
+            recorder.begin_segment(f"segment-{i}", sampling=1)
+            recorder.begin_subsegment("query")
+            recorder.end_subsegment()
+            recorder.end_segment()
+
+        await asyncio.sleep(0.05)
+
+        assert xray_daemon.wait_for(20) is True
+        assert xray_daemon.stats()["received"] == 20
+        assert xray_daemon.documents[0]["subsegments"][0]["name"] == "query"
+
+    async def test_large_segment_is_split(self, recorder, xray_daemon):
+        # the segment is too large for one datagram, but every
+        # subsegment fits in a much smaller one
+        xray_daemon.max_size = 40000
+
+        segment = recorder.begin_segment("segment", sampling=1)
+        for i in range(3):
+            recorder.begin_subsegment(f"userip-{i}")
+            recorder.put_annotation("response", "x" * 30000)
+            recorder.end_subsegment()
+        recorder.end_segment()
+
+        await asyncio.sleep(0.05)
+
+        assert xray_daemon.wait_for(4) is True
+        stats = xray_daemon.stats()
+        assert stats["segments"] == 1
+        assert stats["subsegments"] == 3
+        assert stats["malformed"] == stats["oversized"] == 0
+        assert {d["parent_id"] for d in xray_daemon.documents[1:]} == {
+            segment.id
+        }
@@ -0,0 +1,206 @@
+import asyncio
+import json
+import socket
+import threading
+
+import pytest
+
+from aws_xray_sdk.core.models.segment import Segment
+
+from incendiary.xray.app import Incendiary
+from incendiary.xray.emitters import IncendiaryEmitter
+from incendiary.xray.spool import RingSpool
+
+
+class DaemonProtocol(asyncio.DatagramProtocol):
+    def __init__(self):
+        self.received = []
+
+    def datagram_received(self, data, addr):
+        header, document = data.decode().split("\n", 1)
+        self.received.append(json.loads(document))
+
+
+def finished_segment(name: str) -> Segment:
+    segment = Segment(name)
+    segment.close()
+    return segment
+
+
+class TestIncendiaryEmitter:
+    @pytest.fixture()
+    async def daemon(self):
+        loop = asyncio.get_event_loop()
+        transport, protocol = await loop.create_datagram_endpoint(
+            DaemonProtocol, local_addr=("127.0.0.1", 0)
+        )
+        protocol.address = (
+            "127.0.0.1:%d" % transport.get_extra_info("sockname")[1]
+        )
+        yield protocol
+        transport.close()
+
+    @pytest.fixture()
+    async def emitter(self, daemon):
+        emitter = IncendiaryEmitter(
+            daemon.address, queue_size=5, batch_size=2, flush_interval=0.01
+        )
+        await emitter.start(asyncio.get_event_loop())
+        yield emitter
+        await emitter.close()
+
+    async def test_sends_in_batches(self, emitter, daemon):
+        for i in range(5):
+            emitter.send_entity(finished_segment(f"segment-{i}"))
+
+        # nothing is sent on the request's path
+        await asyncio.sleep(0)
+        assert daemon.received == []
+        assert len(emitter._queue) == 5
+
+        await asyncio.sleep(0.05)
+
+        assert [d["name"] for d in daemon.received] == [
+            f"segment-{i}" for i in range(5)
+        ]
+        assert len(emitter._queue) == 0
+
+    async def test_changed_after_emitted(self, emitter, daemon):
+        items = [1]
+        segment = Segment("segment")
+        segment.put_metadata("items", items)
+        segment.close()
+        emitter.send_entity(segment)
+
+        # a handler kept a reference to what it recorded
+        items.append(2)
+        segment.name = "changed"
+
+        await asyncio.sleep(0.05)
+
+        (document,) = daemon.received
+        assert document["name"] == "segment"
+        assert document["metadata"]["default"]["items"] == [1]
+
+    async def test_drops_when_full(self, emitter, daemon):
+        for i in range(7):
+            emitter.send_entity(finished_segment(f"segment-{i}"))
+
+        assert emitter.dropped == 2
+
+        await asyncio.sleep(0.05)
+        assert len(daemon.received) == 5
+
+    async def test_send_from_thread(self, emitter, daemon):
+        thread = threading.Thread(
+            target=emitter.send_entity, args=(finished_segment("thread"),)
+        )
+        thread.start()
+        thread.join()
+
+        await asyncio.sleep(0.05)
+        assert [d["name"] for d in daemon.received] == ["thread"]
+
+    async def test_send_without_get_running_loop(
+        self, emitter, daemon, monkeypatch
+    ):
+        # python 3.6 doesn't have it
+        monkeypatch.delattr(asyncio, "get_running_loop")
+
+        emitter.send_entity(finished_segment("python36"))
+
+        await asyncio.sleep(0.05)
+        assert [d["name"] for d in daemon.received] == ["python36"]
+
+    async def test_close_sends_queue(self, emitter, daemon):
+        for i in range(3):
+            emitter.send_entity(finished_segment(f"segment-{i}"))
+
+        await emitter.close()
+        await asyncio.sleep(0.01)
+
+        assert len(daemon.received) == 3
+        assert emitter._transport is None
+
+    def test_not_started(self, monkeypatch):
+        sent = []
+        emitter = IncendiaryEmitter()
+        monkeypatch.setattr(emitter, "_send_data", sent.append)
+
+        emitter.send_entity(finished_segment("sync"))
+
+        assert len(sent) == 1
+        assert '"name": "sync"' in sent[0]
+
+    def test_xray_config(self, insanic_application, monkeypatch):
+        monkeypatch.setattr(Incendiary, "extra_recorder_configurations", {})
+
+        emitter = Incendiary.xray_config(insanic_application)["emitter"]
+
+        assert isinstance(emitter, IncendiaryEmitter)
+        assert (
+            emitter.queue_size
+            == insanic_application.config.INCENDIARY_XRAY_EMITTER_QUEUE_SIZE
+        )
+
+
+class TestSpooling:
+    @pytest.fixture()
+    def port(self):
+        # a port nothing listens on
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        return port
+
+    @pytest.fixture()
+    async def emitter(self, port, tmp_path):
+        emitter = IncendiaryEmitter(
+            f"127.0.0.1:{port}",
+            flush_interval=0.01,
+            spool=RingSpool(str(tmp_path), 64 * 1024),
+            replay_rate=20,
+            retry_interval=0.2,
+        )
+        await emitter.start(asyncio.get_event_loop())
+        yield emitter
+        await emitter.close()
+
+    async def test_spools_while_unavailable(self, emitter, port):
+        emitter.send_entity(finished_segment("lost"))
+        await asyncio.sleep(0.05)
+
+        assert emitter.available is False
+
+        for i in range(5):
+            emitter.send_entity(finished_segment(f"segment-{i}"))
+        await asyncio.sleep(0.05)
+
+        assert len(emitter.spool) == 5
+
+        loop = asyncio.get_event_loop()
+        transport, daemon = await loop.create_datagram_endpoint(
+            DaemonProtocol, local_addr=("127.0.0.1", port)
+        )
+        await asyncio.sleep(0.25)
+
+        assert emitter.available is True
+        # replayed at 2 entities every 0.1 seconds
+        await asyncio.sleep(0.5)
+        transport.close()
+
+        assert [d["name"] for d in daemon.received] == [
+            f"segment-{i}" for i in range(5)
+        ]
+        assert len(emitter.spool) == 0
+
+    async def test_without_spool(self, port):
+        emitter = IncendiaryEmitter(f"127.0.0.1:{port}", flush_interval=0.01)
+        await emitter.start(asyncio.get_event_loop())
+
+        emitter.send_entity(finished_segment("lost"))
+        await asyncio.sleep(0.05)
+
+        assert emitter.available is True
+        await emitter.close()
@@ -0,0 +1,141 @@
+import asyncio
+import functools
+import threading
+import time
+
+import pytest
+
+from aws_xray_sdk.core import xray_recorder
+
+from incendiary.xray import Incendiary
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.executors import TracingThreadPoolExecutor
+
+from .utils import StubbedEmitter
+
+
+@Incendiary.capture(name="blocking")
+def blocking():
+    return xray_recorder.current_subsegment()
+
+
+class TestTracingThreadPoolExecutor:
+    @pytest.fixture()
+    def recorder(self):
+        xray_recorder.configure(
+            service="test",
+            sampling=False,
+            context=IncendiaryAsyncContext(),
+            emitter=StubbedEmitter(),
+        )
+        yield xray_recorder
+        xray_recorder.context.clear_trace_entities()
+
+    @pytest.fixture()
+    def executor(self, recorder):
+        executor = TracingThreadPoolExecutor(max_workers=1, recorder=recorder)
+        yield executor
+        executor.shutdown()
+
+    async def test_traced(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+        segment = recorder.begin_segment("segment")
+
+        captured = await loop.run_in_executor(executor, blocking)
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.name == "blocking"
+        assert subsegment.subsegments == [captured]
+        assert captured.name == "blocking"
+        assert not subsegment.in_progress
+
+        timings = subsegment.metadata["executor"]
+        assert timings["queue_time"] >= 0
+        assert timings["run_time"] >= 0
+        assert subsegment.end_time - subsegment.start_time >= (
+            timings["run_time"]
+        )
+
+        # the caller's stack is not changed
+        assert recorder.get_trace_entity() is segment
+
+    async def test_queue_time(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+        segment = recorder.begin_segment("segment")
+        release = threading.Event()
+
+        first = loop.run_in_executor(executor, release.wait)
+        second = loop.run_in_executor(executor, time.sleep, 0)
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(first, second)
+
+        waited = {
+            subsegment.name: subsegment.metadata["executor"]["queue_time"]
+            for subsegment in segment.subsegments
+        }
+        assert waited["sleep"] >= 0.05
+        assert waited["wait"] < 0.05
+
+    async def test_partial_name(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+        segment = recorder.begin_segment("segment")
+
+        call = functools.partial(functools.partial(sum, [1]), start=1)
+        assert await loop.run_in_executor(executor, call) == 2
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.name == "sum"
+
+    async def test_exception(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+        segment = recorder.begin_segment("segment")
+
+        def fail():
+            raise ValueError("failed")
+
+        with pytest.raises(ValueError):
+            await loop.run_in_executor(executor, fail)
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.fault or subsegment.error
+        assert "run_time" in subsegment.metadata["executor"]
+
+    async def test_not_sampled(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+        segment = recorder.begin_segment("segment")
+        segment.sampled = False
+
+        def current():
+            return recorder.get_trace_entity()
+
+        assert await loop.run_in_executor(executor, current) is segment
+        assert segment.subsegments == []
+
+    async def test_no_segment(self, recorder, executor):
+        loop = asyncio.get_event_loop()
+
+        assert await loop.run_in_executor(executor, sum, [1, 2]) == 3
+
+    @pytest.mark.parametrize("trace_executor", (True, False))
+    async def test_default_executor(
+        self, insanic_application, monkeypatch, trace_executor
+    ):
+        loop = asyncio.get_event_loop()
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_TRACE_EXECUTOR",
+            trace_executor,
+        )
+        insanic_application.xray_recorder = xray_recorder
+        Incendiary.setup_listeners(insanic_application)
+        (start,) = [
+            listener
+            for listener in insanic_application.listeners["before_server_start"]
+            if listener.__name__ == "before_server_start_start_tracing"
+        ]
+
+        await start(insanic_application, loop)
+
+        thread = await loop.run_in_executor(None, threading.current_thread)
+        assert thread.name.startswith("incendiary") is trace_executor
@@ -1,11 +1,20 @@
 import pytest
+import ujson
 
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+from aws_xray_sdk.core.models.trace_header import TraceHeader
+from aws_xray_sdk.ext.util import inject_trace_header
 from httpx import Request, Response, TransportError
 
+from incendiary.xray import hooks
 from incendiary.xray.hooks import (
     begin_subsegment,
+    capture_response_body,
     end_subsegment,
     end_subsegment_with_exception,
+    trace_header,
+    SubsegmentTemplate,
 )
 
 
@@ -109,8 +118,8 @@ class TestHooks:
         assert end.http["response"]["status"] == response.status_code
 
         if response.status_code >= 400:
-            assert "response" in end.annotations
-            assert end.annotations["response"] == response.text
+            assert "response" not in end.annotations
+            assert end.metadata["response"]["size"] == len(response.content)
             if response.status_code >= 500:
                 assert end.fault is True
             else:
@@ -167,3 +176,134 @@ class TestHooks:
         assert hasattr(end, "end_time")
         assert segment.ref_counter.value == 0
         assert hasattr(end, "cause")
+
+    def test_end_subsegment_without_budget(
+        self, incendiary_application, request_object, segment, subsegment
+    ):
+        end = end_subsegment(
+            request=request_object,
+            response=Response(status_code=500, text="error"),
+            recorder=incendiary_application.xray_recorder,
+            subsegment=subsegment,
+            budget=0,
+        )
+
+        assert end.fault is True
+        assert "response" not in end.metadata
+
+
+class TestSubsegmentTemplate:
+    @pytest.mark.parametrize("sampled", [True, False])
+    @pytest.mark.parametrize("data", [None, {"Lineage": "a:1", "Self": "b"}])
+    def test_trace_header(self, sampled, data):
+        segment = Segment("segment")
+        segment.save_origin_trace_header(TraceHeader(data=data))
+        subsegment = Subsegment("service", "remote", segment)
+        subsegment.sampled = sampled
+        headers = {}
+
+        inject_trace_header(headers, subsegment)
+
+        assert trace_header(subsegment) == headers["X-Amzn-Trace-Id"]
+
+    def test_name(self):
+        assert SubsegmentTemplate("user<service>").name == "userservice"
+
+    def test_begin(self, incendiary_application):
+        recorder = incendiary_application.xray_recorder
+        template = SubsegmentTemplate("userservice")
+        request = Request("POST", "http://userservice:8000/api/v1/?a=1")
+
+        segment = recorder.begin_segment("segment")
+        subsegment = template.begin(request, recorder)
+
+        assert request.give_up is False
+        assert subsegment.name == "userservice"
+        assert subsegment.namespace == "remote"
+        assert subsegment.http == {
+            "request": {"method": "POST", "url": str(request.url)}
+        }
+        assert request.headers["x-amzn-trace-id"] == trace_header(subsegment)
+
+        subsegment.close()
+        recorder.end_segment()
+        assert segment.subsegments == [subsegment]
+
+
+class TestCaptureResponseBody:
+    def json_response(self, body):
+        return Response(
+            status_code=400,
+            content=ujson.dumps(body).encode(),
+            headers={"content-type": "application/json"},
+        )
+
+    def test_json(self):
+        body = {
+            "message": "error",
+            "api_key": "a",
+            "nested": {"token": "b", "errors": [{"password": "c"}]},
+        }
+
+        captured = capture_response_body(self.json_response(body), 1024)
+
+        assert captured["body"] == {
+            "message": "error",
+            "api_key": "*********",
+            "nested": {
+                "token": "*********",
+                "errors": [{"password": "*********"}],
+            },
+        }
+        assert "truncated" not in captured
+
+    def test_json_depth(self, monkeypatch):
+        monkeypatch.setattr(hooks, "ERROR_RESPONSE_DEPTH", 1)
+        body = {"nested": {"message": "a", "deeper": {"token": "b"}}}
+
+        captured = capture_response_body(self.json_response(body), 1024)
+
+        # the keys of deeper objects aren't checked, so they aren't kept
+        assert captured["body"] == {
+            "nested": {"message": "a", "deeper": "*********"}
+        }
+
+    def test_json_over_budget(self):
+        response = self.json_response({"message": "e" * 100})
+
+        captured = capture_response_body(response, 50)
+
+        assert captured == {"size": len(response.content), "truncated": True}
+
+    def test_invalid_json(self):
+        response = Response(
+            status_code=400,
+            content=b"{not json",
+            headers={"content-type": "application/json"},
+        )
+
+        assert capture_response_body(response, 50)["body"] == "{not json"
+
+    def test_text(self):
+        response = Response(status_code=502, text="bad gateway " * 10)
+
+        captured = capture_response_body(response, 11)
+
+        assert captured == {
+            "size": 120,
+            "truncated": True,
+            "body": "bad gateway",
+        }
+
+    def test_empty(self):
+        assert capture_response_body(Response(status_code=500), 10) == {
+            "size": 0
+        }
+
+    def test_not_read(self):
+        async def stream():
+            yield b"error"  # pragma: no cover
+
+        response = Response(status_code=500, stream=stream())
+
+        assert capture_response_body(response, 10) is None
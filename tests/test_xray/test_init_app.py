@@ -5,9 +5,14 @@ from aws_xray_sdk.core import AsyncAWSXRayRecorder
 from insanic.conf import settings
 
 from insanic.exceptions import ImproperlyConfigured
+from insanic.request import Request
+from sanic.response import text
 
 from incendiary.xray.app import Incendiary
 from incendiary.xray.services import IncendiaryService
+from incendiary.xray.utils import request_route
+
+from .utils import get_new_stubbed_recorder
 
 logger = logging.getLogger(__name__)
 
@@ -76,6 +81,170 @@ class TestIncendiaryXRayInitialize:
             m.__name__ for m in insanic_application.response_middleware
         ]
 
+    @pytest.mark.parametrize(
+        "path, traced",
+        (
+            ("/trace", True),
+            ("/static/app.css", False),
+            ("/tracer/health/", False),
+        ),
+    )
+    async def test_excluded_endpoints(
+        self, insanic_application, monkeypatch, path, traced
+    ):
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_EXCLUDED_ENDPOINTS",
+            ("/static/*",),
+        )
+        calls = []
+
+        async def mock_before_request(request):
+            calls.append("before")
+
+        async def mock_after_request(request, response):
+            calls.append("after")
+
+        monkeypatch.setattr(
+            "incendiary.xray.app.before_request", mock_before_request
+        )
+        monkeypatch.setattr(
+            "incendiary.xray.app.after_request", mock_after_request
+        )
+        monkeypatch.setattr(
+            insanic_application,
+            "xray_recorder",
+            get_new_stubbed_recorder(),
+            raising=False,
+        )
+
+        Incendiary.setup_middlewares(insanic_application)
+        start_trace = insanic_application.request_middleware[-1]
+        end_trace = insanic_application.response_middleware[0]
+
+        request = Request(
+            path.encode(), {}, "1.1", "GET", None, insanic_application
+        )
+        await start_trace(request)
+        await end_trace(request, None)
+
+        assert request.ctx.incendiary_traced is traced
+        assert calls == (["before", "after"] if traced else [])
+
+    async def test_end_trace_without_start_trace(self, insanic_application):
+        Incendiary.setup_middlewares(insanic_application)
+        end_trace = insanic_application.response_middleware[0]
+
+        request = Request(
+            b"/trace", {}, "1.1", "GET", None, insanic_application
+        )
+
+        assert await end_trace(request, "response") == "response"
+
+    @pytest.mark.parametrize(
+        "method, path, status",
+        (
+            # sanic routes before it runs request middlewares
+            ("get", "/missing", 404),
+            ("post", "/found", 405),
+            # an earlier request middleware responds
+            ("get", "/found", 403),
+        ),
+    )
+    async def test_end_trace_request_middleware_skipped(
+        self, insanic_application, monkeypatch, method, path, status
+    ):
+        calls = []
+
+        async def mock_before_request(request):
+            calls.append("before")
+
+        async def mock_after_request(request, response):
+            calls.append("after")
+
+        monkeypatch.setattr(
+            "incendiary.xray.app.before_request", mock_before_request
+        )
+        monkeypatch.setattr(
+            "incendiary.xray.app.after_request", mock_after_request
+        )
+
+        async def forbid(request):
+            return text("forbidden", status=403)
+
+        # before insanic's own request middleware
+        insanic_application.request_middleware.appendleft(forbid)
+
+        @insanic_application.route("/found")
+        async def found(request):
+            return text("found")
+
+        Incendiary.setup_middlewares(insanic_application)
+
+        request, response = await insanic_application.asgi_client.request(
+            method, path
+        )
+
+        assert response.status == status
+        assert calls == []
+
+    @pytest.mark.parametrize(
+        "path, traced",
+        (
+            ("/static/app.css", False),
+            ("/users/1/", True),
+            ("/users/2/", True),
+        ),
+    )
+    async def test_excluded_endpoints_by_route(
+        self, insanic_application, monkeypatch, path, traced
+    ):
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_EXCLUDED_ENDPOINTS",
+            ("/static/*",),
+        )
+        routes = []
+
+        async def mock_before_request(request):
+            routes.append(request_route(request))
+
+        async def mock_after_request(request, response):
+            pass
+
+        monkeypatch.setattr(
+            "incendiary.xray.app.before_request", mock_before_request
+        )
+        monkeypatch.setattr(
+            "incendiary.xray.app.after_request", mock_after_request
+        )
+        monkeypatch.setattr(
+            insanic_application,
+            "xray_recorder",
+            get_new_stubbed_recorder(),
+            raising=False,
+        )
+
+        # only run the tracing middlewares
+        insanic_application.request_middleware.clear()
+        insanic_application.response_middleware.clear()
+
+        @insanic_application.route("/static/<name>")
+        async def static(request, name):
+            return text(name)
+
+        @insanic_application.route("/users/<user_id:int>/")
+        async def user(request, user_id):
+            return text(str(user_id))
+
+        Incendiary.setup_middlewares(insanic_application)
+
+        request, response = await insanic_application.asgi_client.get(path)
+
+        assert response.status == 200
+        # the route is resolved before sanic sets uri_template
+        assert routes == (["/users/<user_id:int>/"] if traced else [])
+
     def test_setup_listeners(self, insanic_application):
         Incendiary.setup_listeners(insanic_application)
 
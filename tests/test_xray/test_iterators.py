@@ -0,0 +1,226 @@
+import asyncio
+
+import pytest
+
+from aws_xray_sdk.core import xray_recorder
+from aws_xray_sdk.core.streaming.default_streaming import DefaultStreaming
+
+from incendiary.xray import Incendiary
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.entities import UnsampledSegment
+from incendiary.xray.iterators import ITERATOR_NAMESPACE
+from incendiary.xray.tail_sampling import (
+    Reservation,
+    TailSampler,
+    TailSegment,
+)
+
+
+class Pages:
+    """
+    An async iterator that isn't a generator.
+    """
+
+    def __init__(self, count):
+        self.count = count
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.count:
+            raise StopAsyncIteration
+        self.count -= 1
+        return self.count
+
+
+class TestCaptureAsyncGenerator:
+    @Incendiary.capture_async("child")
+    async def child(self):
+        pass
+
+    @Incendiary.capture_async("items")
+    async def items(self, count, delay=0):
+        try:
+            for i in range(count):
+                await asyncio.sleep(delay)
+                await self.child()
+                yield i
+        finally:
+            self.closed = True
+
+    @Incendiary.capture_async()
+    async def fails(self):
+        yield 1
+        raise ValueError("fails")
+
+    @pytest.fixture()
+    def segment(self):
+        self.closed = False
+        xray_recorder.configure(
+            service="test",
+            sampling=False,
+            context=IncendiaryAsyncContext(),
+            daemon_address="localhost:2000",
+            # keeps the closed children on the segment
+            streaming=DefaultStreaming(),
+        )
+        segment = xray_recorder.begin_segment("test_capture_async_generator")
+        yield segment
+        xray_recorder.end_segment()
+
+    @staticmethod
+    def timings(subsegment):
+        return subsegment.metadata[ITERATOR_NAMESPACE]
+
+    async def test_exhausted(self, segment):
+        received = []
+        async for i in self.items(3, delay=0.01):
+            await asyncio.sleep(0.02)
+            await self.child()
+            received.append(i)
+
+        assert received == [0, 1, 2]
+        assert self.closed is True
+
+        # the consumer's children are children of the segment
+        subsegment, *children = segment.subsegments
+        assert [c.name for c in children] == ["child"] * 3
+        assert [c.name for c in subsegment.subsegments] == ["child"] * 3
+        assert not subsegment.in_progress
+        assert subsegment.name == "items"
+
+        timings = self.timings(subsegment)
+        assert timings["items"] == 3
+        assert timings["outcome"] == "exhausted"
+        assert 0.01 <= timings["time_to_first_item"] < timings["active"]
+        assert timings["active"] >= 0.03
+        assert timings["suspended"] >= 0.06
+        assert timings["active"] + timings["suspended"] == pytest.approx(
+            subsegment.end_time - subsegment.start_time
+        )
+        assert segment.ref_counter.value == 0
+
+    async def test_closed_early(self, segment):
+        generator = self.items(10)
+        async for i in generator:
+            if i == 1:
+                break
+        await generator.aclose()
+
+        assert self.closed is True
+        (subsegment,) = segment.subsegments
+        assert not subsegment.in_progress
+        assert self.timings(subsegment)["items"] == 2
+        assert self.timings(subsegment)["outcome"] == "closed"
+
+    async def test_cancelled(self, segment):
+        async def consume():
+            async for _ in self.items(10, delay=10):
+                pass
+
+        task = asyncio.ensure_future(consume())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert self.closed is True
+        (subsegment,) = segment.subsegments
+        assert not subsegment.in_progress
+        assert self.timings(subsegment)["items"] == 0
+        assert self.timings(subsegment)["time_to_first_item"] is None
+        assert self.timings(subsegment)["outcome"] == "cancelled"
+
+    async def test_failed(self, segment):
+        with pytest.raises(ValueError):
+            async for _ in self.fails():
+                pass
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.name == "fails"
+        assert subsegment.fault is True
+        assert self.timings(subsegment)["items"] == 1
+        assert self.timings(subsegment)["outcome"] == "failed"
+
+    async def test_parent_when_created(self, segment):
+        creator = xray_recorder.begin_subsegment("creator")
+        generator = self.items(1)
+
+        async def consume():
+            xray_recorder.begin_subsegment("consumer")
+            try:
+                return [i async for i in generator]
+            finally:
+                xray_recorder.end_subsegment()
+
+        assert await asyncio.create_task(consume()) == [0]
+        xray_recorder.end_subsegment()
+
+        consumer, subsegment = creator.subsegments
+        assert consumer.name == "consumer"
+        assert consumer.subsegments == []
+        assert subsegment.name == "items"
+
+    async def test_parent_ended(self, segment):
+        @Incendiary.capture_async("fetch")
+        async def fetch():
+            return self.items(1)
+
+        generator = await fetch()
+        assert [i async for i in generator] == [0]
+
+        # begun in the caller, since the function's subsegment ended
+        fetched, subsegment = segment.subsegments
+        assert fetched.name == "fetch"
+        assert fetched.subsegments == []
+        assert subsegment.name == "items"
+
+    async def test_not_sampled(self):
+        xray_recorder.configure(context=IncendiaryAsyncContext())
+        xray_recorder.context.put_segment(UnsampledSegment())
+
+        generator = self.items(2)
+
+        assert generator.ag_code.co_name == "items"
+        assert [i async for i in generator] == [0, 1]
+        xray_recorder.context.clear_trace_entities()
+
+    async def test_tail_segment_full(self):
+        tail_sampler = TailSampler(
+            latency=1, min_status=500, max_spans=0, memory_budget=10000
+        )
+        segment = TailSegment("segment", tail_sampler, Reservation())
+        xray_recorder.configure(context=IncendiaryAsyncContext())
+        xray_recorder.context.put_segment(segment)
+
+        generator = self.items(10)
+        assert [i async for i in generator if i < 2] == [0, 1]
+        await generator.aclose()
+
+        assert segment.subsegments == []
+        assert self.closed is True
+        xray_recorder.context.clear_trace_entities()
+
+    async def test_capture_async_iterator(self, segment):
+        received = [
+            page async for page in Incendiary.capture_async_iterator(Pages(3))
+        ]
+
+        assert received == [2, 1, 0]
+        (subsegment,) = segment.subsegments
+        assert subsegment.name == "Pages"
+        assert self.timings(subsegment)["items"] == 3
+
+    async def test_capture_async_iterator_generator(self, segment):
+        iterator = Incendiary.capture_async_iterator(
+            self.items.__wrapped__(self, 1)
+        )
+
+        assert [i async for i in iterator] == [0]
+        assert segment.subsegments[0].name == "items"
+
+    def test_capture_async_iterator_not_traced(self):
+        pages = Pages(1)
+
+        assert Incendiary.capture_async_iterator(pages) is pages
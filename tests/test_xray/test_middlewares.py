@@ -0,0 +1,266 @@
+import pytest
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core.context import Context
+from aws_xray_sdk.core.models.dummy_entities import DummySegment
+from aws_xray_sdk.ext.util import inject_trace_header
+from insanic.models import User
+from insanic.request import Request
+from multidict import CIMultiDict
+from sanic.response import json
+
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.entities import UNSAMPLED_SEGMENT, UnsampledSegment
+from incendiary.xray.factories import current_task_method
+from incendiary.xray.iterators import ITERATOR_NAMESPACE, trace_async_iterator
+from incendiary.xray.middlewares import before_request, after_request
+from incendiary.xray.sampling import IncendiaryDefaultSampler
+from incendiary.xray.utils import is_materialized
+
+from .utils import StubbedEmitter, get_new_stubbed_recorder
+
+SAMPLED_TRACE_HEADER = "Root=1-5759e988-bd862e3fe1be46a994272793;Sampled=1"
+UNSAMPLED_TRACE_HEADER = "Root=1-5759e988-bd862e3fe1be46a994272793;Sampled=0"
+
+
+class MockTransport:
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+class TestMiddlewares:
+    @pytest.fixture()
+    def recorder(self, insanic_application):
+        global_sdk_config.set_sdk_enabled(True)
+
+        recorder = get_new_stubbed_recorder()
+        recorder.configure(
+            service="test",
+            context=Context(),
+            sampler=IncendiaryDefaultSampler(insanic_application),
+            emitter=StubbedEmitter(),
+        )
+        insanic_application.xray_recorder = recorder
+        return recorder
+
+    @pytest.fixture()
+    def request_object(self, insanic_application):
+        headers = CIMultiDict(
+            {
+                "host": "localhost",
+                "cookie": "a=b",
+                "x-amzn-trace-id": SAMPLED_TRACE_HEADER,
+            }
+        )
+        return Request(
+            b"/trace?a=1",
+            headers,
+            "1.1",
+            "GET",
+            MockTransport(),
+            insanic_application,
+        )
+
+    def test_is_materialized(self, request_object):
+        assert is_materialized(request_object, "path") is True
+        assert is_materialized(request_object, "args") is False
+        assert is_materialized(request_object, "cookies") is False
+        assert is_materialized(request_object, "data") is False
+
+        request_object.args
+        request_object.cookies
+
+        assert is_materialized(request_object, "args") is True
+        assert is_materialized(request_object, "cookies") is True
+
+    async def test_lazy_capture_does_not_parse(self, recorder, request_object):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        assert segment.sampled is True
+        assert request_object._cookies is None
+        assert not request_object.parsed_args
+
+        # handler only needs the query arguments
+        request_object.args
+
+        await after_request(request_object, json({}))
+
+        metadata = segment.metadata["request"]
+        assert "args" in metadata
+        assert "path" in metadata
+        assert "cookies" not in metadata
+        assert request_object._cookies is None
+        assert not hasattr(request_object, "_user")
+
+    @pytest.mark.skipif(
+        "_data" not in Request.__slots__,
+        reason="insanic before 0.10 can't read request.data on sanic 20.9",
+    )
+    async def test_lazy_capture_records_data(self, recorder, request_object):
+        request_object.method = "POST"
+        request_object.headers["content-type"] = "application/json"
+        request_object.body = b'{"message": "hello"}'
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        # the handler reads the body
+        assert request_object.data == {"message": "hello"}
+
+        await after_request(request_object, json({}))
+
+        metadata = segment.metadata["request"]
+        assert metadata["data"] == '{"message":"hello"}'
+
+    async def test_lazy_capture_records_authenticated_user(
+        self, recorder, request_object
+    ):
+        current_task_method().context = {}
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        # authentication ran in the handler
+        request_object.user = User(id="1", level=100)
+
+        await after_request(request_object, json({}))
+
+        assert segment.user == "1"
+        assert segment.annotations["user__level"] == 100
+
+    async def test_iterator_left_open(self, recorder, request_object):
+        recorder.configure(context=IncendiaryAsyncContext())
+        current_task_method().context = {}
+
+        async def items():
+            for i in range(10):
+                yield i
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        generator = trace_async_iterator(items(), "items", recorder)
+        async for i in generator:
+            if i == 1:
+                break
+
+        await after_request(request_object, json({}))
+
+        assert recorder.emitter.pop() is segment
+        (subsegment,) = segment.subsegments
+        assert not subsegment.in_progress
+        timings = subsegment.metadata[ITERATOR_NAMESPACE]
+        assert timings["items"] == 2
+        assert timings["outcome"] == "unfinished"
+
+        # the finalizer closes the generator once the segment was sent
+        await generator.aclose()
+        assert timings["outcome"] == "unfinished"
+
+    async def test_interservice_analysis(self, recorder, request_object):
+        current_task_method().context = {}
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+        for name in ("userservice", "orderservice"):
+            recorder.begin_subsegment(name, "remote")
+            recorder.end_subsegment()
+
+        await after_request(request_object, json({}))
+
+        analysis = segment.metadata["interservice"]
+        assert analysis["calls"] == 2
+        assert analysis["peak"] == 1
+        assert analysis["critical_path"] == ["userservice", "orderservice"]
+
+    async def test_eager_capture(
+        self, recorder, request_object, insanic_application, monkeypatch
+    ):
+        monkeypatch.setattr(
+            insanic_application.config, "INCENDIARY_XRAY_LAZY_CAPTURE", False
+        )
+        current_task_method().context = {}
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        metadata = segment.metadata["request"]
+        assert "cookies" in metadata
+        assert "args" in metadata
+
+        await after_request(request_object, json({}))
+
+        assert hasattr(request_object, "_user")
+
+    async def test_configured_attributes(
+        self, recorder, request_object, insanic_application, monkeypatch
+    ):
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_REQUEST_ATTRIBUTES",
+            ("path",),
+        )
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+        request_object.cookies
+
+        await after_request(request_object, json({}))
+
+        assert list(segment.metadata["request"].keys()) == ["path"]
+
+    @pytest.mark.parametrize(
+        "trace_header, expected_trace_id",
+        (
+            (UNSAMPLED_TRACE_HEADER, "1-5759e988-bd862e3fe1be46a994272793"),
+            ("Sampled=0", UNSAMPLED_SEGMENT.trace_id),
+        ),
+    )
+    async def test_unsampled_fast_path(
+        self, recorder, request_object, trace_header, expected_trace_id
+    ):
+        request_object.headers["x-amzn-trace-id"] = trace_header
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        assert isinstance(segment, UnsampledSegment)
+        assert segment.sampled is False
+        assert segment.in_progress is True
+        assert segment.trace_id == expected_trace_id
+
+        # propagates the decision to other services
+        headers = {}
+        subsegment = recorder.begin_subsegment("downstream", "remote")
+        inject_trace_header(headers, subsegment)
+        recorder.end_subsegment()
+
+        assert headers["X-Amzn-Trace-Id"].startswith(
+            f"Root={expected_trace_id};"
+        )
+        assert headers["X-Amzn-Trace-Id"].endswith("Sampled=0")
+
+        await after_request(request_object, json({}))
+
+        assert recorder.emitter.pop() is None
+        assert segment.subsegments == ()
+        # the unsampled segment was taken off the context
+        assert recorder.context.get_trace_entity() is None
+
+    async def test_unsampled_without_fast_path(
+        self, recorder, request_object, insanic_application, monkeypatch
+    ):
+        monkeypatch.setattr(
+            insanic_application.config,
+            "INCENDIARY_XRAY_UNSAMPLED_FAST_PATH",
+            False,
+        )
+        request_object.headers["x-amzn-trace-id"] = UNSAMPLED_TRACE_HEADER
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        assert isinstance(segment, DummySegment)
+
+        await after_request(request_object, json({}))
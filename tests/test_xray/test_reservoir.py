@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from incendiary.xray import reservoir as reservoir_module
+from incendiary.xray.reservoir import SharedReservoirs
+from incendiary.xray.sampling import IncendiaryLocalSampler
+
+
+@pytest.fixture()
+def frozen_time(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(
+        reservoir_module, "time", SimpleNamespace(time=lambda: clock.now)
+    )
+    return clock
+
+
+def take(reservoir, times):
+    return sum(reservoir.take() for _ in range(times))
+
+
+class TestSharedReservoir:
+    def test_take(self, frozen_time):
+        reservoir = SharedReservoirs(rules=2, slots=4).reservoir(0, 5)
+
+        assert take(reservoir, 10) == 5
+
+        frozen_time.now += 1
+        assert take(reservoir, 10) == 5
+
+    def test_rules_are_independent(self, frozen_time):
+        reservoirs = SharedReservoirs(rules=2, slots=4)
+
+        assert take(reservoirs.reservoir(0, 3), 10) == 3
+        assert take(reservoirs.reservoir(1, 2), 10) == 2
+
+    def test_fixed_target_is_shared_between_workers(self, frozen_time):
+        reservoirs = SharedReservoirs(rules=1, slots=4)
+        reservoir = reservoirs.reservoir(0, 10)
+
+        assert take(reservoir, 4) == 4
+
+        def worker():
+            os._exit(take(reservoir, 10))
+
+        context = multiprocessing.get_context("fork")
+        processes = [context.Process(target=worker) for _ in range(2)]
+        for process in processes:
+            process.start()
+            process.join()
+
+        assert sum(p.exitcode for p in processes) == 6
+        # the second worker claimed the slot of the first, which exited
+        assert reservoirs.counters[0] == 2
+        assert take(reservoir, 10) == 0
+
+        # the workers' counts don't carry over to the next second
+        frozen_time.now += 1
+        assert take(reservoir, 20) == 10
+
+    def test_slots_exhausted(self, frozen_time, monkeypatch):
+        reservoirs = SharedReservoirs(rules=1, slots=1)
+        reservoir = reservoirs.reservoir(0, 2)
+        assert take(reservoir, 5) == 2
+
+        # another process finds no slots left and samples on its own
+        monkeypatch.setattr(reservoir_module.os, "getpid", lambda: -1)
+
+        assert reservoirs.slot() is None
+        assert take(reservoir, 5) == 2
+
+    def test_release(self, frozen_time, monkeypatch):
+        reservoirs = SharedReservoirs(rules=1, slots=1)
+        reservoir = reservoirs.reservoir(0, 2)
+        assert take(reservoir, 1) == 1
+
+        reservoirs.release()
+        assert reservoirs.counters[1] == 0
+
+        # a restarted worker claims the released slot, and the
+        # count of the second is kept
+        monkeypatch.setattr(reservoir_module.os, "getpid", lambda: 2 ** 22)
+        assert reservoirs.slot() == 0
+        assert reservoirs.counters[1] == 2 ** 22
+        assert take(reservoir, 5) == 1
+
+    def test_release_without_slot(self):
+        reservoirs = SharedReservoirs(rules=1, slots=1)
+
+        reservoirs.release()
+
+        assert reservoirs.slot() == 0
+
+    def test_dead_worker_slot_is_claimed(self, frozen_time):
+        reservoirs = SharedReservoirs(rules=1, slots=1)
+        reservoir = reservoirs.reservoir(0, 10)
+
+        def worker():
+            os._exit(take(reservoir, 3))
+
+        context = multiprocessing.get_context("fork")
+        process = context.Process(target=worker)
+        process.start()
+        process.join()
+
+        # the worker exited without releasing its slot
+        assert reservoirs.counters[1] == process.pid
+        assert reservoirs.slot() == 0
+        assert reservoirs.counters[1] == os.getpid()
+        assert take(reservoir, 10) == 7
+
+    def test_local_sampler(self, frozen_time):
+        reservoirs = SharedReservoirs(rules=2, slots=4)
+        rules = {
+            "version": 1,
+            "rules": [
+                {
+                    "description": "",
+                    "service_name": "*",
+                    "http_method": "*",
+                    "url_path": "/a",
+                    "fixed_target": 1,
+                    "rate": 0,
+                },
+                {
+                    "description": "",
+                    "service_name": "*",
+                    "http_method": "*",
+                    "url_path": "/b",
+                    "fixed_target": 1,
+                    "rate": 0,
+                },
+            ],
+            "default": {"fixed_target": 1, "rate": 0},
+        }
+
+        sampler = IncendiaryLocalSampler(rules, reservoirs)
+
+        assert sampler._rules[0].reservoir.reservoirs is reservoirs
+        assert sampler._rules[1].reservoir.reservoirs is reservoirs
+        # only the rules that fit in the shared memory are shared
+        assert not hasattr(sampler._default_rule.reservoir, "reservoirs")
+
+        first = IncendiaryLocalSampler(rules, reservoirs)
+        second = IncendiaryLocalSampler(rules, reservoirs)
+
+        assert first.should_trace({"path": "/a"}) is True
+        assert second.should_trace({"path": "/a"}) is False
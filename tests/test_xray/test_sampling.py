@@ -0,0 +1,221 @@
+import itertools
+import pytest
+
+from aws_xray_sdk.core.sampling.local.sampler import LocalSampler
+
+from incendiary.xray.sampling import (
+    IncendiaryDefaultSampler,
+    IncendiaryLocalSampler,
+)
+
+RULES = {
+    "version": 1,
+    "rules": [
+        {
+            "description": "moves",
+            "service_name": "*",
+            "http_method": "POST",
+            "url_path": "/api/move/*",
+            "fixed_target": 0,
+            "rate": 0.05,
+        },
+        {
+            "description": "any method moves",
+            "service_name": "*",
+            "http_method": "*",
+            "url_path": "/api/move/*",
+            "fixed_target": 0,
+            "rate": 0.1,
+        },
+        {
+            "description": "exact",
+            "service_name": "*",
+            "http_method": "GET",
+            "url_path": "/api/users/",
+            "fixed_target": 0,
+            "rate": 0.2,
+        },
+        {
+            "description": "single character",
+            "service_name": "*",
+            "http_method": "G?T",
+            "url_path": "/api/users/?/",
+            "fixed_target": 0,
+            "rate": 0.3,
+        },
+        {
+            "description": "glob in the middle",
+            "service_name": "tracer*",
+            "http_method": "*",
+            "url_path": "/api/*/items",
+            "fixed_target": 0,
+            "rate": 0.4,
+        },
+        {
+            "description": "everything",
+            "service_name": "*",
+            "http_method": "DELETE",
+            "url_path": "*",
+            "fixed_target": 0,
+            "rate": 0.5,
+        },
+    ],
+    "default": {"fixed_target": 1, "rate": 0.01},
+}
+
+PATHS = (
+    "/api/move/1",
+    "/API/MOVE/1",
+    "/api/move/",
+    "/api/move",
+    "/api/users/",
+    "/api/users/1/",
+    "/api/users/12/",
+    "/api/orders/items",
+    "/api/orders/items/",
+    "/",
+    None,
+)
+METHODS = ("GET", "get", "POST", "DELETE", "PUT", None)
+HOSTS = (None, "tracer.tests", "other")
+
+
+def linear_match(sampler, host, method, path):
+    for rule in sampler._rules:
+        if rule.applies(host, method, path):
+            return rule
+    return None
+
+
+class TestIncendiaryLocalSampler:
+    @pytest.fixture()
+    def sampler(self):
+        return IncendiaryLocalSampler(RULES)
+
+    def test_same_rule_as_local_sampler(self, sampler):
+        local_sampler = LocalSampler(RULES)
+
+        for host, method, path in itertools.product(HOSTS, METHODS, PATHS):
+            expected = linear_match(local_sampler, host, method, path)
+            matched = sampler.match_rule(host, method, path)
+
+            if expected is None:
+                assert matched is None, (host, method, path)
+            else:
+                assert matched.rate == expected.rate, (host, method, path)
+
+    @pytest.mark.parametrize(
+        "method, route, path, expected",
+        (
+            ("POST", "/api/move/<id:int>", "/api/move/1", 0.05),
+            ("GET", "/api/move/<id:int>", "/api/move/1", 0.1),
+            ("GET", "/api/users/", "/api/users/", 0.2),
+            ("GET", "/api/users/<id>/", "/api/users/1/", 0.3),
+            ("GET", "/api/users/<id>/", "/api/users/12/", None),
+            ("GET", "/api/<resource>/items", "/api/orders/items", 0.4),
+            ("GET", "/api/orders/<id>", "/api/orders/1", None),
+            ("DELETE", "/api/orders/<id>", "/api/orders/1", 0.5),
+            ("GET", "/<path:path>", "/api/move/1", 0.1),
+        ),
+    )
+    def test_match_route_rule(self, sampler, method, route, path, expected):
+        for _ in range(2):
+            matched = sampler.match_route_rule(None, method, path, route)
+
+            assert (matched and matched.rate) == expected
+            assert matched is sampler.match_rule(None, method, path)
+
+    def test_memoized_by_route(self, sampler, monkeypatch):
+        paths = []
+        match_rule = sampler.match_rule
+        monkeypatch.setattr(
+            sampler,
+            "match_rule",
+            lambda *args: paths.append(args[2]) or match_rule(*args),
+        )
+
+        for move_id in range(10):
+            rule = sampler.match_route_rule(
+                None, "POST", f"/api/move/{move_id}", "/api/move/<id:int>"
+            )
+            assert rule.rate == 0.05
+
+        # the path wasn't needed for the route
+        assert paths == []
+
+        for user_id in range(10):
+            sampler.match_route_rule(
+                None, "GET", f"/api/users/{user_id}/", "/api/users/<id>/"
+            )
+
+        # "/api/users/?/" matches some of the route's paths
+        assert paths == [f"/api/users/{user_id}/" for user_id in range(10)]
+
+    def test_reload_clears_memoized(self, sampler):
+        rule = sampler.match_route_rule(
+            None, "GET", "/api/users/", "/api/users/"
+        )
+        assert rule.rate == 0.2
+
+        sampler.load_local_rules(
+            {"version": 1, "default": {"fixed_target": 1, "rate": 0.01}}
+        )
+
+        assert (
+            sampler.match_route_rule(None, "GET", "/api/users/", "/api/users/")
+            is None
+        )
+
+    @pytest.mark.parametrize(
+        "sampling_req, expected",
+        (
+            ({"method": "POST", "path": "/api/move/1"}, False),
+            (
+                {
+                    "method": "POST",
+                    "path": "/api/move/1",
+                    "route": "/api/move/<id>",
+                },
+                False,
+            ),
+            ({"method": "GET", "path": "/"}, True),
+            ({"method": "GET", "path": "/", "route": "/"}, True),
+            (None, True),
+        ),
+    )
+    def test_should_trace(self, sampling_req, expected):
+        rules = {
+            "version": 1,
+            "rules": [
+                {
+                    "description": "never",
+                    "service_name": "*",
+                    "http_method": "POST",
+                    "url_path": "/api/move/*",
+                    "fixed_target": 0,
+                    "rate": 0,
+                }
+            ],
+            "default": {"fixed_target": 0, "rate": 1},
+        }
+        sampler = IncendiaryLocalSampler(rules)
+
+        assert sampler.should_trace(sampling_req) is expected
+
+
+class TestIncendiaryDefaultSampler:
+    def test_local_rules_not_shared(self, insanic_application, monkeypatch):
+        monkeypatch.setattr(
+            insanic_application.config, "INCENDIARY_XRAY_ENABLED", False
+        )
+        sampler = IncendiaryDefaultSampler(insanic_application)
+
+        assert sampler.local_rules["rules"] == []
+        assert sampler.local_rules["default"]["rate"] == 0
+        assert (
+            insanic_application.config.INCENDIARY_XRAY_SAMPLING_RULES[
+                "default"
+            ]["rate"]
+            != 0
+        )
+        assert isinstance(sampler._local_sampler, IncendiaryLocalSampler)
@@ -0,0 +1,157 @@
+import json
+
+import pytest
+
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.serializers import (
+    serialize_entity,
+    serialize_split,
+    to_document,
+)
+from incendiary.xray.tail_sampling import Reservation, TailSampler, TailSegment
+
+
+class Payload:
+    def __str__(self):
+        return "payload"
+
+
+def finished_segment(name: str = "segment") -> Segment:
+    segment = Segment(name)
+    segment.put_http_meta("url", "http://localhost/trace")
+    segment.put_annotation("response", '{"a": 1}')
+    segment.put_metadata("data", {"a": [1, 2], "b": Payload()}, "request")
+    segment.set_user("1")
+
+    subsegment = Subsegment("query", "local", segment)
+    segment.add_subsegment(subsegment)
+    subsegment.put_http_meta("method", "GET")
+    subsegment.close()
+
+    segment.close()
+    return segment
+
+
+def traced_segment(segment: Segment) -> Segment:
+    """
+    A segment with what the middlewares and hooks record.
+    """
+    segment.save_origin_trace_header("Root=1-5759e988-bd862e3fe1be46a994272793")
+    segment.put_annotation("insanic_version", "0.9.2")
+    segment.put_annotation("user__level", 100)
+    segment.put_http_meta("url", "http://localhost:8000/api/v1/trace?a=1")
+    segment.put_http_meta("method", "GET")
+    segment.put_http_meta("user_agent", "python-httpx/0.15.4")
+    segment.put_http_meta("client_ip", "127.0.0.1")
+    segment.put_http_meta("x_forwarded_for", True)
+    segment.put_metadata("args", '{"a": ["1"]}', "request")
+    segment.put_metadata("path", '"/api/v1/trace"', "request")
+    segment.put_metadata("ratio", 0.25, "custom")
+    segment.put_metadata("obj", Payload(), "custom")
+    segment.put_metadata("nested", {"list": (1, 2.5, None)}, "custom")
+    segment.set_aws({"xray": {"sdk": "X-Ray for Python", "sdk_version": "2"}})
+    segment.set_service({"runtime": "CPython", "runtime_version": "3.8.5"})
+    segment.set_user("1")
+
+    subsegment = Subsegment("userip", "remote", segment)
+    segment.add_subsegment(subsegment)
+    subsegment.put_http_meta("method", "POST")
+    subsegment.put_http_meta("url", "http://userip:8000/api/v1/")
+    subsegment.put_http_meta("status", 500)
+    subsegment.put_annotation("response", '{"message": "Ünïcode / error"}')
+    try:
+        raise ValueError("bad")
+    except ValueError as e:
+        subsegment.add_exception(e, [("a.py", 1, "f", "x = 1")])
+
+    local = Subsegment("capture", "local", segment)
+    subsegment.add_subsegment(local)
+    local.close()
+    subsegment.close()
+
+    segment.put_http_meta("status", 500)
+    segment.put_http_meta("content_length", 20)
+    segment.put_annotation("response", '{"message": "error"}')
+    segment.close()
+    return segment
+
+
+class TestSerialize:
+    def test_same_as_entity_serialize(self):
+        segment = traced_segment(Segment("service"))
+
+        assert to_document(segment) == segment.to_dict()
+        assert serialize_entity(segment) == segment.serialize()
+        assert serialize_entity(segment.subsegments[0]) == (
+            segment.subsegments[0].serialize()
+        )
+
+    def test_tail_segment(self):
+        tail_sampler = TailSampler(
+            latency=1, min_status=500, max_spans=10, memory_budget=10000
+        )
+        segment = traced_segment(
+            TailSegment("service", tail_sampler, Reservation())
+        )
+
+        assert serialize_entity(segment) == segment.serialize()
+
+    @pytest.mark.parametrize(
+        "value",
+        (1e-07, [1e16, 1e-5], {"a": -2.5e-10}, "v1e-5", b"bytes", {1, 2}),
+    )
+    def test_falls_back_to_json(self, value):
+        segment = Segment("service")
+        segment.put_annotation("value", value)
+        segment.put_metadata("value", value)
+        segment.close()
+
+        assert serialize_entity(segment) == segment.serialize()
+
+
+class TestSerializeSplit:
+    def test_fits(self):
+        segment = traced_segment(Segment("service"))
+
+        assert serialize_split(to_document(segment)) == [
+            serialize_entity(segment)
+        ]
+
+    def test_splits_subsegments(self):
+        segment = traced_segment(Segment("service"))
+        limit = len(serialize_entity(segment)) - 1
+
+        documents = [
+            json.loads(d) for d in serialize_split(to_document(segment), limit)
+        ]
+
+        assert [d["name"] for d in documents] == ["service", "userip"]
+        assert "subsegments" not in documents[0]
+        userip = documents[1]
+        assert userip["type"] == "subsegment"
+        assert userip["trace_id"] == segment.trace_id
+        assert userip["parent_id"] == segment.id
+        # the subsegment fits with its own subsegments
+        assert userip["subsegments"][0]["name"] == "capture"
+
+    def test_truncates_metadata(self):
+        segment = Segment("service")
+        segment.put_metadata("body", "x" * 1000, "request")
+        segment.close()
+
+        documents = serialize_split(to_document(segment), 500)
+
+        assert len(documents) == 1
+        assert json.loads(documents[0])["metadata"] == {
+            "incendiary": {"truncated": True}
+        }
+
+    def test_drops_too_large(self):
+        segment = Segment("service")
+        segment.put_annotation("response", "x" * 1000)
+        segment.put_metadata("body", "x", "request")
+        segment.close()
+
+        assert serialize_split(to_document(segment), 500) == []
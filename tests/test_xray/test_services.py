@@ -0,0 +1,195 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from insanic.services import Service
+
+from incendiary.xray.aggregation import CallAggregator
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.hooks import SubsegmentTemplate
+from incendiary.xray.services import IncendiaryService
+
+
+def response(status: int) -> bytes:
+    return (
+        f"HTTP/1.1 {status} STATUS\r\ncontent-length: 2\r\n\r\n{{}}"
+    ).encode()
+
+
+class TestRetries:
+    @pytest.fixture()
+    async def server(self):
+        statuses = []
+
+        async def handle(reader, writer):
+            try:
+                while await reader.readuntil(b"\r\n\r\n"):
+                    writer.write(response(statuses.pop(0) if statuses else 200))
+                    await writer.drain()
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        yield SimpleNamespace(
+            statuses=statuses, url=f"http://127.0.0.1:{port}/"
+        )
+        server.close()
+        await server.wait_closed()
+
+    @pytest.fixture()
+    async def service(self, incendiary_application):
+        # without the service token, that the constructor encodes
+        service = IncendiaryService.__new__(IncendiaryService)
+        service.service_name = "userservice"
+        service.subsegment_template = SubsegmentTemplate("userservice")
+        service.requests = service.retries = 0
+        service._client = None
+        service.url = httpx.URL("http://userservice:8000/")
+        service.service_token = "token"
+        service.xray_recorder = incendiary_application.xray_recorder
+        yield service
+        await service._client.aclose()
+
+    @pytest.fixture()
+    def segment(self, service):
+        segment = service.xray_recorder.begin_segment("segment")
+        yield segment
+        service.xray_recorder.end_segment()
+
+    async def test_not_retried(self, service, server, segment):
+        response = await service._dispatch_send(
+            httpx.Request("GET", server.url)
+        )
+
+        assert response.status_code == 200
+        (subsegment,) = segment.subsegments
+        assert subsegment.subsegments == []
+        assert service.requests == 1
+        assert service.retries == 0
+        assert service.retry_rate == 0
+
+    async def test_retried(self, service, server, segment):
+        server.statuses.extend([503, 502])
+
+        response = await service._dispatch_send(
+            httpx.Request("GET", server.url)
+        )
+
+        assert response.status_code == 200
+        (subsegment,) = segment.subsegments
+        attempts = subsegment.subsegments
+        assert [a.name for a in attempts] == [
+            "attempt 1",
+            "attempt 2",
+            "attempt 3",
+        ]
+        assert [a.http["response"]["status"] for a in attempts] == [
+            503,
+            502,
+            200,
+        ]
+        assert [getattr(a, "fault", False) for a in attempts] == [
+            True,
+            True,
+            False,
+        ]
+        assert all(not a.in_progress for a in attempts)
+        assert attempts[0].start_time >= subsegment.start_time
+        assert attempts[1].start_time >= attempts[0].end_time
+        assert subsegment.end_time >= attempts[2].end_time
+
+        assert service.retries == 2
+        assert service.retry_rate == 2
+
+    async def test_delegates_retries(self, service, server, monkeypatch):
+        sent = []
+
+        async def dispatch_send(self, request, *, timeout, retry_count):
+            sent.append(retry_count)
+            return await self.client.send(request, timeout=timeout)
+
+        monkeypatch.setattr(Service, "_dispatch_send", dispatch_send)
+
+        response = await service._dispatch_send(
+            httpx.Request("GET", server.url), retry_count=1
+        )
+
+        assert response.status_code == 200
+        assert sent == [1]
+
+    async def test_transport_error(self, service, segment, unused_port):
+        url = f"http://127.0.0.1:{unused_port}/"
+
+        with pytest.raises(httpx.ConnectError):
+            await service._dispatch_send(httpx.Request("GET", url))
+
+        (subsegment,) = segment.subsegments
+        attempts = subsegment.subsegments
+        assert len(attempts) == service.retries + 1 > 1
+        assert all(a.fault for a in attempts)
+
+    async def test_all_attempts_fail(self, service, server, segment):
+        server.statuses.extend([500] * 3)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await service._dispatch_send(httpx.Request("GET", server.url))
+
+        (subsegment,) = segment.subsegments
+        assert len(subsegment.subsegments) == 3
+        assert subsegment.fault is True
+        assert segment.ref_counter.value == 0
+
+    async def test_not_retried_post(self, service, server, segment):
+        server.statuses.append(500)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            await service._dispatch_send(httpx.Request("POST", server.url))
+
+        (subsegment,) = segment.subsegments
+        assert subsegment.subsegments == []
+        assert service.retries == 0
+
+    async def test_not_traced(self, service, server):
+        server.statuses.append(503)
+
+        response = await service._dispatch_send(
+            httpx.Request("GET", server.url)
+        )
+
+        assert response.status_code == 200
+        assert service.retry_rate == 1
+
+    async def test_aggregated(self, service, server):
+        service.call_aggregator = CallAggregator(2)
+        service.xray_recorder.configure(context=IncendiaryAsyncContext())
+        segment = service.xray_recorder.begin_segment("segment")
+        server.statuses.extend([200, 200, 200, 404, 503])
+
+        for user in range(1, 6):
+            # like concurrent requests, each in a task of its own
+            await asyncio.create_task(
+                service._dispatch_send(
+                    httpx.Request("GET", f"{server.url}api/v1/users/{user}/")
+                )
+            )
+
+        service.call_aggregator.close(segment)
+        service.xray_recorder.end_segment()
+
+        first, second, summary = segment.subsegments
+        assert first.http["request"]["url"].endswith("/api/v1/users/1/")
+        assert second.http["request"]["url"].endswith("/api/v1/users/2/")
+        assert summary.http["request"] == {
+            "method": "GET",
+            "url": "/api/v1/users/{id}/",
+        }
+        assert summary.subsegments == []
+        assert summary.metadata["summary"]["count"] == 3
+        assert summary.metadata["summary"]["errors"] == 1
+        assert summary.error is True
+        assert not summary.in_progress
+        # the summarized requests are retried too
+        assert service.retries == 1
@@ -0,0 +1,93 @@
+import pytest
+
+from incendiary.xray.spool import HEADER, LENGTH, RingSpool
+
+
+def record(i: int, size: int = 10) -> bytes:
+    return str(i).encode().ljust(size, b".")
+
+
+class TestRingSpool:
+    @pytest.fixture()
+    def spool(self, tmp_path):
+        # room for 4 records of 10 bytes
+        spool = RingSpool(str(tmp_path), HEADER.size + 4 * (LENGTH.size + 10))
+        spool.open()
+        yield spool
+        spool.close()
+
+    def test_too_small(self, tmp_path):
+        with pytest.raises(ValueError):
+            RingSpool(str(tmp_path), HEADER.size)
+
+    def test_write_read(self, spool):
+        assert spool.read() is None
+
+        for i in range(3):
+            assert spool.write(record(i)) is True
+        assert len(spool) == 3
+
+        assert [spool.read() for _ in range(4)] == [
+            record(0),
+            record(1),
+            record(2),
+            None,
+        ]
+        assert len(spool) == 0
+
+    def test_evicts_oldest_when_full(self, spool):
+        for i in range(6):
+            spool.write(record(i))
+
+        assert spool.evicted == 2
+        assert [spool.read() for _ in range(4)] == [
+            record(i) for i in range(2, 6)
+        ]
+
+    def test_wraps_around(self, spool):
+        for i in range(3):
+            spool.write(record(i))
+        spool.read()
+        spool.read()
+
+        # doesn't fit at the end, continues at the start
+        spool.write(record(3, 20))
+        assert spool.evicted == 0
+
+        # the next one only fits in place of the oldest
+        spool.write(record(4))
+        assert spool.evicted == 1
+
+        assert [spool.read() for _ in range(3)] == [
+            record(3, 20),
+            record(4),
+            None,
+        ]
+
+    def test_too_large(self, spool):
+        assert spool.write(record(0, spool.capacity)) is False
+        assert len(spool) == 0
+
+    def test_reopen(self, spool, tmp_path):
+        spool.write(record(0))
+        spool.write(record(1))
+        spool.close()
+
+        reopened = RingSpool(str(tmp_path), spool.size)
+        reopened.open()
+
+        assert reopened.path == spool.path
+        assert reopened.read() == record(0)
+        assert reopened.read() == record(1)
+        reopened.close()
+
+    def test_one_file_per_process(self, spool, tmp_path):
+        # the lock is held per open file, like by another process
+        other = RingSpool(str(tmp_path), spool.size)
+        other.open()
+
+        assert other.path != spool.path
+
+        other.write(record(0))
+        assert len(spool) == 0
+        other.close()
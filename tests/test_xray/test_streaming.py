@@ -0,0 +1,125 @@
+import pytest
+
+from aws_xray_sdk import global_sdk_config
+from aws_xray_sdk.core.context import Context
+
+from incendiary.xray.serializers import serialize_entity
+from incendiary.xray import streaming as streaming_module
+from incendiary.xray.streaming import IncendiaryStreaming
+
+from .utils import get_new_stubbed_recorder
+
+
+class TestIncendiaryStreaming:
+    @pytest.fixture()
+    def sent(self):
+        return []
+
+    @pytest.fixture()
+    def recorder(self, sent, monkeypatch):
+        global_sdk_config.set_sdk_enabled(True)
+
+        recorder = get_new_stubbed_recorder()
+        recorder.configure(
+            context=Context(), streaming=IncendiaryStreaming(budget=8192)
+        )
+        monkeypatch.setattr(recorder.emitter, "send_entity", sent.append)
+        yield recorder
+        recorder.clear_trace_entities()
+
+    def test_many_small_subsegments_are_not_streamed(self, recorder, sent):
+        segment = recorder.begin_segment("segment", sampling=1)
+        for i in range(15):
+            recorder.begin_subsegment(f"query-{i}")
+            recorder.end_subsegment()
+
+        assert sent == []
+        assert len(segment.subsegments) == 15
+
+        recorder.end_segment()
+        assert sent == [segment]
+
+    def test_large_subsegments_are_streamed(self, recorder, sent):
+        segment = recorder.begin_segment("segment", sampling=1)
+        for i in range(3):
+            subsegment = recorder.begin_subsegment(f"userip-{i}")
+            subsegment.put_annotation("response", "x" * 4000)
+            recorder.end_subsegment()
+
+        assert [s.name for s in sent] == ["userip-0", "userip-1"]
+        assert [s.name for s in segment.subsegments] == ["userip-2"]
+
+    def test_unsampled_segments_are_not_streamed(self, recorder, sent):
+        recorder.begin_segment("segment", sampling=0)
+        recorder.begin_subsegment("userip")
+        recorder.current_subsegment().put_annotation("response", "x" * 10000)
+        recorder.end_subsegment()
+
+        assert sent == []
+
+    def test_estimate_size(self, recorder):
+        streaming = recorder.streaming
+        segment = recorder.begin_segment("segment", sampling=1)
+        segment.put_metadata("body", '{"a": 1}', "request")
+        recorder.begin_subsegment("outer")
+        recorder.begin_subsegment("inner")
+        recorder.current_subsegment().put_annotation("a", "b")
+        recorder.end_subsegment()
+
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
+
+        recorder.end_subsegment()
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
+
+    def test_estimate_size_is_kept_running(self, recorder, monkeypatch):
+        streaming = recorder.streaming
+        segment = recorder.begin_segment("segment", sampling=1)
+
+        measured = []
+        measure_fields = streaming_module.measure_fields
+        monkeypatch.setattr(
+            streaming_module,
+            "measure_fields",
+            lambda entity: measured.append(entity) or measure_fields(entity),
+        )
+
+        for i in range(10):
+            recorder.begin_subsegment(f"query-{i}")
+            recorder.end_subsegment()
+
+        # the segment's fields once, and every subsegment once
+        assert measured.count(segment) == 1
+        assert len(measured) == 11
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
+
+        segment.put_metadata("body", '{"a": 1}', "request")
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
+        assert measured.count(segment) == 2
+
+    def test_estimate_size_after_subsegments_are_removed(self, recorder):
+        streaming = recorder.streaming
+        segment = recorder.begin_segment("segment", sampling=1)
+        subsegments = []
+        for i in range(3):
+            subsegments.append(recorder.begin_subsegment(f"query-{i}"))
+            recorder.end_subsegment()
+        streaming.estimate_size(segment)
+
+        segment.remove_subsegment(subsegments[1])
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
+
+        recorder.begin_subsegment("query-3")
+        recorder.end_subsegment()
+        assert streaming.estimate_size(segment) == len(
+            serialize_entity(segment)
+        )
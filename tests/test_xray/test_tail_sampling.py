@@ -0,0 +1,255 @@
+import json as _json
+
+import pytest
+
+from aws_xray_sdk import global_sdk_config
+from insanic.request import Request
+from multidict import CIMultiDict
+from sanic.response import json
+
+from incendiary.xray.aggregation import CallAggregator
+from incendiary.xray.contexts import IncendiaryAsyncContext
+from incendiary.xray.entities import UnsampledSegment
+from incendiary.xray.factories import current_task_method
+from incendiary.xray.middlewares import before_request, after_request
+from incendiary.xray.sampling import IncendiaryDefaultSampler
+from incendiary.xray.streaming import IncendiaryStreaming
+from incendiary.xray.tail_sampling import SPAN_SIZE, TailSegment
+
+from .utils import StubbedEmitter, get_new_stubbed_recorder
+
+
+class MockTransport:
+    def get_extra_info(self, name, default=None):
+        return default
+
+
+class TestTailSampling:
+    @pytest.fixture(autouse=True)
+    def tail_sampling_config(self, insanic_application, monkeypatch):
+        config = insanic_application.config
+        monkeypatch.setattr(config, "INCENDIARY_XRAY_ENABLED", True)
+        monkeypatch.setattr(config, "INCENDIARY_XRAY_TAIL_SAMPLING", True)
+        monkeypatch.setattr(
+            config, "INCENDIARY_XRAY_TAIL_SAMPLING_LATENCY", 60.0
+        )
+        monkeypatch.setattr(
+            config, "INCENDIARY_XRAY_TAIL_SAMPLING_MAX_SPANS", 2
+        )
+        monkeypatch.setattr(
+            config,
+            "INCENDIARY_XRAY_SAMPLING_RULES",
+            {
+                "version": 1,
+                "rules": [],
+                "default": {"fixed_target": 0, "rate": 0},
+            },
+        )
+
+    @pytest.fixture()
+    async def recorder(self, insanic_application):
+        global_sdk_config.set_sdk_enabled(True)
+
+        recorder = get_new_stubbed_recorder()
+        recorder.configure(
+            service="test",
+            context=IncendiaryAsyncContext(use_task_factory=False),
+            sampler=IncendiaryDefaultSampler(insanic_application),
+            emitter=StubbedEmitter(),
+            streaming=IncendiaryStreaming(budget=0),
+        )
+        insanic_application.xray_recorder = recorder
+        return recorder
+
+    @pytest.fixture()
+    def tail_sampler(self, recorder):
+        return recorder.sampler.tail_sampler
+
+    @pytest.fixture(autouse=True)
+    async def task_context(self):
+        current_task_method().context = {}
+
+    @pytest.fixture()
+    def request_object(self, insanic_application):
+        return Request(
+            b"/trace",
+            CIMultiDict({"host": "localhost"}),
+            "1.1",
+            "GET",
+            MockTransport(),
+            insanic_application,
+        )
+
+    async def test_disabled(self, insanic_application, monkeypatch):
+        monkeypatch.setattr(
+            insanic_application.config, "INCENDIARY_XRAY_TAIL_SAMPLING", False
+        )
+        sampler = IncendiaryDefaultSampler(insanic_application)
+
+        assert sampler.tail_sampler is None
+
+    async def test_fast_request_is_dropped(
+        self, recorder, tail_sampler, request_object
+    ):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        assert isinstance(segment, TailSegment)
+        assert segment.sampled is True
+        assert segment.pending is True
+        assert tail_sampler.used == SPAN_SIZE
+
+        recorder.begin_subsegment("query")
+        recorder.end_subsegment()
+
+        # nothing is streamed while the decision is pending
+        assert recorder.emitter.pop() is None
+
+        await after_request(request_object, json({}))
+
+        assert segment.sampled is False
+        assert segment.subsegments == []
+        assert recorder.emitter.pop() is None
+        assert tail_sampler.used == 0
+        assert tail_sampler.dropped == 1
+
+    @pytest.mark.parametrize("status", (500, 503))
+    async def test_error_status_is_kept(
+        self, recorder, tail_sampler, request_object, status
+    ):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        recorder.begin_subsegment("query")
+        recorder.end_subsegment()
+
+        await after_request(request_object, json({}, status=status))
+
+        assert recorder.emitter.pop() is segment
+        assert tail_sampler.used == 0
+        assert tail_sampler.kept == 1
+
+        document = _json.loads(segment.serialize())
+        assert document["http"]["response"]["status"] == status
+        assert len(document["subsegments"]) == 1
+        assert not [k for k in document if k.startswith("_")]
+
+    async def test_failed_summarized_call_is_kept(
+        self, recorder, tail_sampler, request_object, monkeypatch
+    ):
+        aggregator = CallAggregator(0)
+        monkeypatch.setattr(
+            request_object.app, "xray_call_aggregator", aggregator,
+            raising=False,
+        )
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        # only a call that was collapsed into a summary failed
+        summary = aggregator.summary(
+            segment, ("userservice", "GET", "/api/v1/users/{id}/")
+        )
+        summary.record(segment.start_time, segment.start_time, error=True)
+
+        await after_request(request_object, json({}))
+
+        assert recorder.emitter.pop() is segment
+        assert tail_sampler.kept == 1
+        (subsegment,) = segment.subsegments
+        assert subsegment.error is True
+        assert not subsegment.in_progress
+
+    async def test_exception_is_kept(self, recorder, request_object):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        response = json({}, status=400)
+        response.exception = ValueError("bad")
+        await after_request(request_object, response)
+
+        assert recorder.emitter.pop() is segment
+
+    async def test_slow_request_is_kept(
+        self, recorder, tail_sampler, request_object, monkeypatch
+    ):
+        monkeypatch.setattr(tail_sampler, "latency", 0)
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+        await after_request(request_object, json({}))
+
+        assert recorder.emitter.pop() is segment
+
+    async def test_upstream_decision_is_respected(
+        self, recorder, tail_sampler, request_object
+    ):
+        request_object.headers["x-amzn-trace-id"] = (
+            "Root=1-5759e988-bd862e3fe1be46a994272793;Sampled=0"
+        )
+
+        await before_request(request_object)
+
+        assert isinstance(recorder.current_segment(), UnsampledSegment)
+        assert tail_sampler.used == 0
+
+    async def test_spans_over_max_spans_are_dropped(
+        self, recorder, tail_sampler, request_object
+    ):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        for name in ("first", "second", "third"):
+            subsegment = recorder.begin_subsegment(name)
+            recorder.begin_subsegment(f"{name}-child")
+            recorder.end_subsegment()
+            recorder.end_subsegment()
+
+        assert subsegment.sampled is False
+        assert [s.name for s in segment.subsegments] == ["first"]
+        assert [s.name for s in segment.subsegments[0].subsegments] == [
+            "first-child"
+        ]
+        assert tail_sampler.used == SPAN_SIZE * 3
+
+        await after_request(request_object, json({}, status=500))
+
+        assert recorder.emitter.pop() is segment
+        assert segment.metadata["incendiary"]["dropped_spans"] == 2
+
+    async def test_memory_budget_exhausted(
+        self, recorder, tail_sampler, request_object, monkeypatch
+    ):
+        monkeypatch.setattr(tail_sampler, "memory_budget", SPAN_SIZE)
+
+        await before_request(request_object)
+        segment = recorder.current_segment()
+
+        # the budget is used up by the segment
+        subsegment = recorder.begin_subsegment("query")
+        assert subsegment.sampled is False
+        recorder.end_subsegment()
+
+        await after_request(request_object, json({}, status=500))
+        assert recorder.emitter.pop() is segment
+
+        # a new request after the budget is released is buffered
+        await before_request(request_object)
+        pending = recorder.current_segment()
+        assert isinstance(pending, TailSegment)
+
+        # and one that doesn't fit falls back to head sampling
+        await before_request(request_object)
+        assert isinstance(recorder.current_segment(), UnsampledSegment)
+        assert tail_sampler.refused == 1
+        assert pending.pending is True
+
+    async def test_deferred_trace_header(self, recorder, request_object):
+        await before_request(request_object)
+        segment = recorder.current_segment()
+        subsegment = recorder.begin_subsegment("downstream", "remote")
+
+        header = segment.deferred_trace_header(subsegment)
+
+        assert header == (
+            f"Root={segment.trace_id};Parent={subsegment.id};Sampled=?"
+        )
@@ -1,7 +1,9 @@
 import asyncio
+import contextvars
 import pytest
 
 from incendiary.xray.factories import (
+    native_task_factory,
     tracing_task_factory,
     wrap_tracing_task_factory,
     current_task_method,
@@ -67,3 +69,41 @@ class TestTaskFactory:
         current_task.context = {}
 
         await run1()
+
+    async def test_native_task(self, set_default_task_factory):
+        loop = asyncio.get_event_loop()
+        current_task_method(loop=loop).context = {"entities": ["a"]}
+
+        task = loop.create_task(run2(), name="traced")
+        await task
+
+        assert type(task) is asyncio.Task
+        assert task.get_name() == "traced"
+
+    async def test_context_argument(self):
+        loop = asyncio.get_event_loop()
+        variable = contextvars.ContextVar("variable", default=None)
+        context = contextvars.copy_context()
+        context.run(variable.set, "set")
+
+        async def get():
+            return variable.get()
+
+        task = tracing_task_factory(loop, get(), context=context)
+
+        assert await task == "set"
+
+    async def test_factory_without_arguments(self):
+        loop = asyncio.get_event_loop()
+        current_task_method(loop=loop).context = {"entities": ["a"]}
+
+        def factory(loop, coro):
+            return native_task_factory(loop, coro)
+
+        # loops pass None for arguments that weren't given
+        task = wrap_tracing_task_factory(factory)(
+            loop, run2(), name=None, context=None
+        )
+
+        assert await task == 2
+        assert task.context == {"entities": ["a", "b"]}
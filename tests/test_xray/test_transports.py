@@ -0,0 +1,137 @@
+import asyncio
+import subprocess
+import sys
+
+import httpcore
+import httpx
+import pytest
+from aws_xray_sdk.core.models.segment import Segment
+from aws_xray_sdk.core.models.subsegment import Subsegment
+
+from incendiary.xray.hooks import connection_phases, record_connection_phases
+from incendiary.xray.services import IncendiaryService
+from incendiary.xray.transports import TracingConnectionPool
+
+RESPONSE = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"content-length: 2\r\n"
+    b"content-type: application/json\r\n"
+    b"\r\n"
+    b"{}"
+)
+
+
+class TestTracingConnectionPool:
+    @pytest.fixture()
+    async def server(self):
+        async def respond(reader, writer):
+            while await reader.readuntil(b"\r\n\r\n"):
+                writer.write(RESPONSE)
+                await writer.drain()
+
+        async def handle(reader, writer):
+            try:
+                await respond(reader, writer)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        yield "http://127.0.0.1:{}/".format(server.sockets[0].getsockname()[1])
+        server.close()
+        await server.wait_closed()
+
+    @pytest.fixture()
+    async def client(self):
+        client = httpx.AsyncClient(transport=TracingConnectionPool())
+        yield client
+        await client.aclose()
+
+    async def get(self, client, url):
+        phases = {}
+        token = connection_phases.set(phases)
+        try:
+            response = await client.get(url)
+        finally:
+            connection_phases.reset(token)
+        return response, phases
+
+    async def test_phases(self, client, server):
+        response, phases = await self.get(client, server)
+
+        assert response.json() == {}
+        assert set(phases) == {"pool", "connect", "first_byte", "body"}
+        assert all(seconds >= 0 for seconds in phases.values())
+
+        # the connection is kept alive
+        response, phases = await self.get(client, server)
+
+        assert set(phases) == {"pool", "first_byte", "body"}
+
+    async def test_not_collecting(self, client, server):
+        response = await client.get(server)
+
+        assert response.status_code == 200
+        assert connection_phases.get() is None
+
+    async def test_connect_error_phases(self, client, unused_port):
+        phases = {}
+        token = connection_phases.set(phases)
+        try:
+            with pytest.raises(httpx.ConnectError):
+                await client.get(f"http://127.0.0.1:{unused_port}/")
+        finally:
+            connection_phases.reset(token)
+
+        assert set(phases) == {"pool", "connect"}
+
+    def test_from_pool(self):
+        limits = httpx.Limits(max_connections=7, max_keepalive_connections=3)
+        client = httpx.AsyncClient(limits=limits)
+
+        pool = TracingConnectionPool.from_pool(client._transport)
+
+        assert pool._max_connections == 7
+        assert pool._max_keepalive_connections == 3
+        assert pool._ssl_context is client._transport._ssl_context
+
+    def test_from_other_transport(self):
+        transport = httpcore.AsyncHTTPProxy((b"http", b"proxy", 8080, b"/"))
+
+        assert TracingConnectionPool.from_pool(transport) is None
+        assert TracingConnectionPool.from_pool(object()) is None
+
+    def test_record_connection_phases(self):
+        subsegment = Subsegment("service", "remote", Segment("segment"))
+
+        record_connection_phases(subsegment, {"pool": 0.5, "first_byte": 1})
+        record_connection_phases(subsegment, None)
+        record_connection_phases(None, {"pool": 1})
+
+        assert subsegment.metadata == {
+            "connection": {"pool": 0.5, "first_byte": 1}
+        }
+
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_service_client(self, monkeypatch, enabled):
+        monkeypatch.setattr(
+            IncendiaryService, "trace_connection_phases", enabled
+        )
+        # without the service token, that the constructor encodes
+        service = IncendiaryService.__new__(IncendiaryService)
+        service._client = None
+        service.url = httpx.URL("http://userservice:8000/")
+        service.service_token = "token"
+
+        assert (
+            isinstance(service.client._transport, TracingConnectionPool)
+            is enabled
+        )
+
+    def test_imported_when_enabled(self):
+        # the pool builds on httpcore's internals
+        code = (
+            "import sys, incendiary.xray.services; "
+            "assert 'incendiary.xray.transports' not in sys.modules"
+        )
+
+        subprocess.run([sys.executable, "-c", code], check=True)
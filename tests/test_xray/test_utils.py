@@ -0,0 +1,134 @@
+import pytest
+
+from incendiary.xray.utils import (
+    ROUTE_PARAMETER,
+    compile_endpoint_matcher,
+    get_safe_dict,
+    match_route,
+    route_template,
+)
+
+
+class TestEndpointMatcher:
+    @pytest.fixture()
+    def is_excluded(self):
+        return compile_endpoint_matcher(
+            ("/metrics", "/static/*", "*.png", "*/ping/")
+        )
+
+    @pytest.mark.parametrize(
+        "path, expected",
+        (
+            ("/metrics", True),
+            ("/metrics/", False),
+            ("/api/metrics", False),
+            ("/static/", True),
+            ("/static/css/app.css", True),
+            ("/api/static/", False),
+            ("/images/logo.png", True),
+            ("/images/logo.png/", False),
+            ("/tracer/ping/", True),
+            ("/tracer/ping", False),
+            ("/trace", False),
+        ),
+    )
+    def test_matcher(self, is_excluded, path, expected):
+        # without a route, the path is matched
+        assert is_excluded(None, path) is expected
+        assert is_excluded(None, path) is expected
+
+    @pytest.mark.parametrize(
+        "route, path, expected",
+        (
+            ("/metrics", "/metrics", True),
+            ("/trace", "/trace", False),
+            ("/static/<path:path>", "/static/app.css", True),
+            ("/users/<id:int>/", "/users/1/", False),
+            ("/users/<id:int>/", "/users/2/", False),
+            ("/images/<name>", "/images/logo.png", True),
+            ("/images/<name>", "/images/logo.jpg", False),
+            ("/<service>/ping/", "/tracer/ping/", True),
+            ("/users/<id>/ping", "/users/1/ping", False),
+        ),
+    )
+    def test_matcher_route(self, is_excluded, route, path, expected):
+        assert is_excluded(route, path) is expected
+        # cached decisions are the same
+        assert is_excluded(route, path) is expected
+
+    def test_matcher_decides_by_route(self, is_excluded, monkeypatch):
+        paths = []
+        monkeypatch.setattr(
+            "incendiary.xray.utils.match_route",
+            lambda *args: paths.append(args) or False,
+        )
+
+        for user_id in range(10):
+            assert (
+                is_excluded("/users/<id:int>/", f"/users/{user_id}/") is False
+            )
+
+        # the route was decided once, for every endpoint
+        assert len(paths) == 4
+
+    def test_empty_matcher(self):
+        is_excluded = compile_endpoint_matcher(())
+
+        assert is_excluded(None, "/") is False
+        assert is_excluded("/metrics", "/metrics") is False
+        assert is_excluded("/users/<id>", "/users/1") is False
+
+
+@pytest.mark.parametrize(
+    "pattern, route, expected",
+    (
+        ("/static/*", "/static/<path:path>", True),
+        ("/static/*", "/<folder>/app.css", None),
+        ("/static/*", "/images/<name>", False),
+        ("*/ping/", "/<service>/ping/", True),
+        ("*/ping/", "/users/<id>/", None),
+        ("*/ping/", "/users/<id>/posts", False),
+        ("/users/1/", "/users/<id>/", None),
+        ("/users/1/", "/orders/<id>/", False),
+        ("/images/*.png", "/images/<name>", None),
+        ("*", "/images/<name>", True),
+    ),
+)
+def test_match_route(pattern, route, expected):
+    route_parts = ROUTE_PARAMETER.split(route)
+
+    assert match_route(pattern, "*?[]", route_parts) is expected
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    (
+        ("/api/v1/users/", "/api/v1/users/"),
+        ("/api/v1/users/12/", "/api/v1/users/{id}/"),
+        ("/api/v1/users/12", "/api/v1/users/{id}"),
+        ("/api/v2/users/12/posts/3/", "/api/v2/users/{id}/posts/{id}/"),
+        (
+            "/api/v1/orders/123e4567-e89b-12d3-a456-426614174000/",
+            "/api/v1/orders/{id}/",
+        ),
+        ("/api/v1/orders/507f1f77bcf86cd799439011", "/api/v1/orders/{id}"),
+        ("/api/v1/users/me/", "/api/v1/users/me/"),
+        ("/api/v1/users/12abc/", "/api/v1/users/12abc/"),
+    ),
+)
+def test_route_template(path, expected):
+    assert route_template(path) == expected
+
+
+@pytest.mark.parametrize(
+    "max_depth, expected",
+    (
+        (None, {"a": {"b": [{"token": "*********", "c": 1}]}}),
+        (2, {"a": {"b": ["*********"]}}),
+        (0, {"a": "*********"}),
+    ),
+)
+def test_get_safe_dict(max_depth, expected):
+    target = {"a": {"b": [{"token": "secret", "c": 1}]}}
+
+    assert get_safe_dict(target, max_depth=max_depth) == expected